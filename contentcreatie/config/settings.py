@@ -1,4 +1,4 @@
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Literal, Optional, Any, Union
 from pydantic import Field, model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -25,7 +25,9 @@ class Settings(BaseSettings):
 
     clients: Dict[str, Dict[str, Any]] = Field(default_factory=dict, exclude=True)
 
-    llm_client_map: Dict[str, str] = {
+    # Client per model; a list of clients spreads the requests over deployments of the model on
+    # several endpoints, e.g. "gpt-5-mini": ["azure_eus2", "azure"] (see llm_client.routing).
+    llm_client_map: Dict[str, Union[str, List[str]]] = {
         "gpt-4.1-mini": "azure",
         "gpt-oss-120b": "azure",
         "gpt-5-mini": "azure_eus2",
@@ -34,18 +36,65 @@ class Settings(BaseSettings):
         "qwen/qwen3-4b-2507": "local",
         "mistralai/devstral-small-2507": "local"
     }
-    embedding_client_map: Dict[str, str] = {
+    embedding_client_map: Dict[str, Union[str, List[str]]] = {
         "text-embedding-3-large": "azure",
         "text-embedding-qwen3-embedding-4b": "local",
     }
+    # Native output dimension per embedding model, so vector indexes can be
+    # created without sending a probe request to the endpoint.
+    embedding_dimensions: Dict[str, int] = {
+        "text-embedding-3-large": 3072,
+        "text-embedding-3-small": 1536,
+        "text-embedding-ada-002": 1536,
+        "text-embedding-qwen3-embedding-4b": 2560,
+    }
+    # Optional override that is sent as the `dimensions` request parameter.
+    embedding_request_dimensions: Optional[int] = Field(None, validation_alias="EMBEDDING_DIMENSIONS")
 
     llm_model: str = "gpt-5-mini"
     embedding_model: str = "text-embedding-3-large"
+    # Maximum requests in flight per event loop for the async `aprocess`/`aembed`, and their timeout in seconds.
+    llm_max_concurrency: int = Field(16, validation_alias="LLM_MAX_CONCURRENCY")
+    llm_request_timeout: Optional[float] = Field(None, validation_alias="LLM_REQUEST_TIMEOUT")
+    # Quota per model deployment, e.g. {"gpt-5-mini": {"rpm": 300, "tpm": 300000}}.
+    # Quotas that are not set are learned from the x-ratelimit-* response headers.
+    llm_rate_limits: Dict[str, Dict[str, int]] = {}
+    llm_max_retries: int = Field(6, validation_alias="LLM_MAX_RETRIES")
+    # Disk cache of completions and embeddings (a SQLite file); disabled if no path is set.
+    # With LLM_CACHE_OFFLINE, requests that are not cached fail instead of going to the API.
+    llm_cache_path: Optional[str] = Field(None, validation_alias="LLM_CACHE_PATH")
+    llm_cache_ttl: Optional[float] = Field(None, validation_alias="LLM_CACHE_TTL")
+    llm_cache_max_bytes: int = Field(1 << 30, validation_alias="LLM_CACHE_MAX_BYTES")
+    llm_cache_offline: bool = Field(False, validation_alias="LLM_CACHE_OFFLINE")
+    # Prompts larger than this are trimmed by the agents (oldest turns first) or refused before they are sent.
+    llm_max_prompt_tokens: Optional[int] = Field(None, validation_alias="LLM_MAX_PROMPT_TOKENS")
+    # Tokens an interface session may spend on the agents; further requests are refused.
+    llm_session_token_budget: Optional[int] = Field(None, validation_alias="LLM_SESSION_TOKEN_BUDGET")
     raw_doc_store_name: str = "kme_content"
 
     indexed_metadata_keys: List[str] = [
         "BELASTINGSOORT", "PROCES_ONDERWERP", "PRODUCT_SUBONDERWERP", "km_number"
     ]
+    # Load only ids and light metadata at startup; content is read from disk on access.
+    docstore_lazy_loading: bool = Field(True, validation_alias="DOCSTORE_LAZY_LOADING")
+    docstore_cache_size: int = Field(32, validation_alias="DOCSTORE_CACHE_SIZE")
+    docstore_full_text_search: bool = Field(True, validation_alias="DOCSTORE_FULL_TEXT_SEARCH")
+    # Memory-map an Arrow snapshot of the document store instead of decoding the Parquet file at startup.
+    docstore_snapshot: bool = Field(True, validation_alias="DOCSTORE_SNAPSHOT")
+    # Store the answers zstd-compressed as HTML only; plain text is derived on access. Needs zstandard.
+    docstore_compression: bool = Field(True, validation_alias="DOCSTORE_COMPRESSION")
+    # "parquet" (in-memory with Parquet files and Whoosh indexes) or "sqlite" (one SQLite database with FTS5).
+    docstore_backend: Literal["parquet", "sqlite"] = Field("parquet", validation_alias="DOCSTORE_BACKEND")
+
+    def get_embedding_dimension(self, model: Optional[str] = None) -> Optional[int]:
+        """Returns the vector dimension produced for an embedding model.
+
+        :param model: Optional[str], The embedding model, defaults to the configured embedding_model
+        :return: Optional[int], The requested `dimensions` override, the registered native dimension, or None if unknown.
+        """
+        if self.embedding_request_dimensions:
+            return self.embedding_request_dimensions
+        return self.embedding_dimensions.get(model or self.embedding_model)
 
     @model_validator(mode='after')
     def build_clients_dictionary(self) -> 'Settings':
@@ -76,6 +125,26 @@ class Settings(BaseSettings):
         self.clients = {name: config for name, config in self.clients.items() if config.get("api_key") or config.get("base_url")}
         return self
 
+    def client_configs(self, model: str, client_map: Dict[str, Union[str, List[str]]]) -> List[Dict[str, Any]]:
+        """
+        The configurations of the clients of a model; clients without credentials are left out.
+        :param model: str, The model.
+        :param client_map: Dict[str, Union[str, List[str]]], llm_client_map or embedding_client_map.
+        :return: List[Dict[str, Any]], One configuration per endpoint.
+        :raises ValueError: If none of the clients of the model is configured.
+        """
+        names = client_map.get(model) or []
+        names = [names] if isinstance(names, str) else names
+        configs = []
+        for name in names:
+            if name in self.clients:
+                config = self.clients[name].copy()
+                config['type'] = 'azure' if 'azure' in name else name
+                configs.append(config)
+        if not configs:
+            raise ValueError(f"Client '{names}' for model '{model}' not found or configured in settings.")
+        return configs
+
     model_config = SettingsConfigDict(
         env_file=".env",
         env_file_encoding='utf-8',
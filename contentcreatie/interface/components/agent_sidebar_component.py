@@ -1,7 +1,9 @@
 import streamlit as st
+from typing import Iterator
 from project import Project
 from utils.rewrite_utils import enrich_consolidation
 from utils.heavy_components import load_heavy_components, AgentType, get_agent
+from contentcreatie.llm_client.agent import AgentEvent, ANSWER, TOKEN, TOOL_END, TOOL_START
 from logging import getLogger
 
 logger = getLogger("Contenttransformatie")
@@ -14,7 +16,7 @@ AGENT_CONFIG = {
         "title": "Zoek agent",
         "description": "Stel hier vervolgvragen om relevante documenten te vinden.",
         "placeholder": "Stel uw vraag...",
-        "chat_handler": lambda agent, query, project, doc_store: agent.chat(
+        "chat_handler": lambda agent, query, project, doc_store: agent.stream_chat(
             query=query,
             hoofdvraag=project.vraag,
             subvragen=project.subvragen,
@@ -26,13 +28,12 @@ AGENT_CONFIG = {
         "title": "Consolidatie Agent",
         "description": "Stel hier vragen over het consolidatieproces.",
         "placeholder": "Stel uw vraag over consolidatie...",
-        "chat_handler": lambda agent, query, project, doc_store: agent.chat(
+        "chat_handler": lambda agent, query, project, doc_store: agent.stream_chat(
             query=query,
             hoofdvraag=project.vraag,
             subvragen=project.subvragen,
             selected_documents={
-                doc_id: doc_store.documents[doc_id]
-                for doc_id in project.saved_selection_consolidate if doc_id in doc_store.documents.keys()
+                doc.id: doc for doc in doc_store.get_many(project.saved_selection_consolidate)
             },
             max_tool_turns=15
         )
@@ -42,7 +43,7 @@ AGENT_CONFIG = {
         "title": "Herschrijf Agent",
         "description": "Stel hier vragen over het herschrijfproces.",
         "placeholder": "Stel uw vraag over herschrijven...",
-        "chat_handler": lambda agent, query, project, doc_store: agent.chat(
+        "chat_handler": lambda agent, query, project, doc_store: agent.stream_chat(
             query=query,
             hoofdvraag=project.vraag,
             subvragen=project.subvragen,
@@ -53,6 +54,32 @@ AGENT_CONFIG = {
     }
 }
 
+def render_agent_events(events: Iterator[AgentEvent]):
+    """
+    Toont de uitvoer van de agent terwijl die binnenkomt: de tekst van de huidige beurt
+    token voor token en de aangeroepen tools in een statusblok.
+    """
+    status = st.status("Agent is aan het werk...", expanded=False)
+    with st.chat_message("assistant"):
+        placeholder = st.empty()
+    text = ""
+    for event in events:
+        if event.type == TOKEN:
+            text += event.text
+            placeholder.markdown(text + "▌")
+        elif event.type == TOOL_START:
+            name = event.tool_call["function"]["name"]
+            status.update(label=f"Tool {name} wordt uitgevoerd...")
+            status.write(f"🔧 {name}")
+            # Tekst van een beurt met tool calls is een tussenstap; de volgende beurt begint opnieuw.
+            text = ""
+            placeholder.empty()
+        elif event.type == TOOL_END:
+            status.update(label="Agent is aan het werk...")
+        elif event.type == ANSWER:
+            placeholder.markdown(event.text)
+    status.update(label="Agent is klaar", state="complete")
+
 def display_agent_sidebar(project: Project, agent_type: AgentType):
     """
     Displays a generic, data-driven agent sidebar component.
@@ -84,10 +111,9 @@ def display_agent_sidebar(project: Project, agent_type: AgentType):
 
  
         if agent and messages and messages[-1]["role"] == "user":
-            with st.status("Agent is aan het werk...", expanded=True):
-                query = messages[-1]["content"]
-                config["chat_handler"](agent, query, project, doc_store)
-                setattr(project, config["messages_attr"], agent.messages)
+            query = messages[-1]["content"]
+            render_agent_events(config["chat_handler"](agent, query, project, doc_store))
+            setattr(project, config["messages_attr"], agent.messages)
             st.rerun()
 
         if st.session_state.chat_visible:
@@ -27,23 +27,12 @@ def display_zelf_zoeken():
     if "zelfzoeken_last_click" not in st.session_state:
         st.session_state.zelfzoeken_last_click = None  # anti double-trigger
 
-    def _mk_term(field: str, value: str, contains: bool = True) -> str:
-        if not value:
-            return ""
-        v = value.strip().replace("\\", "\\\\").replace(":", "\\:").replace('"', '\\"')
-        return f'{field}:*{v}*' if contains else f'{field}:{v}*'
-
-    def build_taxonomy_query(belastingsoort: str, proces_onderwerp: str | None, product_subonderwerp: str | None, contains=True) -> str:
-        parts = []
-        if belastingsoort:
-            parts.append(_mk_term("BELASTINGSOORT", belastingsoort, contains=contains))
-        if proces_onderwerp:
-            parts.append(_mk_term("PROCES_ONDERWERP", proces_onderwerp, contains=contains))
-        if product_subonderwerp:
-            parts.append(_mk_term("PRODUCT_SUBONDERWERP", product_subonderwerp, contains=contains))
-        if not parts:
-            return 'BELASTINGSOORT:*"*"'
-        return " AND ".join([p for p in parts if p])
+    def taxonomy_criteria(belastingsoort: str, proces_onderwerp: str | None, product_subonderwerp: str | None) -> Dict[str, Optional[str]]:
+        return {
+            "BELASTINGSOORT": belastingsoort,
+            "PROCES_ONDERWERP": proces_onderwerp,
+            "PRODUCT_SUBONDERWERP": product_subonderwerp,
+        }
 
     def vector_search(vector_store, query: str, top_k: int = 10, metadata_filter: Optional[Dict[str, Any]] = None):
         """Performs a vector search using the VectorStore's query method."""
@@ -96,18 +85,30 @@ def display_zelf_zoeken():
             })
         return rows
 
+    def belastingsoort_domain(belastingsoort: str) -> Optional[Dict[str, Any]]:
+        """Like Project.get_domain_filter: a (first) segment matches every BELASTINGSOORT value below it."""
+        if not belastingsoort.strip():
+            return None
+        return {"BELASTINGSOORT": {"$path": belastingsoort.strip()}}
+
+    def keyword_search(doc_store, query: str, limit: int = 20, metadata_filter: Optional[Dict[str, Any]] = None):
+        """Performs a BM25 keyword search using the DocumentStore's full-text index."""
+        if not query:
+            return []
+        return doc_store.search_text(query, limit=limit, metadata_filter=metadata_filter)
+
     def taxonomy_search(doc_store, belastingsoort: str, proces_onderwerp: str | None, product_subonderwerp: str | None, limit: int = 20, contains=True):
-        q = build_taxonomy_query(belastingsoort, proces_onderwerp, product_subonderwerp, contains=contains)
-        results = doc_store.search(query_string=q, limit=limit)
-        # Handle case where results might be None or empty
-        if results is None:
-            results = []
-        elif hasattr(results, 'empty') and results.empty:
-            results = []
-        return results, q
+        criteria = taxonomy_criteria(belastingsoort, proces_onderwerp, product_subonderwerp)
+        resolved = doc_store.resolve_taxonomy(criteria, contains=contains)
+        results = doc_store.search_taxonomy(criteria, contains=contains, limit=limit)
+        return results, resolved
 
     with st.container():
-        mode = st.radio("Zoektype", ["Vector search", "Taxonomie search"], horizontal=True, index=0 if st.session_state.zelfzoeken_mode=="Vector search" else 1)
+        modes = ["Vector search", "Taxonomie search"]
+        if doc_store.text_index:
+            modes.insert(1, "Trefwoord search")
+        mode_index = modes.index(st.session_state.zelfzoeken_mode) if st.session_state.zelfzoeken_mode in modes else 0
+        mode = st.radio("Zoektype", modes, horizontal=True, index=mode_index)
 
         if mode == "Vector search":
             with st.form("vector_form", clear_on_submit=False):
@@ -119,7 +120,7 @@ def display_zelf_zoeken():
             if submitted:
                 with st.spinner("Zoeken in vector index..."):
                     # Set metadata filter if belastingsoort is provided
-                    metadata_filter = {"BELASTINGSOORT": belastingsoort_filter} if belastingsoort_filter.strip() else None
+                    metadata_filter = belastingsoort_domain(belastingsoort_filter)
                     results = vector_search(vector_store, q, top_k=k, metadata_filter=metadata_filter)
                 rows = docs_to_rows(results)
                 st.session_state.zelfzoeken_rows = rows
@@ -128,7 +129,34 @@ def display_zelf_zoeken():
             else:
                 rows = st.session_state.zelfzoeken_rows if st.session_state.zelfzoeken_mode == mode else []
 
+        elif mode == "Trefwoord search":
+            with st.form("keyword_form", clear_on_submit=False):
+                q = st.text_input("Trefwoorden", placeholder="bijv. ‘M-formulier emigratie’ of \"verzoek om teruggaaf\"")
+                k = st.slider("Aantal resultaten", min_value=5, max_value=50, value=15, step=5)
+                belastingsoort_filter = st.text_input("Filter op BELASTINGSOORT", placeholder="bijv. IB - Inkomstenbelasting", key="keyword_belastingsoort")
+                submitted = st.form_submit_button("Zoek")
+
+            if submitted:
+                with st.spinner("Zoeken in tekst index..."):
+                    metadata_filter = belastingsoort_domain(belastingsoort_filter)
+                    results = keyword_search(doc_store, q, limit=k, metadata_filter=metadata_filter)
+                rows = docs_to_rows(results)
+                for row, res in zip(rows, results):
+                    row["Fragment"] = res["snippet"]
+                st.session_state.zelfzoeken_rows = rows
+                st.session_state.zelfzoeken_mode = mode
+                st.caption(f"Gevonden: {len(rows)}")
+            else:
+                rows = st.session_state.zelfzoeken_rows if st.session_state.zelfzoeken_mode == mode else []
+
         else:
+            with st.expander("Aantal documenten per BELASTINGSOORT"):
+                facets = doc_store.facet_counts("BELASTINGSOORT")
+                st.dataframe(
+                    pd.DataFrame(sorted(facets.items()), columns=["BELASTINGSOORT", "Documenten"]),
+                    hide_index=True,
+                    width="stretch",
+                )
             with st.form("taxonomy_form", clear_on_submit=False):
                 colA, colB, colC = st.columns([1,1,1])
                 with colA:
@@ -141,7 +169,7 @@ def display_zelf_zoeken():
                 with c1:
                     limit = st.number_input("Max resultaten", min_value=5, max_value=200, value=50, step=5)
                 with c2:
-                    contains_match = st.toggle("Bevat-match ( *term* ) i.p.v. prefix ( term* )", value=True)
+                    contains_match = st.toggle("Bevat-match (waarde bevat de tekst) i.p.v. prefix (waarde begint met de tekst)", value=True)
                 submitted = st.form_submit_button("Zoek")
 
             if submitted:
@@ -150,7 +178,7 @@ def display_zelf_zoeken():
                     rows = []
                 else:
                     with st.spinner("Zoeken in metadata index..."):
-                        results, q_str = taxonomy_search(
+                        results, resolved = taxonomy_search(
                             doc_store,
                             belastingsoort=belastingsoort,
                             proces_onderwerp=proces_onderwerp or None,
@@ -161,7 +189,11 @@ def display_zelf_zoeken():
                     rows = docs_to_rows(results)
                     st.session_state.zelfzoeken_rows = rows
                     st.session_state.zelfzoeken_mode = mode
-                    st.caption(f"Query: `{q_str}`")
+                    matched = []
+                    for level, values in resolved.items():
+                        counts = doc_store.facet_counts(level)
+                        matched.append(f"{level}: {', '.join(f'{value} ({counts.get(value, 0)})' for value in values) or '—'}")
+                    st.caption("Gematchte waarden: " + "; ".join(matched))
             else:
                 rows = st.session_state.zelfzoeken_rows if st.session_state.zelfzoeken_mode == mode else []
 
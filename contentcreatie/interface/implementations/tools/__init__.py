@@ -1,5 +1,6 @@
 from .vector_search_tool import VectorSearchTool
 from .document_search_tool import DocumentSearchTool
+from .text_search_tool import TextSearchTool
 from .list_selected_documents_tool import ListSelectedDocumentsTool
 from .read_documents_tool import ReadDocumentsTool
 from .taxonomy_search_tool import TaxnomySearchTool
@@ -44,15 +44,19 @@ class ReadDocumentsTool(ToolBase):
         """
         Reads documents from the document store using the provided KM numbers.
         """
+        found = {
+            row['id']: row
+            for row in self.doc_store.get_many(document_ids, fields=['title', 'content', 'metadata'])
+        }
         documents = []
         for doc_id in document_ids:
-            doc = self.doc_store.documents.get(doc_id)
-            if doc:
+            row = found.get(doc_id)
+            if row:
                 documents.append({
-                    "document_id": doc.id,
-                    "title": doc.title,
-                    "content": doc.content,
-                    "metadata": doc.metadata
+                    "document_id": row['id'],
+                    "title": row['title'],
+                    "content": row['content'],
+                    "metadata": row['metadata']
                 })
             else:
                 documents.append({
@@ -60,4 +64,4 @@ class ReadDocumentsTool(ToolBase):
                     "error": "Document not found"
                 })
 
-        return json.dumps({"documents": documents}, indent=2)
\ No newline at end of file
+        return json.dumps({"documents": documents}, indent=2)
@@ -6,7 +6,8 @@ from contentcreatie.llm_client.vector_store import DocumentStore
 class TaxnomySearchTool(ToolBase):
     """
     Zoektool die standaard filtert op BELASTINGSOORT en optioneel op
-    PROCES_ONDERWERP en PRODUCT_SUBONDERWERP. Bouwt Whoosh-syntax automatisch.
+    PROCES_ONDERWERP en PRODUCT_SUBONDERWERP. De zoektekst per niveau wordt via de
+    taxonomie-index van het DocumentStore omgezet naar exacte waarden.
     """
 
     REQUIRED_FIELD = "BELASTINGSOORT"
@@ -23,7 +24,7 @@ class TaxnomySearchTool(ToolBase):
         """
         :param doc_store: DocumentStore met metadata-index
         :param default_limit: standaard aantal resultaten
-        :param use_contains_match: True => *term* (bevat); False => term* (prefix)
+        :param use_contains_match: True => waarde bevat de tekst; False => waarde begint met de tekst
         """
         super().__init__(on_call=on_call, on_result=on_result)
         self.doc_store = doc_store
@@ -36,7 +37,7 @@ class TaxnomySearchTool(ToolBase):
         fields_txt = ", ".join(sorted(self.indexed_metadata_keys)) if self.indexed_metadata_keys else "—"
         description = (
             "Zoekt in document-metadata met verplichte BELASTINGSOORT en optionele "
-            "PROCES_ONDERWERP en PRODUCT_SUBONDERWERP. Bouwt Whoosh-query automatisch. "
+            "PROCES_ONDERWERP en PRODUCT_SUBONDERWERP. Tekst wordt gematcht op de taxonomiewaarden die de tekst bevatten. "
             f"Beschikbare velden in index: {fields_txt}."
         )
         return {
@@ -70,48 +71,17 @@ class TaxnomySearchTool(ToolBase):
         }
 
 
-    @staticmethod
-    def _escape(value: str) -> str:
-        """Escape Whoosh speciale tekens eenvoudig (basis set)."""
-        # minimalistische escape zodat wildcards blijven werken
-        for ch in ['\\', ':', '"']:
-            value = value.replace(ch, f"\\{ch}")
-        return value
-
-    def _mk_term(self, field: str, value: Optional[str]) -> Optional[str]:
-        """Maak een whoosh term met wildcardstrategie."""
-        if not value:
-            return None
-        v = self._escape(value.strip())
-        if not v:
-            return None
-        if self.use_contains_match:
-            # bevat-match
-            return f'{field}:*{v}*'
-        else:
-            # prefix-match
-            return f'{field}:{v}*'
-
-    def _build_query(
+    def _criteria(
         self,
         belastingsoort: str,
         proces_onderwerp: Optional[str],
         product_subonderwerp: Optional[str]
-    ) -> str:
-        missing = [f for f in [self.REQUIRED_FIELD, *self.OPTIONAL_FIELDS] if f not in self.indexed_metadata_keys]
-        # We draaien toch door, maar geven een nette waarschuwing terug in resultaat.
-        parts = []
-        req = self._mk_term(self.REQUIRED_FIELD, belastingsoort)
-        if req: parts.append(req)
-        opt1 = self._mk_term("PROCES_ONDERWERP", proces_onderwerp)
-        if opt1: parts.append(opt1)
-        opt2 = self._mk_term("PRODUCT_SUBONDERWERP", product_subonderwerp)
-        if opt2: parts.append(opt2)
-        # Als iemand lege strings doorgeeft, zorg dat er iig de verplichte term is:
-        if not parts:
-            parts = [f'{self.REQUIRED_FIELD}:*"*"']  # vangnet, praktisch alles
-        return " AND ".join(parts)
-
+    ) -> Dict[str, Optional[str]]:
+        return {
+            self.REQUIRED_FIELD: belastingsoort,
+            "PROCES_ONDERWERP": proces_onderwerp,
+            "PRODUCT_SUBONDERWERP": product_subonderwerp,
+        }
 
     def _execute(
         self,
@@ -124,13 +94,20 @@ class TaxnomySearchTool(ToolBase):
         if not self.indexed_metadata_keys:
             return "Kan geen metadata-zoekactie uitvoeren: er zijn geen metadata-velden geïndexeerd in dit DocumentStore."
 
-        q = self._build_query(belastingsoort, proces_onderwerp, product_subonderwerp)
+        criteria = self._criteria(belastingsoort, proces_onderwerp, product_subonderwerp)
         max_results = limit or self.default_limit
 
-        results = self.doc_store.search(query_string=q, limit=max_results)
+        # De opgeloste waarden laten het model zien welke taxonomie-items geraakt zijn.
+        resolved = self.doc_store.resolve_taxonomy(criteria, contains=self.use_contains_match)
+        # Met het aantal documenten per waarde ziet het model hoe breed elk taxonomie-item is.
+        matched_values = {}
+        for level, values in resolved.items():
+            counts = self.doc_store.facet_counts(level)
+            matched_values[level] = {value: counts.get(value, 0) for value in values}
+        results = self.doc_store.search_taxonomy(criteria, contains=self.use_contains_match, limit=max_results)
         if not results:
             return json.dumps({
-                "query": q,
+                "matched_values": matched_values,
                 "count": 0,
                 "items": []
             }, indent=2, ensure_ascii=False)
@@ -143,7 +120,7 @@ class TaxnomySearchTool(ToolBase):
         } for doc in results]
 
         payload = {
-            "query": q,
+            "matched_values": matched_values,
             "count": len(items),
             "items": items
         }
@@ -0,0 +1,72 @@
+import json
+from typing import Dict, Any, List, Union, Optional, Callable
+from contentcreatie.llm_client.tools.tool_base import ToolBase
+from contentcreatie.llm_client.document_store import DocumentStore
+
+class TextSearchTool(ToolBase):
+    """
+    A tool for keyword searches over the full-text index of a DocumentStore.
+    Complements the vector search for exact terms such as form names, article numbers and jargon.
+    """
+    def __init__(
+        self,
+        doc_store: DocumentStore,
+        on_call: Optional[Callable[[Dict[str, Any]], None]] = None,
+        on_result: Optional[Callable[[Dict[str, Any]], Union[str, None]]] = None,
+        metadata_filter: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        Initializes the tool with a DocumentStore that has full-text search enabled and optional callbacks.
+        """
+        super().__init__(on_call=on_call, on_result=on_result)
+        self.doc_store = doc_store
+        self.metadata_filter = metadata_filter
+
+    @property
+    def schema(self) -> Dict[str, Any]:
+        return {
+            "type": "function",
+            "function": {
+                "name": "keyword_search",
+                "description": "Finds documents containing specific words or terms (BM25 ranking over title, question, summary and content). Use it for exact terms like form names, article numbers or jargon that a semantic search may miss.",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "queries": {
+                            "oneOf": [
+                                {"type": "string", "description": "A single keyword query."},
+                                {"type": "array", "description": "A list of keyword queries.", "items": {"type": "string"}}
+                            ],
+                            "description": "The keywords to search for. Use quotes for exact phrases."
+                        },
+                        "n_results": {"type": "integer", "description": "The number of top matching documents to return per query.", "default": 5}
+                    },
+                    "required": ["queries"]
+                }
+            }
+        }
+
+    def _execute(self, queries: Union[str, List[str]], n_results: int = 5) -> str:
+        """Searches the full-text index and returns deduplicated results as a JSON string."""
+        query_list = queries if isinstance(queries, list) else [queries]
+        best_results = {}
+        for query_index, query_text in enumerate(query_list):
+            results = self.doc_store.search_text(query_text, limit=n_results, metadata_filter=self.metadata_filter)
+            for res in results:
+                doc = res['document']
+                doc_id = doc.metadata.get('km_number', doc.id)
+                if doc_id not in best_results or res['score'] > best_results[doc_id]['score']:
+                    best_results[doc_id] = {
+                        "id": doc_id,
+                        "title": doc.title,
+                        "snippet": res['snippet'],
+                        "metadata": {k: v for k, v in doc.metadata.items() if k in ['BELASTINGSOORT', 'PROCES_ONDERWERP', 'PRODUCT_SUBONDERWERP', 'VRAAG']},
+                        "score": round(res['score'], 3),
+                        "query_number": query_index
+                    }
+
+        if not best_results:
+            return "No documents found for any of the provided queries."
+
+        simplified_results = sorted(best_results.values(), key=lambda x: x['score'], reverse=True)
+        return json.dumps(simplified_results, indent=2)
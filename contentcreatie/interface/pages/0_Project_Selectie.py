@@ -1,4 +1,6 @@
 import uuid
+from collections import Counter
+from typing import Dict
 import pandas as pd
 import streamlit as st
 from contentcreatie.interface.styles.custom_css import apply_custom_css
@@ -8,12 +10,34 @@ from logging import getLogger
 from contentcreatie.config.paths import paths
 from contentcreatie.log_config import LogBootstrap
 from contentcreatie.storage.storage_service import storage_service
+from utils.heavy_components import load_document_store
 
 # --- CONFIGURATION & SETUP ---
 LogBootstrap.load_config()
-KME_TABLE = pd.read_csv(paths.kme_vertaaltabel, sep=';')
 logger = getLogger("Contenttransformatie")
 apply_custom_css()
+doc_store = load_document_store()
+
+@st.cache_data
+def kme_options(level: str) -> Dict[str, int]:
+    """The first segment of every value of a level in the KME vertaaltabel, without document counts."""
+    kme_table = pd.read_csv(paths.kme_vertaaltabel, sep=';')
+    return dict.fromkeys(kme_table[level].str.split('/', n=1).str[0].sort_values().unique().tolist(), 0)
+
+def taxonomy_options(level: str) -> Dict[str, int]:
+    """The first segment of every taxonomy value of a level, with its number of documents.
+    The facet counts are maintained by the document store, so this only touches the distinct values.
+    Falls back to the KME vertaaltabel while the store holds no documents for the level."""
+    counts = Counter()
+    for value, count in doc_store.facet_counts(level).items():
+        counts[value.split('/', 1)[0]] += count
+    if not counts:
+        return kme_options(level)
+    return dict(sorted(counts.items()))
+
+def option_label(counts: Dict[str, int]):
+    """A selectbox format_func showing the number of documents of an option, if known."""
+    return lambda v: f"{v} ({counts[v]})" if counts.get(v) else v
 
 def project_to_row(project_id, data):
     """Normalizes dict or object data into a standard row format."""
@@ -79,13 +103,17 @@ with st.expander("Start een nieuw project", icon=":material/add_circle:", expand
             )
 
         with col_meta:
-            belastingsoort_options = ["ALLE BELASTINGSOORTEN"] + KME_TABLE['BELASTINGSOORT'].str.split('/', n=1).str[0].sort_values().unique().tolist()
-            proces_options_list = KME_TABLE['PROCES_ONDERWERP'].str.split('/', n=1).str[0].sort_values().unique()
-            product_options_list = KME_TABLE['PRODUCT_SUBONDERWERP'].str.split('/', n=1).str[0].sort_values().unique()
-
-            belastingsoort = st.selectbox("Belastingsoort", options=belastingsoort_options, index=None)
-            proces = st.selectbox("Proces", options=proces_options_list, index=None)
-            product = st.selectbox("Product", options=product_options_list, index=None)
+            belastingsoort_counts = taxonomy_options('BELASTINGSOORT')
+            proces_counts = taxonomy_options('PROCES_ONDERWERP')
+            product_counts = taxonomy_options('PRODUCT_SUBONDERWERP')
+            belastingsoort_options = ["ALLE BELASTINGSOORTEN"] + list(belastingsoort_counts)
+
+            belastingsoort = st.selectbox("Belastingsoort", options=belastingsoort_options, index=None,
+                                          format_func=option_label(belastingsoort_counts))
+            proces = st.selectbox("Proces", options=list(proces_counts), index=None,
+                                  format_func=option_label(proces_counts))
+            product = st.selectbox("Product", options=list(product_counts), index=None,
+                                   format_func=option_label(product_counts))
 
         st.markdown("<br>", unsafe_allow_html=True)
         col_submit, _ = st.columns([1, 4])
@@ -16,18 +16,16 @@ def display_agent_search_results(project: Project, document_dict : Dict[str,int]
 
 
     docs_data = []
-    for doc_id, relevance in document_dict.items():
-        doc = doc_store.documents.get(doc_id)
-        if doc:
-            meta = doc.metadata
-            docs_data.append({
-                'km_nummer': doc_id,
-                'Belastingsoort': meta.get('BELASTINGSOORT', 'N/A'),
-                'Vraag': meta.get('VRAAG', 'N/A'),
-                'Proces': meta.get('PROCES_ONDERWERP', 'N/A'),
-                'Product': meta.get('PRODUCT_SUBONDERWERP', 'N/A'),
-                'Relevantie': relevance
-            })
+    rows = doc_store.get_many(document_dict.keys(), fields=['BELASTINGSOORT', 'VRAAG', 'PROCES_ONDERWERP', 'PRODUCT_SUBONDERWERP'])
+    for row in rows:
+        docs_data.append({
+            'km_nummer': row['id'],
+            'Belastingsoort': row['BELASTINGSOORT'] or 'N/A',
+            'Vraag': row['VRAAG'] or 'N/A',
+            'Proces': row['PROCES_ONDERWERP'] or 'N/A',
+            'Product': row['PRODUCT_SUBONDERWERP'] or 'N/A',
+            'Relevantie': document_dict[row['id']]
+        })
 
     if not docs_data:
         st.info("Er zijn geen documenten om")
@@ -39,18 +39,16 @@ else:
             st.info("Er zijn nog geen documenten geselecteerd voor consolidatie. Ga naar de vorige stappen om documenten te selecteren.")
         else:
             docs_data = []
-            for doc_id, relevance in selected_documents_with_relevance.items():
-                doc = doc_store.documents.get(doc_id)
-                if doc:
-                    meta = doc.metadata
-                    docs_data.append({
-                        'km_nummer': doc_id,
-                        'Belastingsoort': meta.get('BELASTINGSOORT', 'N/A'),
-                        'Vraag': meta.get('VRAAG', 'N/A'),
-                        'Proces': meta.get('PROCES_ONDERWERP', 'N/A'),
-                        'Product': meta.get('PRODUCT_SUBONDERWERP', 'N/A'),
-                        'Relevante': relevance
-                    })
+            rows = doc_store.get_many(selected_documents_with_relevance.keys(), fields=['BELASTINGSOORT', 'VRAAG', 'PROCES_ONDERWERP', 'PRODUCT_SUBONDERWERP'])
+            for row in rows:
+                docs_data.append({
+                    'km_nummer': row['id'],
+                    'Belastingsoort': row['BELASTINGSOORT'] or 'N/A',
+                    'Vraag': row['VRAAG'] or 'N/A',
+                    'Proces': row['PROCES_ONDERWERP'] or 'N/A',
+                    'Product': row['PRODUCT_SUBONDERWERP'] or 'N/A',
+                    'Relevante': selected_documents_with_relevance[row['id']]
+                })
             
             if docs_data:
 
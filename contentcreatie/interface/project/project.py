@@ -389,6 +389,8 @@ class Project:
             if self._belastingsoort == "ALLE BELASTINGSOORTEN":
                 return {}
             
-            return {"BELASTINGSOORT": self._belastingsoort}
+            # The project dropdown offers the first segment of the taxonomy path,
+            # so match that segment and every BELASTINGSOORT value below it.
+            return {"BELASTINGSOORT": {"$path": self._belastingsoort}}
         else:
             return None
\ No newline at end of file
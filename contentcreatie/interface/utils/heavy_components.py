@@ -9,18 +9,50 @@ from utils.callbacks import (list_documents_callback,
                                search_results_callback)
 from contentcreatie.llm_client.agent import MultiTurnAgent
 from contentcreatie.llm_client.document_store import DocumentStore
+from contentcreatie.llm_client.sqlite_document_store import SQLiteDocumentStore
 from contentcreatie.llm_client.vector_store import VectorStore
 from contentcreatie.llm_client.llm_client import EmbeddingProcessor, LLMProcessor
 from contentcreatie.llm_client.prompt_builder import PromptBuilder
+from contentcreatie.llm_client.response_cache import ResponseCache
+from contentcreatie.llm_client.tokens import TokenBudget, UsageTracker
 from implementations.tools.document_relevance_tool import DocumentRelevanceTool,ToolBase
 from implementations.tools.list_selected_documents_tool import ListSelectedDocumentsTool
 from implementations.tools.read_documents_tool import ReadDocumentsTool
 from implementations.tools.vector_search_tool import VectorSearchTool
+from implementations.tools.text_search_tool import TextSearchTool
 from implementations.tools.save_consolidated_json_tool import SaveConsolidatedJsonTool
 from implementations.tools.save_rewritten_json_tool import SaveRewrittenJsonTool
 
 AgentType = Literal["search", "consolidate", "rewrite"]
 
+@st.cache_resource
+def load_document_store() -> DocumentStore:
+    """
+    Loads and caches the document store on its own, for pages that only read documents
+    or facets and need no LLM or embedding clients. `load_heavy_components` shares it.
+
+    :return: DocumentStore, The document store of the configured backend.
+    """
+    if settings.docstore_backend == "sqlite":
+        doc_store = SQLiteDocumentStore(
+            settings.raw_doc_store_name,
+            paths.docstore_folder,
+            settings.indexed_metadata_keys,
+            full_text_search=settings.docstore_full_text_search
+        )
+    else:
+        doc_store = DocumentStore(
+            settings.raw_doc_store_name,
+            paths.docstore_folder,
+            settings.indexed_metadata_keys,
+            lazy=settings.docstore_lazy_loading,
+            cache_size=settings.docstore_cache_size,
+            full_text_search=settings.docstore_full_text_search,
+            snapshot=settings.docstore_snapshot,
+            compress=settings.docstore_compression
+        )
+    return doc_store
+
 @st.cache_resource
 def load_heavy_components() -> Tuple[LLMProcessor, DocumentStore, VectorStore]:
     """
@@ -30,34 +62,47 @@ def load_heavy_components() -> Tuple[LLMProcessor, DocumentStore, VectorStore]:
     :return: Tuple[LLMProcessor, DocumentStore, VectorStore], The initialized components.
     :raises ValueError: If client configurations are missing or invalid in settings.
     """
-    llm_client_name = settings.llm_client_map.get(settings.llm_model)
-    if not llm_client_name or llm_client_name not in settings.clients:
-        raise ValueError(f"Client '{llm_client_name}' for model '{settings.llm_model}' not found or configured in settings.")
-
-    llm_config_dict = settings.clients[llm_client_name].copy()
-    llm_config_dict['type'] = 'azure' if 'azure' in llm_client_name else llm_client_name
+    llm_configs = settings.client_configs(settings.llm_model, settings.llm_client_map)
+
+    usage_tracker = UsageTracker()
+    response_cache = None
+    if settings.llm_cache_path:
+        response_cache = ResponseCache(
+            settings.llm_cache_path,
+            ttl=settings.llm_cache_ttl,
+            max_bytes=settings.llm_cache_max_bytes,
+            offline=settings.llm_cache_offline,
+        )
 
     llm = LLMProcessor(
         model=settings.llm_model,
-        client_config=llm_config_dict
+        client_config=llm_configs,
+        max_concurrency=settings.llm_max_concurrency,
+        request_timeout=settings.llm_request_timeout,
+        requests_per_minute=settings.llm_rate_limits.get(settings.llm_model, {}).get("rpm"),
+        tokens_per_minute=settings.llm_rate_limits.get(settings.llm_model, {}).get("tpm"),
+        max_retries=settings.llm_max_retries,
+        cache=response_cache,
+        max_prompt_tokens=settings.llm_max_prompt_tokens,
+        usage_tracker=usage_tracker,
     )
 
-    embedding_client_name = settings.embedding_client_map.get(settings.embedding_model)
-    if not embedding_client_name or embedding_client_name not in settings.clients:
-        raise ValueError(f"Client '{embedding_client_name}' for model '{settings.embedding_model}' not found or configured in settings.")
-        
-    embedding_config_dict = settings.clients[embedding_client_name].copy()
-    embedding_config_dict['type'] = 'azure' if 'azure' in embedding_client_name else embedding_client_name
+    embedding_configs = settings.client_configs(settings.embedding_model, settings.embedding_client_map)
 
     embedder = EmbeddingProcessor(
         embedding_model=settings.embedding_model,
-        client_config=embedding_config_dict
-    )
-    doc_store = DocumentStore(
-        settings.raw_doc_store_name,
-        paths.docstore_folder,
-        settings.indexed_metadata_keys
+        client_config=embedding_configs,
+        dimensions=settings.embedding_request_dimensions,
+        native_dimension=settings.get_embedding_dimension(settings.embedding_model),
+        max_concurrency=settings.llm_max_concurrency,
+        request_timeout=settings.llm_request_timeout,
+        requests_per_minute=settings.llm_rate_limits.get(settings.embedding_model, {}).get("rpm"),
+        tokens_per_minute=settings.llm_rate_limits.get(settings.embedding_model, {}).get("tpm"),
+        max_retries=settings.llm_max_retries,
+        cache=response_cache,
+        usage_tracker=usage_tracker,
     )
+    doc_store = load_document_store()
     vector_store = VectorStore(embedder=embedder,
                                doc_store=doc_store,
                                data_root=paths.docstore_folder)
@@ -83,7 +128,14 @@ def _initialize_search_tools(project: Project, vector_store: VectorStore, doc_st
     read_tool = ReadDocumentsTool(
         doc_store=doc_store
     )
-    return [vector_search_tool, document_relevance_tool, list_tool, read_tool]
+    tools = [vector_search_tool, document_relevance_tool, list_tool, read_tool]
+    if doc_store.text_index:
+        tools.insert(1, TextSearchTool(
+            doc_store=doc_store,
+            on_result=lambda tool_result: search_results_callback(tool_result, project),
+            metadata_filter=project.get_domain_filter()
+        ))
+    return tools
 
 def _initialize_consolidate_tools(project: Project, vector_store: VectorStore, doc_store: DocumentStore) -> List[ToolBase]:
     on_call_with_project = lambda tool_call: streamlit_tool_callback(tool_call, project)
@@ -171,6 +223,12 @@ def get_agent(project: Project, agent_type: AgentType) -> MultiTurnAgent:
         raise ValueError(f"No initializer found for agent type: {agent_type}")
     
     new_agent = initializer_func(project, llm, vector_store, doc_store)
+    new_agent.usage_tags = {"agent": agent_type, "project": str(project.id)}
+    if settings.llm_session_token_budget:
+        # One budget for all agents of the session.
+        if "token_budget" not in st.session_state:
+            st.session_state.token_budget = TokenBudget(settings.llm_session_token_budget)
+        new_agent.token_budget = st.session_state.token_budget
     
     st.session_state.agents[agent_key] = new_agent
     return new_agent
\ No newline at end of file
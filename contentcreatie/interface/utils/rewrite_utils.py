@@ -6,25 +6,27 @@ def enrich_fragments_with_metadata(fragments, doc_store):
     doc_store, and adds metadata fields to each fragment.
 
     :param fragments: list, A list of fragment dictionaries.
-    :param doc_store: dict, The document store containing document objects.
+    :param doc_store: DocumentStore, The document store containing document objects.
     """
     if not fragments:
         return
 
+    metadata_keys = ["VRAAG", "BELASTINGSOORT", "PROCES_ONDERWERP", "PRODUCT_SUBONDERWERP"]
+    km_numbers = {fragment.get("bron_km") for fragment in fragments if fragment.get("bron_km")}
+    # Fetch the metadata of all referenced documents in one batch
+    rows = {row["id"]: row for row in doc_store.get_many(km_numbers, fields=metadata_keys)}
+
     for fragment in fragments:
         km_number = fragment.get("bron_km")
         if not km_number:
             continue
 
-        # Get the document from the document store using the km number
-        doc = doc_store.documents.get(km_number)
+        row = rows.get(km_number)
 
-        if doc:
+        if row:
             # Add metadata fields to the fragment dictionary
-            fragment["VRAAG"] = doc.metadata.get("VRAAG", "")
-            fragment["BELASTINGSOORT"] = doc.metadata.get("BELASTINGSOORT", "")
-            fragment["PROCES_ONDERWERP"] = doc.metadata.get("PROCES_ONDERWERP", "")
-            fragment["PRODUCT_SUBONDERWERP"] = doc.metadata.get("PRODUCT_SUBONDERWERP", "")
+            for key in metadata_keys:
+                fragment[key] = row[key] if row[key] is not None else ""
         else:
             # Handle cases where the km_number is not in the doc_store
             print(f"Warning: KM number '{km_number}' not found in doc_store.")
@@ -1,13 +1,34 @@
 import json
-from typing import Optional, Dict, Any, List
+from dataclasses import dataclass
+from typing import Iterator, Optional, Dict, Any, List
 
 from .llm_client import LLMProcessor
+from .tokens import TokenBudget, TokenBudgetExceeded
 from .tools.tool_base import ToolBase
 from .prompt_builder import PromptBuilder
 import traceback
 from logging import getLogger
 logger = getLogger("Contenttransformatie")
 
+TOKEN = "token"
+TOOL_START = "tool_start"
+TOOL_END = "tool_end"
+ANSWER = "answer"
+
+
+@dataclass
+class AgentEvent:
+    """An event of `MultiTurnAgent.stream_chat`.
+
+    :param type: str, TOKEN (a content delta in `text`), TOOL_START, TOOL_END (the tool output in `text`) or ANSWER (the final answer in `text`).
+    :param text: str, The content delta, tool output or final answer.
+    :param tool_call: Optional[Dict[str, Any]], The tool call of a TOOL_START or TOOL_END event.
+    """
+    type: str
+    text: str = ""
+    tool_call: Optional[Dict[str, Any]] = None
+
+
 #TODO replace with agent framework based agent
 class MultiTurnAgent:
     def __init__(
@@ -18,14 +39,25 @@ class MultiTurnAgent:
         max_history_turns: int = 5,
         max_prompt_history_size: Optional[int] = None,
         max_response_history_size: Optional[int] = None,
-        messages: Optional[List[Dict[str, Any]]] = None
+        messages: Optional[List[Dict[str, Any]]] = None,
+        max_prompt_tokens: Optional[int] = None,
+        token_budget: Optional[TokenBudget] = None,
+        usage_tags: Optional[Dict[str, str]] = None
     ):
-        """Initializes the agent with an internal, stateful scratchpad."""
+        """Initializes the agent with an internal, stateful scratchpad.
+
+        :param max_prompt_tokens: Optional[int], The oldest turns are left out of the prompt until it fits, defaults to the limit of the LLMProcessor
+        :param token_budget: Optional[TokenBudget], The token budget of the session; requests that do not fit are refused, defaults to None
+        :param usage_tags: Optional[Dict[str, str]], Attributes to aggregate the usage of the agent by, e.g. {"agent": "search"}, defaults to None
+        """
         self.llm_processor = llm_processor
         self.prompt_processor = prompt_processor
         self.max_history_turns = max_history_turns
         self.max_prompt_history_size = max_prompt_history_size
         self.max_response_history_size = max_response_history_size
+        self.max_prompt_tokens = max_prompt_tokens
+        self.token_budget = token_budget
+        self.usage_tags = usage_tags
         self.messages: List[Dict[str, Any]] = messages if messages is not None else []
         self.scratchpad: List[Dict[str, Any]] = []
         self.prompt_history : List = []
@@ -71,63 +103,99 @@ class MultiTurnAgent:
         user_message_indices = [i for i, msg in enumerate(conversation_messages) if msg.get('role') == 'user']
         start_index = user_message_indices[-self.max_history_turns] if len(user_message_indices) > self.max_history_turns else 0
             
-        return system_messages + conversation_messages[start_index:]
+        return system_messages + self._trim_to_token_limit(system_messages, conversation_messages[start_index:])
+
+    def _trim_to_token_limit(self, system_messages: List[Dict[str, Any]], conversation: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Leaves out the oldest whole turns until the prompt fits the token limit; the last turn is always kept."""
+        limit = self.max_prompt_tokens if self.max_prompt_tokens is not None else self.llm_processor.max_prompt_tokens
+        if limit is None:
+            return conversation
+
+        fixed = self.llm_processor.prompt_tokens(system_messages, self.tool_schemas)
+        sizes = [self.llm_processor.prompt_tokens([msg]) for msg in conversation]
+        turn_starts = [i for i, msg in enumerate(conversation) if msg.get('role') == 'user']
+        cut = 0
+        for start in turn_starts[1:]:
+            if fixed + sum(sizes[cut:]) <= limit:
+                break
+            cut = start
+        if cut:
+            logger.info(f"Left {cut} messages of older turns out of the prompt to fit {limit} tokens")
+        return conversation[cut:]
     
-    def chat(self, max_tool_turns: int = 5, **kwargs) -> str:
-        """Executes the full conversation loop and returns the final answer."""
+    def _run_tool(self, tool_call: Dict[str, Any]) -> str:
+        """Executes a tool call of the model and returns its output, or an error message for the model."""
+        function_name = tool_call['function']['name']
+        try:
+            args = json.loads(tool_call['function']['arguments'])
+            if function_name == "update_scratchpad":
+                return self.update_scratchpad(**args)
+            tool_to_run = self._available_tools.get(function_name)
+            if tool_to_run:
+                return tool_to_run.execute(**args)
+            raise ValueError(f"Tool '{function_name}' not found.")
+        except Exception as e:
+            error_message = str(e) if str(e) else f"Unknown error of type {type(e).__name__}"
+            print(f"Error executing {function_name}: {error_message}")
+
+            print(f"Exception details: {traceback.format_exc()}")
+            return f"An error occurred while executing tool '{function_name}': {error_message}"
+
+    def stream_chat(self, max_tool_turns: int = 5, **kwargs) -> Iterator[AgentEvent]:
+        """Executes the full conversation loop, streaming the model output.
+
+        Yields TOKEN events with the content deltas of every turn, TOOL_START and
+        TOOL_END around each tool call and a final ANSWER event with the final answer.
+        """
         self.messages = self.prompt_processor.create_prompt(history=self.messages, **kwargs)
 
         for _ in range(max_tool_turns):
             message_history = self._get_conversation_window()
             self._append_with_max_size(self.prompt_history, message_history, self.max_prompt_history_size)
-            result = self.llm_processor.process(message_history, tools=self.tool_schemas, tool_choice="auto")
-            
+            try:
+                stream = self.llm_processor.stream(
+                    message_history, budget=self.token_budget, usage_tags=self.usage_tags,
+                    tools=self.tool_schemas, tool_choice="auto"
+                )
+                for delta in stream:
+                    yield AgentEvent(TOKEN, text=delta)
+                result = stream.until_done()
+            except TokenBudgetExceeded as e:
+                logger.warning(f"Agent request refused: {e}")
+                answer = f"The request was not sent because it exceeds the token budget: {e}"
+                self.messages.append({"role": "assistant", "content": answer})
+                yield AgentEvent(ANSWER, text=answer)
+                return
+
             logger.info(f"Agent generate response token usage: {result.usage}")
             self._append_with_max_size(self.response_history, result, self.max_response_history_size)
-            
-            if not result.tool_calls:
-                self.messages.append(result.message)
-                return result.raw_content or "I could not generate a response."
-            
+
             self.messages.append(result.message)
-            tool_outputs = []
-            for tool_call in result.tool_calls:
-                function_name = tool_call['function']['name']
-                tool_output = ""
-                
-                try:
-                    args = json.loads(tool_call['function']['arguments'])
-                    if function_name == "update_scratchpad":
-                        tool_output = self.update_scratchpad(**args)
-                    else:
-                        tool_to_run = self._available_tools.get(function_name)
-                        if tool_to_run:
-                            tool_output = tool_to_run.execute(**args)
-                        else:
-                            raise ValueError(f"Tool '{function_name}' not found.")
-                except Exception as e:
-                    error_message = str(e) if str(e) else f"Unknown error of type {type(e).__name__}"
-                    tool_output = f"An error occurred while executing tool '{function_name}': {error_message}"
-                    print(f"Error executing {function_name}: {error_message}")
-  
-                    print(f"Exception details: {traceback.format_exc()}")
-
-            # TODO decouple tool excecuting logic from agent loop!
+            if not result.tool_calls:
+                yield AgentEvent(ANSWER, text=result.raw_content or "I could not generate a response.")
+                return
+
             # The OpenAI API requires that tool responses are sent in the exact same order
-            # as the tool calls in the assistant's message. To ensure compliance, we first
-            # execute all tools, then create a map from tool_call_id to the output. Finally,
-            # we iterate through the original tool_calls list and append the corresponding
-            # outputs to the messages list in the correct order.
-                tool_outputs.append({"tool_call_id": tool_call['id'], "role": "tool", "name": function_name, "content": tool_output})
-            
-            tool_output_map = {output['tool_call_id']: output for output in tool_outputs}
-            
+            # as the tool calls in the assistant's message, so they are executed and
+            # appended one by one in that order.
             for tool_call in result.tool_calls:
-                tool_call_id = tool_call['id']
-                if tool_call_id in tool_output_map:
-                    self.messages.append(tool_output_map[tool_call_id])
-        
-        return "Maximum number of turns reached. Could you please clarify your request?"
+                yield AgentEvent(TOOL_START, tool_call=tool_call)
+                tool_output = self._run_tool(tool_call)
+                yield AgentEvent(TOOL_END, tool_call=tool_call, text=tool_output)
+                self.messages.append({
+                    "tool_call_id": tool_call['id'], "role": "tool",
+                    "name": tool_call['function']['name'], "content": tool_output
+                })
+
+        yield AgentEvent(ANSWER, text="Maximum number of turns reached. Could you please clarify your request?")
+
+    def chat(self, max_tool_turns: int = 5, **kwargs) -> str:
+        """Executes the full conversation loop and returns the final answer."""
+        answer = ""
+        for event in self.stream_chat(max_tool_turns=max_tool_turns, **kwargs):
+            if event.type == ANSWER:
+                answer = event.text
+        return answer
 
     def reset(self):
         """Clears the conversation history."""
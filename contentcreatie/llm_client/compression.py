@@ -0,0 +1,237 @@
+import html
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+from logging import getLogger
+logger = getLogger("Contenttransformatie")
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Parquet column holding the compressed heavy fields of a document.
+COMPRESSED_COLUMN = "heavy_zstd"
+# Parquet schema metadata key naming the dictionary the column was compressed with (0: none).
+DICTIONARY_ID_KEY = b"zstd_dictionary_id"
+
+# The canonical HTML answers. The plain-text fields are derived from them.
+HTML_KEYS = ("private_answer_html", "public_answer_html")
+DERIVED_KEYS = ("private_answer", "public_answer", "content")
+# The fields that are stored in the compressed column.
+COMPRESSED_KEYS = (*HTML_KEYS, *DERIVED_KEYS)
+_DERIVED = "$derived"
+
+
+def strip_html(html_text: Optional[str]) -> str:
+    """Strip HTML tags from text and convert to plain text.
+
+    :param html_text: Optional[str], HTML text to strip.
+    :return: str, Plain text with HTML tags removed.
+    """
+    if not html_text:
+        return ""
+
+    # quick & decent: remove tags; preserve <br> as newline first
+    t = html_text.replace("<br>", "\n").replace("<br/>", "\n").replace("<br />", "\n")
+    t = re.sub(r"<\/p\s*>", "\n", t, flags=re.I)
+    t = re.sub(r"<[^>]+>", "", t)
+    return html.unescape(re.sub(r"\n{3,}", "\n\n", t)).strip()
+
+
+def full_text(public_text: str, private_text: str) -> str:
+    """The content of a KME document: both plain-text answers in one string."""
+    return "Public Answer: " + public_text + ' Private Answer: ' + private_text
+
+
+def derive_fields(fields: Dict[str, Any]) -> Dict[str, str]:
+    """Derives the plain-text fields from the HTML answers, as the KME extraction does.
+    :param fields: Dict[str, Any], The fields of a document holding the HTML answers.
+    :return: Dict[str, str], The derivable plain-text fields; empty if an HTML answer is missing.
+    """
+    private_html, public_html = (fields.get(key) for key in HTML_KEYS)
+    if not isinstance(private_html, str) or not isinstance(public_html, str):
+        return {}
+    private_text, public_text = strip_html(private_html), strip_html(public_html)
+    return {
+        "private_answer": private_text,
+        "public_answer": public_text,
+        "content": full_text(public_text, private_text),
+    }
+
+
+def compression_available() -> bool:
+    """Whether the optional zstandard package is installed."""
+    return zstandard is not None
+
+
+def _require_zstandard():
+    if zstandard is None:
+        raise ImportError("The document store holds zstd-compressed documents; install the 'zstandard' package to read them.")
+
+
+class HeavyFieldCodec:
+    """Compresses the answers and content of a document into a single zstd frame.
+
+    Only the canonical HTML answers are kept: the plain-text answers and the content
+    are dropped when they equal what `derive_fields` rebuilds from the HTML, and are
+    derived again on decoding. A field that differs (e.g. edited content) is kept
+    as is, so decoding is lossless. Frames are compressed with a dictionary trained
+    on the corpus, which captures the markup and phrasing shared between documents.
+    """
+    def __init__(self, dictionary: Optional[bytes] = None, level: int = 9):
+        """
+        :param dictionary: Optional[bytes], A trained zstd dictionary, defaults to None
+        :param level: int, The zstd compression level, defaults to 9
+        """
+        _require_zstandard()
+        self.level = level
+        self._dictionary = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+        self.dictionary_id = self._dictionary.dict_id() if self._dictionary else 0
+        # zstd (de)compressors are not thread-safe; each thread gets its own.
+        self._local = threading.local()
+
+    @staticmethod
+    def payload(fields: Dict[str, Any]) -> bytes:
+        """Serializes the fields of a document to store, leaving out the derivable ones.
+        :param fields: Dict[str, Any], The string-valued fields of COMPRESSED_KEYS of a document.
+        :return: bytes, The uncompressed payload.
+        """
+        derived = derive_fields(fields)
+        stored = {key: value for key, value in fields.items() if derived.get(key) != value}
+        stored[_DERIVED] = [key for key in DERIVED_KEYS if key in fields and key not in stored]
+        return json.dumps(stored, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    @classmethod
+    def train(cls, payloads: List[bytes], dictionary_size: int = 112_640, level: int = 9) -> "HeavyFieldCodec":
+        """Trains a dictionary on document payloads and returns a codec using it.
+
+        Falls back to compression without a dictionary if the corpus is too small to train on.
+        :param payloads: List[bytes], Payloads as returned by `payload`.
+        :param dictionary_size: int, The maximum dictionary size in bytes, defaults to 112_640
+        :param level: int, The zstd compression level, defaults to 9
+        :return: HeavyFieldCodec, The codec.
+        """
+        _require_zstandard()
+        try:
+            dictionary = zstandard.train_dictionary(dictionary_size, payloads).as_bytes()
+        except zstandard.ZstdError as e:
+            logger.info(f"No zstd dictionary trained ({len(payloads)} samples): {e}")
+            dictionary = None
+        return cls(dictionary, level=level)
+
+    @property
+    def dictionary(self) -> Optional[bytes]:
+        """The trained dictionary, if any."""
+        return self._dictionary.as_bytes() if self._dictionary else None
+
+    def _compressor(self) -> "zstandard.ZstdCompressor":
+        compressor = getattr(self._local, "compressor", None)
+        if compressor is None:
+            compressor = self._local.compressor = zstandard.ZstdCompressor(level=self.level, dict_data=self._dictionary)
+        return compressor
+
+    def _decompressor(self) -> "zstandard.ZstdDecompressor":
+        decompressor = getattr(self._local, "decompressor", None)
+        if decompressor is None:
+            decompressor = self._local.decompressor = zstandard.ZstdDecompressor(dict_data=self._dictionary)
+        return decompressor
+
+    def encode(self, fields: Dict[str, Any]) -> bytes:
+        """Compresses the fields of a document.
+        :param fields: Dict[str, Any], The string-valued fields of COMPRESSED_KEYS of a document.
+        :return: bytes, The zstd frame.
+        """
+        return self._compressor().compress(self.payload(fields))
+
+    def decode(self, blob: bytes) -> Dict[str, str]:
+        """Decompresses the fields of a document and derives the dropped plain-text fields.
+        :param blob: bytes, A frame written by `encode`.
+        :return: Dict[str, str], The fields as they were passed to `encode`.
+        """
+        stored = json.loads(self._decompressor().decompress(blob))
+        derived_keys = stored.pop(_DERIVED, ())
+        if derived_keys:
+            derived = derive_fields(stored)
+            stored.update((key, derived[key]) for key in derived_keys)
+        return stored
+
+
+def dictionary_path(directory: str, dictionary_id: int) -> str:
+    """The file holding a trained dictionary of a store."""
+    return os.path.join(directory, f"zstd-{dictionary_id}.dict")
+
+
+def save_dictionary(directory: str, codec: HeavyFieldCodec):
+    """Writes the dictionary of a codec next to the documents, atomically."""
+    if not codec.dictionary_id:
+        return
+    path = dictionary_path(directory, codec.dictionary_id)
+    if os.path.exists(path):
+        return
+    tmp_file = f"{path}.tmp"
+    with open(tmp_file, 'wb') as f:
+        f.write(codec.dictionary)
+    os.replace(tmp_file, path)
+
+
+def dictionary_id(schema_metadata: Optional[Dict[bytes, bytes]]) -> Optional[int]:
+    """The dictionary id recorded in the schema metadata of a documents file, or None if it is not compressed."""
+    raw_id = (schema_metadata or {}).get(DICTIONARY_ID_KEY)
+    return int(raw_id) if raw_id is not None else None
+
+
+def load_codec(directory: str, dictionary_id: int) -> HeavyFieldCodec:
+    """Creates the codec for a dictionary saved with `save_dictionary`.
+    :param directory: str, The directory holding the dictionaries.
+    :param dictionary_id: int, The id of the dictionary; 0 for compression without a dictionary.
+    :return: HeavyFieldCodec, The codec.
+    """
+    dictionary = None
+    if dictionary_id:
+        with open(dictionary_path(directory, dictionary_id), 'rb') as f:
+            dictionary = f.read()
+    return HeavyFieldCodec(dictionary)
+
+
+def remove_dictionaries(directory: str, keep: Iterable[int] = ()):
+    """Removes the dictionary files of a store, except the given ids."""
+    keep = {dictionary_path(directory, dictionary_id) for dictionary_id in keep}
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name.startswith("zstd-") and name.endswith(".dict") and path not in keep:
+            os.remove(path)
+
+
+class DecodedFieldCache:
+    """Decodes compressed document fields, keeping the most recently used documents in a bounded LRU."""
+    def __init__(self, codec: HeavyFieldCodec, size: int = 256):
+        """
+        :param codec: HeavyFieldCodec, The codec the fields were compressed with.
+        :param size: int, The maximum number of decoded documents kept, defaults to 256
+        """
+        self.codec = codec
+        self.size = max(1, int(size))
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[int, Dict[str, str]]" = OrderedDict()
+
+    def decode(self, row: int, blob: bytes) -> Dict[str, str]:
+        """Returns the decoded fields of the document in a row. The caller must not modify the result.
+        :param row: int, The row of the document, used as the cache key.
+        :param blob: bytes, The compressed fields of the document.
+        :return: Dict[str, str], The decoded fields.
+        """
+        with self._lock:
+            fields = self._items.get(row)
+            if fields is not None:
+                self._items.move_to_end(row)
+                return fields
+        fields = self.codec.decode(blob)
+        with self._lock:
+            self._items[row] = fields
+            if len(self._items) > self.size:
+                self._items.popitem(last=False)
+        return fields
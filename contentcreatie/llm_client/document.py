@@ -2,10 +2,12 @@ from abc import ABC
 from dataclasses import dataclass
 from typing import Any, Dict
 
-@dataclass
+@dataclass(slots=True)
 class Document(ABC):
     """An abstract base class for a document.
 
+    Documents use `__slots__`, so instances carry no per-instance `__dict__`.
+
     :param id: str, The unique identifier for the document.
     :param title: str, The title of the document.
     :param content: str, The main text content of the document.
@@ -27,7 +29,7 @@ class Document(ABC):
         """
         return self.content
     
-@dataclass
+@dataclass(slots=True)
 class SimpleDocument(Document):
     """A basic, concrete implementation of the Document class."""
     pass
@@ -0,0 +1,176 @@
+import json
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import pyarrow as pa
+import pyarrow.compute as pc
+from .document import Document
+from .compression import COMPRESSED_COLUMN, COMPRESSED_KEYS, DICTIONARY_ID_KEY, HeavyFieldCodec
+
+_CATEGORY = pa.dictionary(pa.int32(), pa.string())
+
+# Known KME metadata keys and their Arrow types. Each is persisted in its own
+# column; any other key ends up in the JSON overflow column 'metadata'.
+METADATA_COLUMNS: Dict[str, pa.DataType] = {
+    "BELASTINGSOORT": _CATEGORY,
+    "PROCES_ONDERWERP": _CATEGORY,
+    "PRODUCT_SUBONDERWERP": _CATEGORY,
+    "VRAAG": pa.string(),
+    "filename": pa.string(),
+    "id": pa.string(),
+    "tags": pa.list_(pa.string()),
+    "private_answer_html": pa.string(),
+    "public_answer_html": pa.string(),
+    "private_answer": pa.string(),
+    "public_answer": pa.string(),
+    "summary": pa.string(),
+}
+
+# Metadata keys holding large text blobs. They are skipped when the store is opened lazily.
+HEAVY_METADATA_KEYS = (
+    "private_answer_html",
+    "public_answer_html",
+    "private_answer",
+    "public_answer",
+    "summary",
+)
+LIGHT_METADATA_KEYS = tuple(k for k in METADATA_COLUMNS if k not in HEAVY_METADATA_KEYS)
+# Keys with few distinct values, stored dictionary-encoded and shared between documents in memory.
+CATEGORICAL_KEYS = tuple(k for k, dtype in METADATA_COLUMNS.items() if pa.types.is_dictionary(dtype))
+METADATA_COLUMN_PREFIX = "meta_"
+
+
+def metadata_column(key: str) -> str:
+    """Returns the Parquet column name used for a known metadata key."""
+    return f"{METADATA_COLUMN_PREFIX}{key}"
+
+
+def _fits_column(key: str, value: Any) -> bool:
+    """Checks whether a value can be stored in the typed column of a known key."""
+    if pa.types.is_list(METADATA_COLUMNS[key]):
+        return isinstance(value, list) and all(isinstance(v, str) for v in value)
+    return isinstance(value, str)
+
+
+def split_metadata(metadata: Dict[str, Any], keys: Iterable[str] = METADATA_COLUMNS) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Splits metadata into values for typed columns and the remaining overflow.
+
+    Values that do not fit the column type (e.g. a NaN where a string is expected)
+    stay in the overflow, so they round-trip unchanged.
+    :param metadata: Dict[str, Any], The full metadata of a document.
+    :param keys: Iterable[str], The known keys to split off, defaults to all METADATA_COLUMNS
+    :return: Tuple[Dict[str, Any], Dict[str, Any]], The typed column values and the overflow.
+    """
+    keys = set(keys)
+    columns, overflow = {}, {}
+    for key, value in (metadata or {}).items():
+        if key in keys and _fits_column(key, value):
+            columns[key] = value
+        else:
+            overflow[key] = value
+    return columns, overflow
+
+
+def document_schema() -> pa.Schema:
+    """The Arrow schema of a documents Parquet file."""
+    fields = [
+        pa.field("id", pa.string()),
+        pa.field("title", pa.string()),
+        pa.field("content", pa.string()),
+        pa.field("metadata", pa.string()),
+    ]
+    fields += [pa.field(metadata_column(key), dtype) for key, dtype in METADATA_COLUMNS.items()]
+    fields.append(pa.field(COMPRESSED_COLUMN, pa.binary()))
+    return pa.schema(fields)
+
+
+def documents_to_table(docs: Iterable[Document], codec: Optional[HeavyFieldCodec] = None) -> pa.Table:
+    """Converts documents to an Arrow table with typed metadata columns.
+
+    With a codec, the content and the answer fields are compressed into the
+    COMPRESSED_COLUMN and left empty in their own columns; the id of the codec's
+    dictionary is recorded in the schema metadata.
+    :param docs: Iterable[Document], The documents to convert.
+    :param codec: Optional[HeavyFieldCodec], Compress the heavy text fields with this codec, defaults to None
+    :return: pa.Table, The table following `document_schema()`.
+    """
+    data: Dict[str, List[Any]] = {name: [] for name in document_schema().names}
+    for doc in docs:
+        columns, overflow = split_metadata(doc.metadata)
+        content = doc.content
+        blob = None
+        if codec is not None:
+            fields = {key: columns.pop(key) for key in COMPRESSED_KEYS if key in columns}
+            if isinstance(content, str):
+                fields["content"], content = content, None
+            blob = codec.encode(fields)
+        data["id"].append(doc.id)
+        data["title"].append(doc.title)
+        data["content"].append(content)
+        data["metadata"].append(json.dumps(overflow) if overflow else None)
+        for key in METADATA_COLUMNS:
+            data[metadata_column(key)].append(columns.get(key))
+        data[COMPRESSED_COLUMN].append(blob)
+    schema = document_schema()
+    if codec is not None:
+        schema = schema.with_metadata({DICTIONARY_ID_KEY: str(codec.dictionary_id).encode()})
+    return pa.Table.from_pydict(data, schema=schema)
+
+
+def column_values(column: pa.ChunkedArray) -> List[Any]:
+    """Converts a column to Python values.
+
+    Values of dictionary-encoded columns are decoded through their dictionary, so
+    all rows with the same value share a single string object.
+    :param column: pa.ChunkedArray, A column of a documents table.
+    :return: List[Any], The values in row order.
+    """
+    if not pa.types.is_dictionary(column.type):
+        return column.to_pylist()
+    pool: Dict[str, str] = {}
+    values: List[Any] = []
+    for chunk in column.chunks:
+        dictionary = [pool.setdefault(v, v) if v is not None else None for v in chunk.dictionary.to_pylist()]
+        values.extend(None if i is None else dictionary[i] for i in chunk.indices.to_pylist())
+    return values
+
+
+def table_to_metadata(table: pa.Table, keys: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+    """Rebuilds the metadata dicts of a documents table.
+
+    Columns are converted to Python in bulk; the JSON overflow is only parsed for
+    rows that have one. Older files that kept everything in the JSON column load too.
+    :param table: pa.Table, A table read from a documents Parquet file.
+    :param keys: Optional[Iterable[str]], Restrict the typed columns to these keys, defaults to all present
+    :return: List[Dict[str, Any]], The metadata per row, in table order.
+    """
+    names = set(table.column_names)
+    keys = METADATA_COLUMNS.keys() if keys is None else keys
+    columns = {key: column_values(table.column(metadata_column(key))) for key in keys if metadata_column(key) in names}
+
+    metadatas: List[Dict[str, Any]] = [{} for _ in range(table.num_rows)]
+    if "metadata" in names:
+        for i, raw in enumerate(table.column("metadata").to_pylist()):
+            if raw:
+                metadatas[i] = json.loads(raw)
+    for key, values in columns.items():
+        for metadata, value in zip(metadatas, values):
+            if value is not None:
+                metadata[key] = value
+    return metadatas
+
+
+def filter_expression(table_names: Iterable[str], metadata_filter: Dict[str, Any]) -> Optional[pc.Expression]:
+    """Builds an Arrow filter for an exact-match metadata filter, if it can be pushed down.
+    :param table_names: Iterable[str], The column names of the Parquet file.
+    :param metadata_filter: Dict[str, Any], The key-value pairs to filter by.
+    :return: Optional[pc.Expression], The expression, or None if a key has no typed column or the value does not fit it.
+    """
+    names = set(table_names)
+    expression = None
+    for key, value in metadata_filter.items():
+        column = metadata_column(key)
+        if key not in METADATA_COLUMNS or column not in names or not isinstance(value, str) \
+                or pa.types.is_list(METADATA_COLUMNS[key]):
+            return None
+        term = pc.field(column) == value
+        expression = term if expression is None else expression & term
+    return expression
@@ -1,38 +1,138 @@
-import json
 import os
 import shutil
-from dataclasses import asdict
-from typing import Any, Dict, List, Optional, Union, Set
-import pandas as pd  # Added import
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Union, Set
+import pyarrow as pa
+import pyarrow.parquet as pq
 from whoosh.fields import ID, TEXT, Schema
-from whoosh.index import create_in, exists_in, open_dir
 from whoosh.qparser import MultifieldParser
 from .document import Document, SimpleDocument
+from .document_schema import (
+    HEAVY_METADATA_KEYS,
+    LIGHT_METADATA_KEYS,
+    documents_to_table,
+    filter_expression,
+    metadata_column,
+    table_to_metadata,
+)
+from .lazy_documents import HeavyFieldLoader, LazyDocument, MetadataColumns
+from .compression import (
+    COMPRESSED_COLUMN,
+    COMPRESSED_KEYS,
+    HeavyFieldCodec,
+    compression_available,
+    dictionary_id,
+    load_codec,
+    remove_dictionaries,
+    save_dictionary,
+)
+from .rwlock import ReadWriteLock
+from .versions import CHANGED, NEW, REMOVED, UNCHANGED, DocumentVersion, VersionLog, content_hash, document_hash
+from .snapshot import MappedFieldLoader, open_snapshot, snapshot_path, write_snapshot
+from .metadata_index import MetadataIndex, condition_matches
+from .taxonomy_index import TAXONOMY_LEVELS, TaxonomyIndex
+from .search_index import ManagedIndex, MarkdownFormatter, text_parser, text_schema
+from whoosh.highlight import ContextFragmenter
 from logging import getLogger
 logger = getLogger("Contenttransformatie")
 
 class DocumentStore:
-    """Manages document storage, persistence, and indexed metadata searching."""
+    """Manages document storage, persistence, and indexed metadata searching.
+
+    The store is safe to share between threads. Writers hold an exclusive lock only
+    while applying a prepared batch to the in-memory state; queries over the
+    in-memory indexes hold it shared. Single lookups (`get`, `get_all`) read the
+    document dict without locking. Saves copy the pending changes under the lock
+    and write to disk outside it, one save at a time, so ingestion and serving are
+    not stopped while files are written.
+
+    Every stored change of a document is recorded in a version log together with
+    a hash of its source content (see versions), so a new export can be compared
+    with the store and only the changed documents need to be processed again.
+    """
     def __init__(
         self,
         source_name: str,
         data_root: str = "data",
-        indexed_metadata_keys: Optional[List[str]] = None
+        indexed_metadata_keys: Optional[List[str]] = None,
+        lazy: bool = False,
+        cache_size: int = 32,
+        row_group_size: int = 1024,
+        compaction_ratio: float = 0.1,
+        max_delta_files: int = 50,
+        index_batch_size: int = 500,
+        index_flush_interval: float = 2.0,
+        full_text_search: bool = False,
+        snapshot: bool = True,
+        compress: bool = False,
+        decoded_cache_size: int = 256,
+        dictionary_samples: int = 2000,
     ):
         """Initializes the DocumentStore, handling persistence and metadata indexing.
         :param source_name: str, A unique name for the data source, used for creating storage directories.
         :param data_root: str, The root directory where data will be stored, defaults to "data"
         :param indexed_metadata_keys: Optional[List[str]], A list of metadata keys to be indexed for fast text-based searching, defaults to None
+        :param lazy: bool, If True, only ids, titles and light metadata are loaded at startup. Content and heavy
+                     metadata fields are read from disk on access, defaults to False
+        :param cache_size: int, Number of Parquet row groups kept in the LRU cache in lazy mode, defaults to 32
+        :param row_group_size: int, Number of documents per Parquet row group when saving, defaults to 1024
+        :param compaction_ratio: float, Compact the deltas into the base file once they hold more than this
+                                 fraction of the documents, defaults to 0.1
+        :param max_delta_files: int, Compact once this many delta files exist, defaults to 50
+        :param index_batch_size: int, Commit queued search index updates once this many are pending, defaults to 500
+        :param index_flush_interval: float, Maximum seconds before queued index updates are committed, defaults to 2.0
+        :param full_text_search: bool, If True, also maintains a BM25 full-text index over titles, questions,
+                                 summaries and content (see `search_text`), defaults to False
+        :param snapshot: bool, If True, the base file is also kept as an uncompressed Arrow IPC snapshot that is
+                         memory-mapped at startup instead of decoding the Parquet file, defaults to True
+        :param compress: bool, If True, files are written with the content and answers compressed with zstd
+                         (see compression); only the HTML answers are kept, the plain-text fields are derived
+                         on access. Requires the optional zstandard package. Compressed files are read
+                         regardless of this setting, defaults to False
+        :param decoded_cache_size: int, Number of decompressed documents kept in the LRU cache in lazy mode, defaults to 256
+        :param dictionary_samples: int, Number of documents the zstd dictionary is trained on at compaction, defaults to 2000
         """
         self.source_name = source_name
         self.data_root = data_root
         self.indexed_metadata_keys = indexed_metadata_keys or []
+        self.lazy = lazy
+        self.snapshot = snapshot
+        self.row_group_size = max(1, int(row_group_size))
+        self.compaction_ratio = compaction_ratio
+        self.max_delta_files = max(1, int(max_delta_files))
         
         self.store_path = os.path.join(self.data_root, self.source_name)
         os.makedirs(self.store_path, exist_ok=True)
         
         self.persistence_file = os.path.join(self.store_path, "documents.parquet")
+        self.delta_path = os.path.join(self.store_path, "deltas")
+        self._dirty_ids: Set[str] = set()
+        # Removed documents are still in the files on disk; they are dropped at the next compaction.
+        self._removed_ids: Set[str] = set()
+        self._changed_since_base: Set[str] = set()
+        self._delta_rows = 0
+        self.cache_size = cache_size
+        self.decoded_cache_size = decoded_cache_size
+        self.dictionary_samples = max(1, int(dictionary_samples))
+        if compress and not compression_available():
+            logger.warning("The zstandard package is not installed; the document store is written uncompressed.")
+            compress = False
+        self.compress = compress
+        # Codecs of the files read, by dictionary id, and the codec new files are written with.
+        self._codecs: Dict[int, HeavyFieldCodec] = {}
+        self._write_codec: Optional[HeavyFieldCodec] = None
+        self._snapshot_table: Optional[pa.Table] = None
+        self._lock = ReadWriteLock()
+        # Serializes saves and compactions; held while files are written, not while serving.
+        self._save_lock = threading.Lock()
+        self.versions = VersionLog(os.path.join(self.store_path, "versions.jsonl"))
         self.documents: Dict[str, Document] = self._load()
+        if self.compress:
+            self._write_codec = self._base_codec() or HeavyFieldCodec()
+        self.metadata_index = MetadataIndex(self.indexed_metadata_keys)
+        self.taxonomy_index = TaxonomyIndex()
+        for doc in self.documents.values():
+            self._index_values(doc.id, self._metadata_values(doc))
         
         self.index_path = os.path.join(self.store_path, "metadata_index")
         
@@ -42,87 +142,254 @@ class DocumentStore:
         self.schema = Schema(**schema_fields)
 
 
-        if exists_in(self.index_path):
-            self.ix = open_dir(self.index_path, schema=self.schema)
-        else:
-            os.makedirs(self.index_path, exist_ok=True)
-            self.ix = create_in(self.index_path, self.schema)
-            
         if self.indexed_metadata_keys:
             self.query_parser = MultifieldParser(self.indexed_metadata_keys, schema=self.schema)
+            self.search_index = ManagedIndex(
+                self.index_path, self.schema, self.query_parser,
+                batch_size=index_batch_size, flush_interval=index_flush_interval
+            )
         else:
             self.query_parser = None
+            self.search_index = None
+
+        self.text_index: Optional[ManagedIndex] = None
+        if full_text_search:
+            text_index_schema = text_schema()
+            self.text_index = ManagedIndex(
+                os.path.join(self.store_path, "content_index"), text_index_schema, text_parser(text_index_schema),
+                batch_size=index_batch_size, flush_interval=index_flush_interval
+            )
+            if self.documents and self.text_index.ix.doc_count() == 0:
+                print("Full-text index is empty, building it in the background...")
+                self.rebuild_text_index(background=True)
+
+    def _index_fields(self, doc: Document) -> Dict[str, Any]:
+        """Builds the Whoosh fields for a document from its indexed metadata keys."""
+        doc_for_index = {'doc_id': doc.id}
+        for key in self.indexed_metadata_keys:
+            value = self._metadata_value(doc, key)
+            doc_for_index[key] = str(value) if value is not None else None
+        return doc_for_index
+
+    def _text_fields(self, doc: Document) -> Dict[str, Any]:
+        """Builds the Whoosh fields of the full-text index for a document."""
+        metadata = doc.metadata
+        return {
+            'doc_id': doc.id,
+            'title': doc.title or "",
+            'VRAAG': str(metadata.get('VRAAG') or ""),
+            'summary': str(metadata.get('summary') or ""),
+            'content': doc.content or "",
+        }
+
+    def _rebuild(self, index: ManagedIndex, fields: Callable[[Document], Dict[str, Any]], procs: Optional[int], background: bool) -> Optional[threading.Thread]:
+        """Rebuilds a managed index from all documents, optionally on a background thread."""
+        procs = procs or min(4, os.cpu_count() or 1)
 
-    def rebuild_search_index(self):
+        def _run():
+            print(f"Rebuilding search index for {len(self.documents)} documents using {procs} process(es)...")
+            count = index.rebuild(
+                lambda: (fields(doc) for doc in self.get_all()),
+                lambda doc_id: fields(self.documents[doc_id]) if doc_id in self.documents else None,
+                procs=procs,
+            )
+            print(f"Successfully indexed {count} documents.")
+
+        if background:
+            thread = threading.Thread(target=_run, name="whoosh-rebuild", daemon=True)
+            thread.start()
+            return thread
+        _run()
+        return None
+
+    def rebuild_search_index(self, procs: Optional[int] = None, background: bool = False) -> Optional[threading.Thread]:
         """Rebuilds the Whoosh search index from scratch for all documents in the store.
         
         This method should be called if the indexed metadata keys change or if the index
-        is suspected to be corrupt. It will delete the old index and create a new one.
+        is suspected to be corrupt. The new index is written by `procs` worker processes
+        into a side directory and swapped in atomically, so searches keep using the old
+        index while the rebuild runs. Documents added during the rebuild are re-applied
+        to the new index after the swap.
+
+        :param procs: Optional[int], Number of worker processes, defaults to the CPU count (max 4)
+        :param background: bool, If True, rebuild on a background thread and return it, defaults to False
+        :return: Optional[threading.Thread], The rebuild thread when background is True.
         """
         if not self.indexed_metadata_keys:
             print("Warning: No metadata keys configured for indexing. Cannot build index.")
-            return
-        print(f"Rebuilding search index for {len(self.documents)} documents...")
-        index_path = os.path.join(self.data_root, self.source_name, "metadata_index")
-        if os.path.exists(index_path):
-            shutil.rmtree(index_path)
-        os.makedirs(index_path)
-        self.ix = create_in(index_path, self.schema)
-        all_docs = self.get_all()
-        if not all_docs:
-            print("No documents in store. Index is empty.")
-            return
-        writer = self.ix.writer()
-        for doc in all_docs:
-            doc_for_index = {'doc_id': doc.id}
-            for key in self.indexed_metadata_keys:
-                value = doc.metadata.get(key)
-                doc_for_index[key] = str(value) if value is not None else None
-            writer.add_document(**doc_for_index)
-        writer.commit()
-        print(f"Successfully indexed {len(all_docs)} documents.")
+            return None
+        return self._rebuild(self.search_index, self._index_fields, procs, background)
+
+    def rebuild_text_index(self, procs: Optional[int] = None, background: bool = False) -> Optional[threading.Thread]:
+        """Rebuilds the full-text index from scratch for all documents in the store.
+
+        Works like `rebuild_search_index`: the new index is built next to the active one
+        and swapped in atomically.
+        :param procs: Optional[int], Number of worker processes, defaults to the CPU count (max 4)
+        :param background: bool, If True, rebuild on a background thread and return it, defaults to False
+        :return: Optional[threading.Thread], The rebuild thread when background is True.
+        """
+        if not self.text_index:
+            print("Warning: Full-text search is not enabled. Cannot build the full-text index.")
+            return None
+        return self._rebuild(self.text_index, self._text_fields, procs, background)
 
     def add(self, 
             docs_to_add: Union[Document, List[Document]], 
             refresh: bool = False, 
-            update_index: bool = False,
+            update_index: bool = True,
             save = False
            ):
         """Adds or updates one or more documents in the store and search index.
         
-        If a document with the same ID already exists, it is updated. The change is
-        persisted to disk.
-        
+        If a document with the same ID already exists, it is updated. Metadata values,
+        content hashes and index fields are prepared outside the store lock; the batch
+        is then applied in one short exclusive section, which also records a new version
+        per changed document. Index updates are queued on the background index
+        writer and become searchable within `index_flush_interval` seconds, without
+        blocking the caller.
+
         :param docs_to_add: Union[Document, List[Document]], The document or list of documents to add.
         :param refresh: bool, If True, forces an update even if the document appears unchanged, defaults to False
-        :param update_index: bool, If True, updates the Whoosh index. If False, only saves to the JSON store, defaults to True
+        :param update_index: bool, If True, queues the changed documents for the Whoosh indexes, defaults to True
+        :param save: bool, If True, persists the changes to disk, defaults to False
         """
-        if not isinstance(docs_to_add, list): 
+        if not isinstance(docs_to_add, list):
             docs_to_add = [docs_to_add]
-        
-        writer = None
-        if self.ix and self.indexed_metadata_keys and update_index:
-            writer = self.ix.writer()
-            writer = None 
-
-        changed = False
-        for doc in docs_to_add:
-            if refresh or doc.id not in self.documents or self.documents[doc.id] != doc:
+
+        # Compared by hash: the stored documents may be of another class (e.g. LazyDocument) than the added ones.
+        full_hashes = {doc.id: document_hash(doc) for doc in docs_to_add}
+        changed = [doc for doc in docs_to_add if refresh or not self._is_stored(doc.id, full_hashes[doc.id])]
+        if not changed:
+            return
+        # Documents stored before the version log existed get their first version on their first update.
+        self._record_missing_versions(self.documents[doc.id] for doc in changed if doc.id in self.documents)
+        prepared = [(doc, self._metadata_values(doc), content_hash(doc)) for doc in changed]
+
+        with self._lock.write():
+            for doc, values, doc_hash in prepared:
                 self.documents[doc.id] = doc
-                changed = True
-                
-                if writer: 
-                    doc_for_index = {'doc_id': doc.id}
-                    for key in self.indexed_metadata_keys:
-                        value = doc.metadata.get(key)
-                        doc_for_index[key] = str(value) if value is not None else None
-                    writer.update_document(**doc_for_index)
-        
-        if changed:
-            if writer: 
-                writer.commit()
-            if save:
-                self._save()
+                self._dirty_ids.add(doc.id)
+                self._removed_ids.discard(doc.id)
+                self._changed_since_base.add(doc.id)
+                self._index_values(doc.id, values)
+                self.versions.record(doc.id, doc_hash, full_hashes[doc.id])
+
+        if update_index:
+            for doc in changed:
+                if self.search_index:
+                    self.search_index.update(self._index_fields(doc))
+                if self.text_index:
+                    self.text_index.update(self._text_fields(doc))
+
+        if save:
+            self._save()
+
+    def remove(self, doc_ids: Union[str, Iterable[str]], update_index: bool = True, save: bool = False) -> List[str]:
+        """Removes documents from the store and its indexes.
+
+        Delta files cannot express a removal, so the next save compacts the store.
+        :param doc_ids: Union[str, Iterable[str]], The id or ids of the documents to remove.
+        :param update_index: bool, If True, queues the removals for the Whoosh indexes, defaults to True
+        :param save: bool, If True, persists the changes to disk, defaults to False
+        :return: List[str], The ids that were in the store and have been removed.
+        """
+        if isinstance(doc_ids, str):
+            doc_ids = [doc_ids]
+        doc_ids = list(doc_ids)
+        self._record_missing_versions(self.documents[doc_id] for doc_id in doc_ids if doc_id in self.documents)
+
+        removed = []
+        with self._lock.write():
+            for doc_id in doc_ids:
+                if self.documents.pop(doc_id, None) is None:
+                    continue
+                self.metadata_index.remove(doc_id)
+                self.taxonomy_index.remove(doc_id)
+                self._dirty_ids.discard(doc_id)
+                self._removed_ids.add(doc_id)
+                self._changed_since_base.add(doc_id)
+                self.versions.record(doc_id, None)
+                removed.append(doc_id)
+
+        if update_index:
+            for doc_id in removed:
+                for index in (self.search_index, self.text_index):
+                    if index:
+                        index.delete(doc_id)
+
+        if save and removed:
+            self._save()
+        return removed
+
+    def _is_stored(self, doc_id: str, full_hash: str) -> bool:
+        """Whether the store holds a document with this `document_hash`.
+        The hash of the latest version is used; only documents whose version predates it are hashed again.
+        """
+        if doc_id not in self.documents:
+            return False
+        latest = self.versions.latest(doc_id)
+        if latest is not None and latest.document_hash:
+            return latest.document_hash == full_hash
+        return document_hash(self.documents[doc_id]) == full_hash
+
+    def _record_missing_versions(self, docs: Iterable[Document]) -> int:
+        """Records a first version for stored documents that have none yet.
+        :param docs: Iterable[Document], Documents currently in the store.
+        :return: int, The number of versions recorded.
+        """
+        missing = [doc for doc in docs if self.versions.latest(doc.id) is None]
+        for doc in missing:
+            self.versions.record(doc.id, content_hash(doc), document_hash(doc))
+        return len(missing)
+
+    def classify_changes(self, docs: Iterable[Document]) -> Dict[str, List[str]]:
+        """Compares a complete export of the source with the store by content hash.
+
+        Documents are "new" if they are not in the store, "changed" if their source
+        content differs from the stored version and "unchanged" otherwise. Stored
+        documents missing from the export are "removed". Generated metadata such as
+        the summary is ignored (see versions.GENERATED_METADATA_KEYS), so only "new"
+        and "changed" documents need to be added, summarized and embedded again.
+        Nothing is modified; apply the result with `add` and `remove`.
+        :param docs: Iterable[Document], The documents of the export.
+        :return: Dict[str, List[str]], The document ids per class: "new", "changed", "unchanged" and "removed".
+        """
+        # Stores written before the version log existed are hashed once.
+        if self._record_missing_versions(self.get_all()):
+            self.versions.flush()
+
+        result: Dict[str, List[str]] = {NEW: [], CHANGED: [], UNCHANGED: [], REMOVED: []}
+        seen = set()
+        for doc in docs:
+            seen.add(doc.id)
+            latest = self.versions.latest(doc.id)
+            if doc.id not in self.documents or latest is None:
+                result[NEW].append(doc.id)
+            elif latest.content_hash != content_hash(doc):
+                result[CHANGED].append(doc.id)
+            else:
+                result[UNCHANGED].append(doc.id)
+        result[REMOVED] = [doc_id for doc_id in self.get_all_ids() if doc_id not in seen]
+        return result
+
+    def version(self, doc_id: str) -> Optional[int]:
+        """The current version number of a document, or None if it has no recorded version.
+
+        The version increases with every stored change, including generated metadata,
+        so it tells whether derived data such as embeddings is out of date.
+        """
+        return self.versions.version(doc_id)
+
+    def history(self, doc_id: str) -> List[DocumentVersion]:
+        """All recorded versions of a document, oldest first."""
+        return self.versions.history(doc_id)
+
+    def flush_index(self):
+        """Commits all queued index updates immediately."""
+        for index in (self.search_index, self.text_index):
+            if index:
+                index.flush()
     
     def search(self, query_string: str, limit: int = 10) -> List[Document]:
         """Searches the indexed metadata fields using a Whoosh query string.
@@ -134,107 +401,589 @@ class DocumentStore:
             print("Warning: No metadata keys were indexed. Cannot perform search.")
             return []
         results = []
-        with self.ix.searcher() as searcher:
-            query = self.query_parser.parse(query_string)
-            hits = searcher.search(query, limit=limit)
-            for hit in hits:
-                if doc := self.get(hit['doc_id']):
-                    results.append(doc)
+        for doc_id in self.search_index.search(query_string, limit=limit):
+            if doc := self.get(doc_id):
+                results.append(doc)
         return results
 
+    def search_text(
+        self,
+        query_string: str,
+        limit: int = 10,
+        snippet_chars: int = 300,
+        metadata_filter: Optional[Dict[str, Any]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Ranks documents by BM25 relevance of their title, question, summary and content.
+
+        Query terms are stemmed with the Dutch analyzer and OR-ed, so documents matching
+        more of the terms rank higher. Whoosh query syntax (quotes, AND, field:term) works too.
+        :param query_string: str, The keywords to search for.
+        :param limit: int, The maximum number of results, defaults to 10
+        :param snippet_chars: int, The approximate length of the snippet per result, defaults to 300
+        :param metadata_filter: Optional[Dict[str, Any]], Only return documents matching this filter
+                                (see `get_doc_ids_by_metadata`), defaults to None
+        :return: List[Dict[str, Any]], Per hit the 'document', its 'score' and a 'snippet' with the matched terms in bold.
+        """
+        if not self.text_index:
+            print("Warning: Full-text search is not enabled. Cannot perform search.")
+            return []
+        if not query_string or not query_string.strip():
+            return []
+
+        allowed_ids = self.get_doc_ids_by_metadata(metadata_filter) if metadata_filter else None
+
+        def _search(searcher):
+            # With a filter all hits are ranked and the allowed ones taken in order.
+            hits = searcher.search(
+                self.text_index.pool.parse(query_string), limit=None if allowed_ids is not None else limit, terms=True
+            )
+            hits.fragmenter = ContextFragmenter(maxchars=snippet_chars, surround=snippet_chars // 4)
+            hits.formatter = MarkdownFormatter()
+            results = []
+            for hit in hits:
+                if len(results) >= limit:
+                    break
+                if allowed_ids is not None and hit['doc_id'] not in allowed_ids:
+                    continue
+                doc = self.get(hit['doc_id'])
+                if doc is None:
+                    continue
+                content = doc.content or ""
+                summary = str(doc.metadata.get('summary') or "")
+                snippet = hit.highlights('content', text=content) or hit.highlights('summary', text=summary)
+                if not snippet:
+                    snippet = (summary or content)[:snippet_chars]
+                results.append({"document": doc, "score": hit.score, "snippet": snippet})
+            return results
+
+        return self.text_index.pool.with_searcher(_search)
+
     def clear(self):
         """Clears all documents from the store and the search index.
         
         This deletes the persistence file and rebuilds the Whoosh index from scratch.
         """
         print(f"Clearing DocumentStore at {self.store_path}...")
-        self.documents = {}
-        
-        if os.path.exists(self.persistence_file):
-            os.remove(self.persistence_file)
+        with self._save_lock, self._lock.write():
+            self.documents = {}
+            self.metadata_index.clear()
+            self.taxonomy_index.clear()
+            self._dirty_ids = set()
+            self._removed_ids = set()
+            self._changed_since_base = set()
+            self._delta_rows = 0
+            self.versions.clear()
+
+            self._snapshot_table = None
+            for path in (self.persistence_file, snapshot_path(self.persistence_file)):
+                if os.path.exists(path):
+                    os.remove(path)
+            if os.path.exists(self.delta_path):
+                shutil.rmtree(self.delta_path)
+            remove_dictionaries(self.store_path)
+            self._codecs = {}
+            if self.compress:
+                self._write_codec = HeavyFieldCodec()
             
-        if os.path.exists(self.index_path):
-            shutil.rmtree(self.index_path)
-        os.makedirs(self.index_path, exist_ok=True)
-        self.ix = create_in(self.index_path, self.schema)
+        for index in (self.search_index, self.text_index):
+            if index:
+                index.reset()
         
         print("DocumentStore cleared.")
 
     def get_doc_ids_by_metadata(self, metadata_filter: Dict[str, Any]) -> Set[str]:
         """Gets a set of document IDs that match a metadata filter.
         
-        This performs an exact match on all key-value pairs in the filter.
+        Each condition is an exact value or a dict with an `$in`, `$prefix` or `$path` operator;
+        list-valued metadata matches if any element does (see metadata_index). Conditions on indexed keys are
+        answered from the inverted index; the remaining conditions are checked on the
+        resulting candidates only.
         
         :param metadata_filter: Dict[str, Any], The key-value pairs to filter by.
         :return: Set[str], A set of matching document IDs.
         """
         if not metadata_filter:
             return set(self.get_all_ids())
-            
-        matching_ids = set()
-        for doc_id, doc in self.documents.items():
-            match = True
-            for key, value in metadata_filter.items():
-                if doc.metadata.get(key) != value:
-                    match = False
-                    break
-            if match:
+        with self._lock.read():
+            return self._match_metadata(metadata_filter)
+
+    def _match_metadata(self, metadata_filter: Dict[str, Any]) -> Set[str]:
+        """Evaluates a metadata filter. Must be called with the store lock held."""
+        indexed = {k: v for k, v in metadata_filter.items() if k in self.metadata_index.keys and self.metadata_index.indexable(v)}
+        remaining = {k: v for k, v in metadata_filter.items() if k not in indexed}
+        if indexed:
+            matching_ids = self.metadata_index.match(indexed)
+            if not remaining or not matching_ids:
+                return matching_ids
+            candidates = matching_ids
+            matching_ids = set()
+        else:
+            base_ids = self._filter_base(remaining)
+            if base_ids is not None:
+                # The base file is stale for documents changed since it was written.
+                candidates = self._changed_since_base
+                matching_ids = base_ids - candidates
+            else:
+                candidates = self.documents.keys()
+                matching_ids = set()
+
+        for doc_id in candidates:
+            doc = self.documents.get(doc_id)
+            if doc is None:
+                continue
+            if all(condition_matches(self._metadata_value(doc, k), v) for k, v in remaining.items()):
                 matching_ids.add(doc_id)
         return matching_ids
+
+    def resolve_taxonomy(self, criteria: Dict[str, Optional[str]], contains: bool = True) -> Dict[str, List[str]]:
+        """Resolves free text on the taxonomy levels to the exact values in the store (see taxonomy_index).
+        :param criteria: Dict[str, Optional[str]], Free text per taxonomy level, e.g. {"BELASTINGSOORT": "inkomsten"}.
+        :param contains: bool, Match values containing the text if True, starting with it otherwise, defaults to True
+        :return: Dict[str, List[str]], The matched values per given level.
+        """
+        with self._lock.read():
+            return self.taxonomy_index.resolve_path(criteria, contains=contains)
+
+    def get_doc_ids_by_taxonomy(self, criteria: Dict[str, Optional[str]], contains: bool = True) -> Set[str]:
+        """Gets the ids of documents matching free text on the taxonomy levels.
+
+        The text per level is resolved to exact values via the taxonomy index (see
+        taxonomy_index), which are then looked up as an IN filter.
+        :param criteria: Dict[str, Optional[str]], Free text per taxonomy level, e.g. {"BELASTINGSOORT": "inkomsten"}.
+        :param contains: bool, Match values containing the text if True, starting with it otherwise, defaults to True
+        :return: Set[str], The matching document ids.
+        """
+        with self._lock.read():
+            resolved = self.taxonomy_index.resolve_path(criteria, contains=contains)
+            if any(not values for values in resolved.values()):
+                return set()
+            if not resolved:
+                return set(self.documents)
+            return self._match_metadata({level: {"$in": values} for level, values in resolved.items()})
+
+    def facet_counts(self, key: str, parent: Optional[str] = None) -> Dict[Any, int]:
+        """Returns the number of documents per value of a metadata key.
+
+        The counts are kept up to date by the in-memory indexes on every add, so this
+        does not scan the documents. Conditional counts are available for the taxonomy:
+        e.g. the PROCES_ONDERWERP counts within one BELASTINGSOORT.
+        :param key: str, A taxonomy level or an indexed metadata key.
+        :param parent: Optional[str], For a taxonomy level, only count documents under this value of the level above, defaults to None
+        :return: Dict[Any, int], The number of documents per value.
+        :raises ValueError: If the key is neither a taxonomy level nor indexed, or a parent is given for a non-taxonomy key.
+        """
+        with self._lock.read():
+            if key in self.taxonomy_index.levels:
+                return self.taxonomy_index.counts(key, parent=parent)
+            if key in self.metadata_index.keys and parent is None:
+                return self.metadata_index.counts(key)
+        raise ValueError(f"No facet counts for '{key}'" + (f" within '{parent}'." if parent is not None else "."))
+
+    def search_taxonomy(self, criteria: Dict[str, Optional[str]], contains: bool = True, limit: Optional[int] = None) -> List[Document]:
+        """Returns the documents matching free text on the taxonomy levels, ordered by id.
+        :param criteria: Dict[str, Optional[str]], Free text per taxonomy level.
+        :param contains: bool, Match values containing the text if True, starting with it otherwise, defaults to True
+        :param limit: Optional[int], The maximum number of documents, defaults to None (all)
+        :return: List[Document], The matching documents.
+        """
+        doc_ids = sorted(self.get_doc_ids_by_taxonomy(criteria, contains=contains))
+        return [self.documents[doc_id] for doc_id in doc_ids[:limit] if doc_id in self.documents]
+
+    def _metadata_values(self, doc: Document) -> Dict[str, Any]:
+        """Reads the metadata values of a document needed by the in-memory indexes."""
+        return {key: self._metadata_value(doc, key) for key in self.metadata_index.keys | set(TAXONOMY_LEVELS)}
+
+    def _index_values(self, doc_id: str, values: Dict[str, Any]):
+        """Adds a document to the inverted metadata index and the taxonomy index. Must be called with the write lock held."""
+        self.metadata_index.add(doc_id, values)
+        self.taxonomy_index.add(doc_id, values)
+
+    def _filter_base(self, metadata_filter: Dict[str, Any]) -> Optional[Set[str]]:
+        """Evaluates a metadata filter on the typed columns of the base Parquet file.
+        :param metadata_filter: Dict[str, Any], The key-value pairs to filter by.
+        :return: Optional[Set[str]], The matching ids in the base file, or None if the filter cannot be pushed down.
+        """
+        if not os.path.exists(self.persistence_file):
+            return None
+        try:
+            if self._snapshot_table is not None:
+                expression = filter_expression(self._snapshot_table.column_names, metadata_filter)
+                if expression is None:
+                    return None
+                table = self._snapshot_table.filter(expression)
+            else:
+                expression = filter_expression(pq.read_schema(self.persistence_file).names, metadata_filter)
+                if expression is None:
+                    return None
+                table = pq.read_table(self.persistence_file, columns=['id'], filters=expression)
+        except Exception as e:
+            logger.warning(f"Metadata filter push-down failed, falling back to a scan: {e}")
+            return None
+        return set(table.column('id').to_pylist())
     
     def contains(self,id:str):
         return id in self.documents
+
+    @staticmethod
+    def _metadata_value(doc: Document, key: str) -> Any:
+        """Reads a single metadata value without loading heavy fields of lazy documents.
+        :param doc: Document, The document to read from.
+        :param key: str, The metadata key.
+        :return: Any, The value, or None if the key is not present.
+        """
+        if isinstance(doc, LazyDocument) and key not in HEAVY_METADATA_KEYS:
+            return doc.light_value(key)
+        return doc.metadata.get(key)
         
     def _load(self) -> Dict[str, Document]:
-        """Loads the document dictionary from a Parquet file.
+        """Loads the document dictionary from the Parquet base file and its deltas.
+
+        In lazy mode only the id, title and light metadata columns of the base file are
+        read and kept as shared columns; the remaining columns are fetched per row group
+        when a document is accessed.
+        Delta files are small and always loaded in full, later deltas overriding earlier ones.
         :return: Dict[str, Document], The dictionary of documents loaded from disk.
         """
         logger.info("Loading document store from disk")
-        if not os.path.exists(self.persistence_file):
-            return {}
-        try:
-            df = pd.read_parquet(self.persistence_file)
-            if df.empty:
+        documents = {}
+        if os.path.exists(self.persistence_file):
+            try:
+                documents = self._read_base()
+            except ImportError:
+                raise
+            except Exception as e:
+                print(f"Error loading Parquet file {self.persistence_file}: {e}. Returning empty store.")
                 return {}
 
-            df['metadata'] = df['metadata'].apply(json.loads)
-            
-            documents = {}
-            for record in df.to_dict('records'):
-                doc = SimpleDocument(**record) 
-                documents[doc.id] = doc
-            return documents
-        except Exception as e:
-            print(f"Error loading Parquet file {self.persistence_file}: {e}. Returning empty store.")
+        self._delta_rows = 0
+        self._changed_since_base = set()
+        for delta_file in self._delta_files():
+            try:
+                delta_docs = self._read_full(delta_file)
+            except ImportError:
+                raise
+            except Exception as e:
+                print(f"Error loading delta file {delta_file}: {e}. Skipping.")
+                continue
+            documents.update(delta_docs)
+            self._delta_rows += len(delta_docs)
+            self._changed_since_base.update(delta_docs)
+        return documents
+
+    def _open_snapshot(self) -> Optional[pa.Table]:
+        """Memory-maps the snapshot of the base file, (re)generating it if it is missing or stale."""
+        self._snapshot_table = None
+        if not self.snapshot:
+            return None
+        table = open_snapshot(self.persistence_file)
+        if table is None:
+            logger.info("Writing Arrow snapshot of the document store")
+            if write_snapshot(self.persistence_file):
+                table = open_snapshot(self.persistence_file)
+        self._snapshot_table = table
+        return table
+
+    def _read_base(self) -> Dict[str, Document]:
+        """Reads the base file, lazily or in full depending on the store mode.
+
+        The memory-mapped snapshot is used when available; otherwise the Parquet file is decoded.
+        """
+        table = self._open_snapshot()
+        if table is not None:
+            if table.num_rows == 0:
+                return {}
+            return self._lazy_documents(table, mapped=True) if self.lazy else self._table_documents(table)
+        if not self.lazy:
+            return self._read_full(self.persistence_file)
+
+        schema = pq.read_schema(self.persistence_file)
+        light_columns = [metadata_column(key) for key in LIGHT_METADATA_KEYS if metadata_column(key) in schema.names]
+        table = pq.read_table(self.persistence_file, columns=['id', 'title', 'metadata', *light_columns])
+        if table.num_rows == 0:
             return {}
-        
-    def _save(self):
-        """Saves the current document dictionary to a Parquet file."""
-        if not self.documents:
-            df = pd.DataFrame(columns=['id', 'title', 'content', 'metadata'])
+        return self._lazy_documents(table, mapped=False, codec=self._codec(schema.metadata))
+
+    def _lazy_documents(self, table: pa.Table, mapped: bool, codec: Optional[HeavyFieldCodec] = None) -> Dict[str, Document]:
+        """Creates LazyDocuments for the rows of the base file, sharing one MetadataColumns.
+
+        Every call gets its own loader, so documents created before a compaction keep
+        reading the file they were created from.
+        :param table: pa.Table, The base file or its snapshot, with at least the id, title and light metadata columns.
+        :param mapped: bool, Whether `table` is the memory-mapped snapshot holding all columns.
+        :param codec: Optional[HeavyFieldCodec], The codec of the base file, if it is compressed; read from the
+                      snapshot's schema metadata when mapped, defaults to None
+        :return: Dict[str, Document], The documents keyed by id.
+        """
+        columns = MetadataColumns(table)
+        if mapped:
+            loader = MappedFieldLoader(table, codec=self._codec(table.schema.metadata), decoded_cache_size=self.decoded_cache_size)
         else:
-            doc_list = [asdict(doc) for doc in self.documents.values()]
-            df = pd.DataFrame.from_records(doc_list)
-            
-            # Serialize the metadata dict to a JSON string for Parquet compatibility
-            df['metadata'] = df['metadata'].apply(json.dumps)
-        
+            loader = HeavyFieldLoader(
+                self.persistence_file, cache_size=self.cache_size, codec=codec, decoded_cache_size=self.decoded_cache_size
+            )
+            loader.open()
+        ids = table.column('id').to_pylist()
+        return {doc_id: LazyDocument(doc_id, row, columns, loader) for row, doc_id in enumerate(ids)}
+
+    def _read_full(self, path: str) -> Dict[str, Document]:
+        """Reads all columns of a document Parquet file into SimpleDocuments.
+        :param path: str, The Parquet file to read.
+        :return: Dict[str, Document], The documents in the file, keyed by id.
+        """
+        return self._table_documents(pq.read_table(path))
+
+    def _table_documents(self, table: pa.Table) -> Dict[str, Document]:
+        """Converts all rows of a documents table into SimpleDocuments, keyed by id, decompressing compressed fields."""
+        if table.num_rows == 0:
+            return {}
+
+        ids = table.column('id').to_pylist()
+        titles = table.column('title').to_pylist()
+        contents = table.column('content').to_pylist()
+        metadatas = table_to_metadata(table)
+        codec = self._codec(table.schema.metadata)
+        if codec is not None and COMPRESSED_COLUMN in table.column_names:
+            for i, blob in enumerate(table.column(COMPRESSED_COLUMN).to_pylist()):
+                if blob is None:
+                    continue
+                fields = codec.decode(blob)
+                contents[i] = fields.pop('content', contents[i])
+                metadatas[i].update(fields)
+        return {
+            doc_id: SimpleDocument(id=doc_id, title=title, content=content, metadata=metadata)
+            for doc_id, title, content, metadata in zip(ids, titles, contents, metadatas)
+        }
+
+    def _codec(self, schema_metadata: Optional[Dict[bytes, bytes]]) -> Optional[HeavyFieldCodec]:
+        """Returns the codec of a documents file from its schema metadata, or None if it is not compressed."""
+        dict_id = dictionary_id(schema_metadata)
+        if dict_id is None:
+            return None
+        if dict_id not in self._codecs:
+            self._codecs[dict_id] = load_codec(self.store_path, dict_id)
+        return self._codecs[dict_id]
+
+    def _base_codec(self) -> Optional[HeavyFieldCodec]:
+        """The codec of the base file, if it is compressed."""
+        if not os.path.exists(self.persistence_file):
+            return None
+        return self._codec(pq.read_schema(self.persistence_file).metadata)
+
+    def _train_codec(self, docs: List[Document]) -> HeavyFieldCodec:
+        """Trains a new zstd dictionary on a sample of the documents, spread evenly over the store."""
+        step = max(1, len(docs) // self.dictionary_samples)
+        payloads = []
+        for doc in docs[::step][:self.dictionary_samples]:
+            fields = {key: value for key, value in doc.metadata.items() if key in COMPRESSED_KEYS and isinstance(value, str)}
+            fields['content'] = doc.content
+            payloads.append(HeavyFieldCodec.payload(fields))
+        return HeavyFieldCodec.train(payloads)
+
+    def _delta_files(self) -> List[str]:
+        """Lists the delta files in the order they were written."""
+        if not os.path.isdir(self.delta_path):
+            return []
+        names = sorted(n for n in os.listdir(self.delta_path) if n.startswith("delta-") and n.endswith(".parquet"))
+        return [os.path.join(self.delta_path, n) for n in names]
+
+    def _write_documents(self, docs: List[Document], path: str, codec: Optional[HeavyFieldCodec] = None) -> Optional[pa.Table]:
+        """Writes documents to a Parquet file atomically.
+
+        Known metadata keys are written to typed columns (see document_schema) and the
+        file is written in row groups of `row_group_size`, so lazy stores can read them selectively.
+        :param docs: List[Document], The documents to write.
+        :param path: str, The target Parquet file.
+        :param codec: Optional[HeavyFieldCodec], The codec to compress with, defaults to the store's current codec
+        :return: Optional[pa.Table], The written table, or None if writing failed.
+        """
+        tmp_file = f"{path}.tmp"
+        codec = codec or self._write_codec
         try:
-            df.to_parquet(self.persistence_file, index=False, engine='pyarrow')
+            if codec is not None:
+                save_dictionary(self.store_path, codec)
+                self._codecs.setdefault(codec.dictionary_id, codec)
+            table = documents_to_table(docs, codec)
+            pq.write_table(table, tmp_file, row_group_size=self.row_group_size)
+            os.replace(tmp_file, path)
         except Exception as e:
-            print(f"Error saving Parquet file {self.persistence_file}: {e}")
+            print(f"Error saving Parquet file {path}: {e}")
+            return None
+        return table
+
+    def _needs_compaction(self, pending_rows: int) -> bool:
+        """Whether the deltas would grow large enough to rewrite the base file instead.
+        :param pending_rows: int, The number of rows about to be written as a delta.
+        :return: bool, True if the store should be compacted.
+        """
+        if not os.path.exists(self.persistence_file) or self._removed_ids:
+            return True
+        if len(self._delta_files()) >= self.max_delta_files:
+            return True
+        return self._delta_rows + pending_rows > self.compaction_ratio * max(1, len(self.documents))
+        
+    def _save(self):
+        """Persists the documents changed since the last save.
+
+        Changed documents are appended as a small delta file. When the deltas grow
+        beyond `compaction_ratio` of the store or `max_delta_files` files, or when
+        documents were removed, the whole store is compacted into a new base file
+        instead. The changed documents are taken under the store lock; the file is
+        written without holding it. The version log is appended once the documents are written.
+        """
+        with self._save_lock:
+            with self._lock.write():
+                if not self._dirty_ids and not self._removed_ids and os.path.exists(self.persistence_file):
+                    return
+                if self._needs_compaction(len(self._dirty_ids)):
+                    dirty_ids = None
+                else:
+                    dirty_ids, self._dirty_ids = self._dirty_ids, set()
+                    dirty = [self.documents[doc_id] for doc_id in dirty_ids if doc_id in self.documents]
+            if dirty_ids is None:
+                self._compact()
+                return
+
+            existing = self._delta_files()
+            sequence = int(os.path.basename(existing[-1])[6:-8]) + 1 if existing else 1
+            os.makedirs(self.delta_path, exist_ok=True)
+            delta_file = os.path.join(self.delta_path, f"delta-{sequence:06d}.parquet")
+            written = self._write_documents(dirty, delta_file) is not None
+            with self._lock.write():
+                if written:
+                    self._delta_rows += len(dirty)
+                else:
+                    self._dirty_ids |= dirty_ids
+            if written:
+                self.versions.flush()
+
+    def compact(self):
+        """Rewrites the base Parquet file and its snapshot from all documents and removes the delta files."""
+        with self._save_lock:
+            self._compact()
+
+    def _compact(self):
+        """Compacts the store. Must be called with the save lock held.
+
+        Documents added or removed while the new base file is written stay dirty or
+        removed, and count as changed since the new base.
+        """
+        with self._lock.write():
+            docs = list(self.documents.values())
+            dirty_ids, self._dirty_ids = self._dirty_ids, set()
+            removed_ids, self._removed_ids = self._removed_ids, set()
+
+        codec = self._train_codec(docs) if self.compress and docs else None
+        table = self._write_documents(docs, self.persistence_file, codec)
+        if table is None:
+            with self._lock.write():
+                self._dirty_ids |= dirty_ids
+                self._removed_ids |= removed_ids - self.documents.keys()
+            return
+        for delta_file in self._delta_files():
+            os.remove(delta_file)
+        if codec is not None:
+            self._write_codec = codec
+        # Documents still referencing an old dictionary hold its codec in memory.
+        remove_dictionaries(self.store_path, keep=[codec.dictionary_id] if codec else [])
+
+        snapshot_table = None
+        if self.snapshot and write_snapshot(self.persistence_file, table):
+            snapshot_table = open_snapshot(self.persistence_file)
+        lazy_docs = None
+        if self.lazy and table.num_rows:
+            # Point new documents at the new file and drop the in-memory fields.
+            if snapshot_table is not None:
+                lazy_docs = self._lazy_documents(snapshot_table, mapped=True)
+            else:
+                lazy_docs = self._lazy_documents(table, mapped=False, codec=self._codec(table.schema.metadata))
+
+        with self._lock.write():
+            self._delta_rows = 0
+            self._changed_since_base = self._dirty_ids | self._removed_ids
+            self._snapshot_table = snapshot_table
+            if lazy_docs is not None:
+                for doc_id in self._dirty_ids:
+                    lazy_docs[doc_id] = self.documents[doc_id]
+                for doc_id in self._removed_ids:
+                    lazy_docs.pop(doc_id, None)
+                self.documents = lazy_docs
+        self.versions.flush()
     
     def save(self):
-        """Public method to trigger a save of the document store."""
+        """Public method to persist the changes made since the last save."""
         self._save()
         
     def get(self, doc_id: str) -> Optional[Document]:
-        """Retrieves a single document by its ID.
+        """Retrieves a single document by its ID. Lock-free: a dict lookup is atomic.
         :param doc_id: str, The ID of the document to retrieve.
         :return: Optional[Document], The document if found, otherwise None.
         """
         return self.documents.get(doc_id)
         
+    def get_many(
+        self,
+        doc_ids: Iterable[str],
+        fields: Optional[Sequence[str]] = None,
+        as_table: bool = False,
+    ) -> Union[List[Document], List[Dict[str, Any]], pa.Table]:
+        """Retrieves a batch of documents in the order of `doc_ids`, optionally projected to some fields.
+
+        Unknown ids are skipped. With `fields`, only the requested fields are read: light
+        metadata of lazy documents comes from memory, and content and heavy metadata are
+        only fetched from disk when requested, once per document and in file order.
+        :param doc_ids: Iterable[str], The ids of the documents to retrieve.
+        :param fields: Optional[Sequence[str]], 'title', 'content', 'metadata' (the full dict) or metadata keys.
+                       Defaults to None, which returns the Document objects.
+        :param as_table: bool, If True, returns a pyarrow Table with an 'id' column and a column per field, defaults to False
+        :return: Union[List[Document], List[Dict[str, Any]], pa.Table], The documents, one dict per document
+                 with 'id' and the fields, or the same rows as a table.
+        """
+        documents = self.documents
+        docs = [doc for doc in (documents.get(doc_id) for doc_id in doc_ids) if doc is not None]
+        if fields is None and not as_table:
+            return docs
+        fields = list(fields) if fields is not None else ['title', *LIGHT_METADATA_KEYS]
+
+        heavy: Dict[str, Dict[str, Any]] = {}
+        if any(f in ('content', 'metadata') or f in HEAVY_METADATA_KEYS for f in fields):
+            lazy_docs = sorted((doc for doc in docs if isinstance(doc, LazyDocument)), key=lambda doc: doc.row)
+            heavy = {doc.id: doc.heavy_fields() for doc in lazy_docs}
+
+        rows = [self._project(doc, fields, heavy.get(doc.id)) for doc in docs]
+        if not as_table:
+            return rows
+        return pa.table({name: [row.get(name) for row in rows] for name in ['id', *fields]})
+
+    def _project(self, doc: Document, fields: Sequence[str], heavy: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Builds the projected row of a document for `get_many`.
+        :param doc: Document, The document.
+        :param fields: Sequence[str], The requested fields.
+        :param heavy: Optional[Dict[str, Any]], The prefetched heavy fields of a lazy document.
+        :return: Dict[str, Any], 'id' and the requested fields.
+        """
+        row: Dict[str, Any] = {'id': doc.id}
+        for field in fields:
+            if field == 'id':
+                continue
+            if field == 'title':
+                row[field] = doc.title
+            elif heavy is None:
+                if field == 'content':
+                    row[field] = doc.content
+                elif field == 'metadata':
+                    row[field] = doc.metadata
+                else:
+                    row[field] = doc.metadata.get(field)
+            elif field == 'content':
+                row[field] = heavy.get('content') or ""
+            elif field == 'metadata':
+                row[field] = {**doc.light_metadata, **{k: v for k, v in heavy.items() if k != 'content'}}
+            elif field in HEAVY_METADATA_KEYS:
+                row[field] = heavy.get(field)
+            else:
+                row[field] = doc.light_value(field)
+        return row
+
     def get_all(self) -> List['Document']:
         """Retrieves all documents from the store.
         :return: List[Document], A list of all documents.
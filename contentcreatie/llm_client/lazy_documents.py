@@ -0,0 +1,235 @@
+import json
+import sys
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from .document import Document
+from .compression import COMPRESSED_COLUMN, DecodedFieldCache, HeavyFieldCodec
+from .document_schema import HEAVY_METADATA_KEYS, LIGHT_METADATA_KEYS, METADATA_COLUMN_PREFIX, metadata_column
+
+class HeavyFieldLoader:
+    """Fetches heavy document fields from a Parquet file on demand.
+
+    Documents are located by their row in the file. Whole row groups are read with
+    a column projection and kept in a bounded LRU cache, so neighbouring documents
+    are served from memory. Compressed fields stay compressed in that cache and are
+    decoded per document on access.
+    """
+    def __init__(self, path: str, cache_size: int = 32, codec: Optional[HeavyFieldCodec] = None, decoded_cache_size: int = 256):
+        """
+        :param path: str, The Parquet file holding the documents.
+        :param cache_size: int, The maximum number of row groups kept in memory, defaults to 32
+        :param codec: Optional[HeavyFieldCodec], The codec of the file's compressed column, defaults to None
+        :param decoded_cache_size: int, The maximum number of decoded documents kept in memory, defaults to 256
+        """
+        self.path = path
+        self.cache_size = max(1, int(cache_size))
+        self._decoded = DecodedFieldCache(codec, decoded_cache_size) if codec else None
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[int, Dict[str, List[Any]]]" = OrderedDict()
+        self._row_group_starts: List[int] = []
+        self._file: Optional[pq.ParquetFile] = None
+        self._columns: List[str] = []
+
+    def open(self):
+        """(Re)opens the Parquet file, e.g. after it was rewritten."""
+        with self._lock:
+            self._cache.clear()
+            self._file = pq.ParquetFile(self.path)
+            names = set(self._file.schema_arrow.names)
+            self._columns = [c for c in heavy_columns() if c in names]
+
+            self._row_group_starts = []
+            start = 0
+            for rg in range(self._file.metadata.num_row_groups):
+                self._row_group_starts.append(start)
+                start += self._file.metadata.row_group(rg).num_rows
+
+    def _row_group(self, rg: int) -> Dict[str, List[Any]]:
+        """Returns the heavy columns of a row group, reading it from disk on a cache miss."""
+        cached = self._cache.get(rg)
+        if cached is not None:
+            self._cache.move_to_end(rg)
+            return cached
+        table = self._file.read_row_group(rg, columns=self._columns)
+        data = table.to_pydict()
+        self._cache[rg] = data
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return data
+
+    def fetch(self, row: int) -> Dict[str, Any]:
+        """Fetches the heavy fields of a single document.
+        :param row: int, The row of the document in the Parquet file.
+        :return: Dict[str, Any], 'content' and the non-null heavy metadata keys.
+        """
+        with self._lock:
+            if self._file is None or not self._row_group_starts:
+                return {}
+            rg = bisect_right(self._row_group_starts, row) - 1
+            offset = row - self._row_group_starts[rg]
+            data = self._row_group(rg)
+        return heavy_fields(row, {column: values[offset] for column, values in data.items()}, self._decoded)
+
+
+def heavy_columns() -> List[str]:
+    """The columns of a documents file that hold the heavy fields."""
+    return ["content", *map(metadata_column, HEAVY_METADATA_KEYS), COMPRESSED_COLUMN]
+
+
+def heavy_fields(row: int, values: Dict[str, Any], decoded: Optional[DecodedFieldCache]) -> Dict[str, Any]:
+    """Builds the heavy fields of a document from its values in the heavy columns.
+    :param row: int, The row of the document.
+    :param values: Dict[str, Any], The value per heavy column.
+    :param decoded: Optional[DecodedFieldCache], Decodes the compressed column, if the file has one.
+    :return: Dict[str, Any], 'content' and the non-null heavy metadata keys.
+    """
+    fields = {}
+    for column, value in values.items():
+        if value is None:
+            continue
+        if column == COMPRESSED_COLUMN:
+            if decoded is None:
+                raise ValueError("Document has compressed fields but no codec was given.")
+            fields.update(decoded.decode(row, value))
+            continue
+        key = column[len(METADATA_COLUMN_PREFIX):] if column.startswith(METADATA_COLUMN_PREFIX) else column
+        fields[key] = value
+    return fields
+
+
+def as_array(column: pa.ChunkedArray) -> pa.Array:
+    """A column as one array; single-chunk columns (e.g. of a mapped snapshot) are not copied."""
+    return column.chunk(0) if column.num_chunks == 1 else column.combine_chunks()
+
+
+class MetadataColumns:
+    """The titles and light metadata of a documents table, kept as shared columns.
+
+    Instead of a dict per document, every key is one column for all documents:
+    dictionary-encoded (categorical) keys as an int32 code array over a list of
+    interned values, other keys as Arrow arrays that are converted on access. The
+    JSON overflow column is parsed on access only.
+    """
+    def __init__(self, table: pa.Table, keys: Iterable[str] = LIGHT_METADATA_KEYS):
+        """
+        :param table: pa.Table, A documents table with at least the 'title' column, in document row order.
+        :param keys: Iterable[str], The typed metadata keys to keep, defaults to LIGHT_METADATA_KEYS
+        """
+        if any(table.column(name).num_chunks > 1 for name in table.column_names):
+            table = table.unify_dictionaries()
+        names = set(table.column_names)
+        self.num_rows = table.num_rows
+        self._titles = as_array(table.column('title'))
+        self._overflow = as_array(table.column('metadata')) if 'metadata' in names else None
+        self._categories: Dict[str, List[str]] = {}
+        self._codes: Dict[str, np.ndarray] = {}
+        self._arrays: Dict[str, pa.Array] = {}
+        for key in keys:
+            name = metadata_column(key)
+            if name not in names:
+                continue
+            column = table.column(name)
+            if pa.types.is_dictionary(column.type):
+                dictionary = column.chunk(0).dictionary if column.num_chunks else pa.array([], pa.string())
+                self._categories[key] = [sys.intern(v) for v in dictionary.to_pylist()]
+                codes = [chunk.indices.fill_null(-1).to_numpy(zero_copy_only=False) for chunk in column.chunks]
+                self._codes[key] = np.concatenate(codes).astype(np.int32) if codes else np.empty(0, np.int32)
+            else:
+                self._arrays[key] = as_array(column)
+        self.keys = tuple(k for k in keys if k in self._codes or k in self._arrays)
+
+    def title(self, row: int) -> str:
+        """The title of the document in a row."""
+        return self._titles[row].as_py()
+
+    def overflow(self, row: int) -> Dict[str, Any]:
+        """The metadata of a row that has no typed column, parsed from JSON."""
+        raw = self._overflow[row].as_py() if self._overflow is not None else None
+        return json.loads(raw) if raw else {}
+
+    def _typed(self, row: int, key: str) -> Any:
+        if key in self._codes:
+            code = self._codes[key][row]
+            return self._categories[key][code] if code >= 0 else None
+        return self._arrays[key][row].as_py()
+
+    def get(self, row: int, key: str, default: Any = None) -> Any:
+        """Reads a single metadata value of a row.
+        :param row: int, The row of the document.
+        :param key: str, The metadata key.
+        :param default: Any, Returned if the key is not present, defaults to None
+        :return: Any, The value.
+        """
+        if key in self.keys:
+            value = self._typed(row, key)
+            if value is not None:
+                return value
+        return self.overflow(row).get(key, default)
+
+    def row(self, row: int) -> Dict[str, Any]:
+        """Rebuilds the light metadata dict of a row."""
+        metadata = self.overflow(row)
+        for key in self.keys:
+            value = self._typed(row, key)
+            if value is not None:
+                metadata[key] = value
+        return metadata
+
+
+class LazyDocument(Document):
+    """A Document read from disk whose fields are served from shared columns and the loader.
+
+    Apart from its id, a LazyDocument only holds its row number: the title and light
+    metadata come from the store's MetadataColumns, the content and heavy metadata
+    are fetched by the HeavyFieldLoader on access.
+    """
+    __slots__ = ("_row", "_columns", "_loader")
+
+    def __init__(self, id: str, row: int, columns: MetadataColumns, loader: "HeavyFieldLoader | MappedFieldLoader"):
+        """
+        :param id: str, The unique identifier for the document.
+        :param row: int, The row of the document in the Parquet file and in `columns`.
+        :param columns: MetadataColumns, The shared titles and light metadata.
+        :param loader: HeavyFieldLoader | MappedFieldLoader, The loader used to fetch the heavy fields.
+        """
+        self.id = id
+        self._row = row
+        self._columns = columns
+        self._loader = loader
+
+    @property
+    def title(self) -> str:
+        return self._columns.title(self._row)
+
+    @property
+    def light_metadata(self) -> Dict[str, Any]:
+        """The metadata without the heavy keys, read without touching the disk."""
+        return self._columns.row(self._row)
+
+    def light_value(self, key: str) -> Any:
+        """Reads a single light metadata value without building the metadata dict."""
+        return self._columns.get(self._row, key)
+
+    @property
+    def row(self) -> int:
+        """The row of the document in the base file."""
+        return self._row
+
+    def heavy_fields(self) -> Dict[str, Any]:
+        """Fetches 'content' and the heavy metadata in a single read."""
+        return self._loader.fetch(self._row)
+
+    @property
+    def content(self) -> str:
+        return self._loader.fetch(self._row).get("content") or ""
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        heavy = self._loader.fetch(self._row)
+        heavy.pop("content", None)
+        return {**self.light_metadata, **heavy}
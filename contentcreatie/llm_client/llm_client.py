@@ -1,11 +1,23 @@
+import asyncio
 import json
+from array import array
+import weakref
 import openai
 import sys
-from typing import Callable, Optional, Dict, Any, List, Union
+from typing import Awaitable, Callable, Iterable, Iterator, Optional, Dict, Any, List, Tuple, Union
 from openai.types.chat import ChatCompletion
 from json_extractor import JsonExtractor
+from .rate_limit import RetryPolicy, deployment_limiter
+from .response_cache import CacheMissError, ResponseCache, fingerprint
+from .routing import Endpoint, EndpointRouter
+from .tokens import TokenBudget, TokenBudgetExceeded, TokenEstimator, UsageTracker
 from logging import getLogger
 
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
 logger = getLogger("Contenttransformatie")
 
 def json_post_process(raw_output: str) -> Any:
@@ -40,31 +52,109 @@ def json_decode(raw_output:str) -> Any:
 CLIENT_FACTORY = {
     "azure": {
         "class": openai.AzureOpenAI,
+        "async_class": openai.AsyncAzureOpenAI,
         "required_keys": {"api_key", "azure_endpoint", "api_version"},
     },
     "openrouter": {
         "class": openai.OpenAI,
+        "async_class": openai.AsyncOpenAI,
         "required_keys": {"api_key", "base_url"},
     },
     "local": {
         "class": openai.OpenAI,
+        "async_class": openai.AsyncOpenAI,
         "required_keys": {"api_key", "base_url"},
     },
     # Add a default for standard openai if needed
     "openai": {
         "class": openai.OpenAI,
+        "async_class": openai.AsyncOpenAI,
         "required_keys": {"api_key", "base_url"},
     },
 }
 
+# Completion tokens counted against the token quota when a request sets no maximum.
+DEFAULT_COMPLETION_TOKENS = 1024
+
+
+def _parsed(raw_response: Any) -> Tuple[Any, Any]:
+    """Splits a raw response of the openai client into the parsed response and its headers."""
+    return raw_response.parse(), raw_response.headers
+
+
+def _used_tokens(response: Any) -> Optional[int]:
+    """The total tokens reported in the usage of a response, if any."""
+    usage = getattr(response, "usage", None)
+    return getattr(usage, "total_tokens", None) if usage else None
+
 class _BaseProcessor:
-    """A base class to handle shared client creation logic."""
+    """A base class to handle shared client creation logic.
 
-    def _create_client(self, client_config: Dict[str, Any]) -> openai.OpenAI:
+    Besides the synchronous client, every processor has an async client per event
+    loop for the `a*` methods. Its HTTP connection pool is shared by all requests
+    on that loop and sized to `max_concurrency` when httpx is installed; a semaphore
+    keeps at most that many requests in flight, the rest wait for a slot.
+
+    All requests go through the DeploymentLimiter of the deployment (see rate_limit),
+    which is shared by every processor using the same endpoint and model: it keeps
+    within the request and token quotas, retries throttled and transient failures
+    with backoff and adapts the number of concurrent requests. The openai client's
+    own retries are therefore disabled.
+
+    A processor can be given several client configurations: deployments of the same
+    model on different endpoints. The EndpointRouter (see routing) then spreads the
+    requests over them by latency and available quota, and fails over to another
+    endpoint when one is throttled or failing.
+
+    With a ResponseCache, responses are stored under a fingerprint of the request and
+    identical requests are answered from the cache. A `bypass_cache` request skips the
+    lookup but still stores the fresh response; in offline mode a request that is not
+    cached raises CacheMissError instead of going to the API.
+    """
+
+    def _init_clients(
+        self,
+        client_config: Union[Dict[str, Any], List[Dict[str, Any]]],
+        model: str,
+        max_concurrency: int,
+        request_timeout: Optional[float],
+        requests_per_minute: Optional[int],
+        tokens_per_minute: Optional[int],
+        max_retries: int,
+    ):
+        """Creates the synchronous client and the limiter of every endpoint and the router over them, and prepares
+        the async clients, which are created on first use per event loop."""
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.request_timeout = request_timeout
+        endpoints = []
+        for config in (client_config if isinstance(client_config, list) else [client_config]):
+            name = config.get("azure_endpoint") or config.get("base_url") or config.get("type", "openai")
+            limiter = deployment_limiter(
+                f"{name}/{model}",
+                requests_per_minute=requests_per_minute,
+                tokens_per_minute=tokens_per_minute,
+                retry=RetryPolicy(max_retries=max_retries),
+            )
+            endpoints.append(Endpoint(name, config, self._create_client(config), limiter))
+        self._router = EndpointRouter(endpoints, RetryPolicy(max_retries=max_retries))
+        # The client of the first endpoint, for requests that are not routed (e.g. the Batch API).
+        self._client = endpoints[0].client
+        # Async clients (per endpoint) and semaphores are bound to the event loop they are used on.
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Tuple[Dict[str, Any], asyncio.Semaphore]]" = \
+            weakref.WeakKeyDictionary()
+
+    @property
+    def endpoints(self) -> List[Dict[str, Any]]:
+        """The health of the endpoints of the processor."""
+        return self._router.status()
+
+    def _create_client(self, client_config: Dict[str, Any], asynchronous: bool = False, http_client: Optional[Any] = None) -> openai.OpenAI:
         """
         Creates an OpenAI client from a configuration dictionary using a factory pattern.
         :param client_config: Dict[str, Any], Configuration containing a 'type' key and other credentials.
-        :return: openai.OpenAI, An initialized OpenAI client.
+        :param asynchronous: bool, If True, creates the async variant of the client, defaults to False
+        :param http_client: Optional[Any], The HTTP client of an async client, defaults to None
+        :return: openai.OpenAI, An initialized OpenAI client (openai.AsyncOpenAI if asynchronous).
         :raises ValueError: If the configuration is invalid or the type is unsupported.
         """
         client_type = client_config.get("type", "openai")
@@ -79,10 +169,76 @@ class _BaseProcessor:
             raise ValueError(f"{client_type} config is missing required keys: {', '.join(missing_keys)}")
 
         constructor_args = {key: client_config[key] for key in required_keys}
-        
-        ClientClass = factory_config["class"]
+        # Retries are done by the deployment limiter.
+        constructor_args["max_retries"] = 0
+        if http_client is not None:
+            constructor_args["http_client"] = http_client
+
+        ClientClass = factory_config["async_class" if asynchronous else "class"]
         return ClientClass(**constructor_args)
 
+    def _async_client(self, endpoint: Endpoint) -> Any:
+        """The async client of an endpoint on the running event loop."""
+        clients, _ = self._async_state()
+        client = clients.get(endpoint.name)
+        if client is None:
+            http_client = None
+            if httpx is not None:
+                limits = httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency)
+                http_client = openai.DefaultAsyncHttpxClient(limits=limits)
+            # Without httpx the client keeps its default pool; the semaphore still bounds the requests in flight.
+            client = clients[endpoint.name] = self._create_client(endpoint.config, asynchronous=True, http_client=http_client)
+        return client
+
+    def _async_state(self) -> Tuple[Dict[str, Any], asyncio.Semaphore]:
+        """The async clients by endpoint and the in-flight semaphore of the running event loop."""
+        loop = asyncio.get_running_loop()
+        state = self._async_clients.get(loop)
+        if state is None:
+            state = self._async_clients[loop] = ({}, asyncio.Semaphore(self.max_concurrency))
+        return state
+
+    def _route(self, request: Callable[[Any], Any], tokens: int, hold_slot: bool = False) -> Tuple[Any, Endpoint]:
+        """Runs a raw-response request on the synchronous client of an endpoint chosen by the router.
+        :param request: Callable[[Any], Any], Sends the request with `with_raw_response` on the given client.
+        :param tokens: int, The estimated tokens of the request.
+        :param hold_slot: bool, Keep the concurrency slot of the endpoint after the response headers, e.g. for a stream, defaults to False
+        :return: Tuple[Any, Endpoint], The parsed response and the endpoint that sent it.
+        """
+        return self._router.call(lambda endpoint: _parsed(request(endpoint.client)), tokens, _used_tokens, hold_slot=hold_slot)
+
+    def _call(self, request: Callable[[Any], Any], tokens: int) -> Any:
+        """Like `_route`, returning only the parsed response."""
+        return self._route(request, tokens)[0]
+
+    async def _limited(self, request: Callable[[Any], Awaitable[Any]], tokens: int, timeout: Optional[float]) -> Any:
+        """Runs a raw-response request on the async client of an endpoint chosen by the router once a slot is free.
+
+        The timeout covers each attempt of the request itself, not the wait for a slot. On a
+        timeout or when the calling task is cancelled, the request is cancelled and its slot freed.
+        :param request: Callable[[Any], Awaitable[Any]], Sends the request with `with_raw_response` on the given async client.
+        :param tokens: int, The estimated tokens of the request.
+        :param timeout: Optional[float], Seconds before the request is cancelled; defaults to `request_timeout` if None.
+        :return: Any, The parsed response.
+        :raises asyncio.TimeoutError: If an attempt takes longer than the timeout.
+        """
+        _, semaphore = self._async_state()
+        timeout = timeout if timeout is not None else self.request_timeout
+
+        async def _send(endpoint: Endpoint):
+            return _parsed(await asyncio.wait_for(request(self._async_client(endpoint)), timeout))
+
+        async with semaphore:
+            response, _ = await self._router.acall(_send, tokens, _used_tokens)
+            return response
+
+    async def aclose(self):
+        """Closes the async clients of the running event loop and their connections."""
+        state = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if state is not None:
+            for client in state[0].values():
+                await client.close()
+
 
 class LLMResult:
     """A smart wrapper for OpenAI ChatCompletion responses that auto-processes content."""
@@ -148,6 +304,154 @@ class LLMResult:
             """Gets token usage statistics for the request."""
             return dict(self.api_response.usage) if self.api_response.usage else {}
 
+class _StreamAssembler:
+    """Assembles the chunks of a streamed chat completion into a ChatCompletion.
+
+    Tool calls arrive in fragments: the first chunk of a call carries its index, id
+    and name, the following chunks only pieces of the JSON arguments.
+    """
+    def __init__(self):
+        self.id = ""
+        self.model = ""
+        self.created = 0
+        self.content: List[str] = []
+        self.tool_calls: Dict[int, Dict[str, Any]] = {}
+        self.finish_reason: Optional[str] = None
+        self.usage: Optional[Any] = None
+
+    def add(self, chunk: Any) -> Optional[str]:
+        """Adds a chunk.
+        :param chunk: Any, A ChatCompletionChunk.
+        :return: Optional[str], The content delta of the chunk, if any.
+        """
+        self.id = self.id or chunk.id
+        self.model = self.model or chunk.model
+        self.created = self.created or chunk.created
+        if getattr(chunk, "usage", None):
+            self.usage = chunk.usage
+        # Azure sends chunks without choices, e.g. with the content filter results of the prompt.
+        if not chunk.choices:
+            return None
+        choice = chunk.choices[0]
+        if choice.finish_reason:
+            self.finish_reason = choice.finish_reason
+        delta = choice.delta
+        for fragment in delta.tool_calls or []:
+            call = self.tool_calls.setdefault(
+                fragment.index, {"id": "", "type": "function", "function": {"name": "", "arguments": ""}}
+            )
+            if fragment.id:
+                call["id"] = fragment.id
+            if fragment.function:
+                call["function"]["name"] += fragment.function.name or ""
+                call["function"]["arguments"] += fragment.function.arguments or ""
+        if delta.content:
+            self.content.append(delta.content)
+            return delta.content
+        return None
+
+    def completion(self) -> ChatCompletion:
+        """The completion assembled from the chunks added so far."""
+        tool_calls = [self.tool_calls[index] for index in sorted(self.tool_calls)]
+        return ChatCompletion.model_validate({
+            "id": self.id,
+            "object": "chat.completion",
+            "created": self.created,
+            "model": self.model,
+            "choices": [{
+                "index": 0,
+                "finish_reason": self.finish_reason or ("tool_calls" if tool_calls else "stop"),
+                "message": {
+                    "role": "assistant",
+                    "content": "".join(self.content) or None,
+                    "tool_calls": tool_calls or None,
+                },
+            }],
+            "usage": self.usage.model_dump() if self.usage is not None else None,
+        })
+
+
+class ChatStream:
+    """A streamed chat completion.
+
+    Iterating yields the content deltas as they arrive. Once the stream is consumed,
+    `result` holds the LLMResult of the complete response, including the assembled
+    tool calls. The concurrency slot of the request is held until the stream is
+    consumed, fails, or is closed.
+    """
+    def __init__(
+        self,
+        chunks: Iterable[Any],
+        finish: Callable[[ChatCompletion], LLMResult],
+        release: Optional[Callable[[bool], None]] = None,
+    ):
+        """
+        :param chunks: Iterable[Any], The ChatCompletionChunks of the response.
+        :param finish: Callable[[ChatCompletion], LLMResult], Wraps the assembled completion.
+        :param release: Optional[Callable[[bool], None]], Frees the concurrency slot; receives whether the stream was read completely, defaults to None
+        """
+        self._chunks = chunks
+        self._finish = finish
+        self._release = release
+        self.result: Optional[LLMResult] = None
+
+    @classmethod
+    def completed(cls, result: LLMResult) -> "ChatStream":
+        """A stream of an already complete response, e.g. from the cache, which yields its content at once."""
+        stream = cls([], lambda completion: result)
+        stream.result = result
+        return stream
+
+    def __iter__(self) -> Iterator[str]:
+        if self.result is not None:
+            if self.result.raw_content:
+                yield self.result.raw_content
+            return
+        assembler = _StreamAssembler()
+        completed = False
+        try:
+            for chunk in self._chunks:
+                delta = assembler.add(chunk)
+                if delta:
+                    yield delta
+            completed = True
+        finally:
+            self._close_chunks()
+            self._free(completed)
+        self.result = self._finish(assembler.completion())
+
+    def _free(self, success: bool):
+        """Frees the concurrency slot, once."""
+        release, self._release = self._release, None
+        if release is not None:
+            release(success)
+
+    def _close_chunks(self):
+        close = getattr(self._chunks, "close", None)
+        if close is not None:
+            close()
+
+    def close(self):
+        """Stops reading the stream and frees its concurrency slot, e.g. when the answer is no longer needed."""
+        if self._release is not None:
+            self._close_chunks()
+            self._free(False)
+
+    def __del__(self):
+        # A stream that is dropped without being read must not keep its slot.
+        if getattr(self, "_release", None) is not None:
+            self._free(False)
+
+    def until_done(self) -> LLMResult:
+        """Consumes the rest of the stream.
+        :return: LLMResult, The complete response.
+        """
+        if self.result is None:
+            for _ in self:
+                pass
+        return self.result
+
+
 REASONING_MODELS = ["gpt-5-mini", "gpt-5"]
 
 class LLMProcessor(_BaseProcessor):
@@ -155,44 +459,55 @@ class LLMProcessor(_BaseProcessor):
     def __init__(
         self,
         model: str,
-        client_config: Dict[str, Any],
+        client_config: Union[Dict[str, Any], List[Dict[str, Any]]],
         system_prompt: Optional[str] = None,
         default_post_process: Optional[Callable[[str], Any]] = None,
         temperature: float = 1.0,
+        max_concurrency: int = 16,
+        request_timeout: Optional[float] = None,
+        requests_per_minute: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None,
+        max_retries: int = 6,
+        cache: Optional[ResponseCache] = None,
+        max_prompt_tokens: Optional[int] = None,
+        usage_tracker: Optional[UsageTracker] = None,
     ):
         """
         Initializes the LLMProcessor.
         :param model: str, The model name to use for completions.
-        :param client_config: Dict[str, Any], The configuration for the OpenAI client.
+        :param client_config: Union[Dict[str, Any], List[Dict[str, Any]]], The configuration for the OpenAI client, or one per endpoint to route the requests over.
         :param system_prompt: Optional[str], An optional default system prompt.
         :param default_post_process: Optional[Callable[[str], Any]], A default processor for all results.
         :param temperature: float, The sampling temperature to use.
+        :param max_concurrency: int, The maximum number of `aprocess` requests in flight per event loop, defaults to 16
+        :param request_timeout: Optional[float], Default seconds before an `aprocess` request is cancelled, defaults to None (no limit)
+        :param requests_per_minute: Optional[int], The request quota of the deployment; learned from the response headers if None
+        :param tokens_per_minute: Optional[int], The token quota of the deployment; learned from the response headers if None
+        :param max_retries: int, Retries of a throttled or failed request; the first processor of a deployment sets it, defaults to 6
+        :param cache: Optional[ResponseCache], A cache of the completions, defaults to None (no caching)
+        :param max_prompt_tokens: Optional[int], Requests with a larger estimated prompt are refused before they are sent, defaults to None (no limit)
+        :param usage_tracker: Optional[UsageTracker], Aggregates the token usage, e.g. shared with other processors, defaults to a new tracker
         """
         self.model = model
         self.system_prompt = system_prompt
         self.default_post_process = default_post_process
         self.temperature = temperature
-        self._client = self._create_client(client_config)
-        self.usage = []
+        self._init_clients(
+            client_config, model, max_concurrency, request_timeout, requests_per_minute, tokens_per_minute, max_retries
+        )
+        self.cache = cache
+        self.max_prompt_tokens = max_prompt_tokens
+        self.estimator = TokenEstimator(model)
+        self.usage = usage_tracker if usage_tracker is not None else UsageTracker()
 
-    def process(
+    def _request_params(
         self,
         messages: List[Dict[str, Any]],
-        post_process: Optional[Callable[[str], Any]] = None,
-        max_completion_tokens: Optional[int] = None,
-        reasoning_effort: Optional[str] = "low",
-        **kwargs: Any
-    ) -> LLMResult:
-        """
-        Sends a request to the model and returns a wrapped LLMResult.
-        :param messages: List[Dict[str, Any]], A list of messages for the API.
-        :param post_process: Optional[Callable[[str], Any]], A processor for this response.
-        :param max_completion_tokens: Optional[int], The maximum number of tokens to generate.
-        :param reasoning_effort: Optional[str], Reasoning effort for capable models.
-        :return: LLMResult, An LLMResult object wrapping the API response.
-        """
-        processor_to_use = post_process if post_process is not None else self.default_post_process
-        
+        max_completion_tokens: Optional[int],
+        reasoning_effort: Optional[str],
+        kwargs: Dict[str, Any],
+    ) -> Dict[str, Any]:
+        """Builds the Chat Completion request, adding the system prompt if the messages have none."""
         full_messages = messages[:]
         if self.system_prompt and not any(m['role'] == 'system' for m in full_messages):
             full_messages.insert(0, {"role": "system", "content": self.system_prompt})
@@ -208,38 +523,329 @@ class LLMProcessor(_BaseProcessor):
             request_params['reasoning_effort'] = reasoning_effort
         if max_completion_tokens is not None:
             request_params["max_tokens"] = max_completion_tokens
-        
+        return request_params
+
+    def prompt_tokens(self, messages: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]] = None) -> int:
+        """
+        Estimates the prompt tokens of a request with the tokenizer of the model.
+        :param messages: List[Dict[str, Any]], The messages of the request.
+        :param tools: Optional[List[Dict[str, Any]]], The tool schemas of the request, defaults to None
+        :return: int, The estimated prompt tokens.
+        """
+        return self.estimator.count_messages(messages, tools)
+
+    def _admit(self, request_params: Dict[str, Any], budget: Optional[TokenBudget]) -> int:
+        """Checks a request against the prompt limit and the session budget before it is sent.
+        :return: int, The estimated tokens of the request (prompt and completion) for the token quota.
+        :raises TokenBudgetExceeded: If the prompt is too large or the request does not fit the budget.
+        """
+        prompt = self.prompt_tokens(request_params["messages"], request_params.get("tools"))
+        if self.max_prompt_tokens is not None and prompt > self.max_prompt_tokens:
+            raise TokenBudgetExceeded(f"Prompt of ~{prompt} tokens exceeds the limit of {self.max_prompt_tokens} tokens of {self.model}")
+        if budget is not None:
+            budget.check(prompt + (request_params.get("max_tokens") or 0))
+        return prompt + (request_params.get("max_tokens") or DEFAULT_COMPLETION_TOKENS)
+
+    def _cached(self, request_params: Dict[str, Any], bypass_cache: bool) -> Tuple[Optional[str], Optional[ChatCompletion]]:
+        """Looks up a request in the cache.
+        :return: Tuple[Optional[str], Optional[ChatCompletion]], The cache key (None without a cache) and the cached completion, if any.
+        :raises CacheMissError: If the cache is offline and the request is not cached.
+        """
+        if self.cache is None:
+            return None, None
+        key = fingerprint("chat", request_params)
+        if not bypass_cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return key, ChatCompletion.model_validate_json(cached)
+        if self.cache.offline:
+            raise CacheMissError(f"Chat completion {key} of {self.model} is not cached")
+        return key, None
 
-        completion = self._client.chat.completions.create(**request_params)
+    def _result(
+        self,
+        completion: ChatCompletion,
+        post_process: Optional[Callable[[str], Any]],
+        cache_key: Optional[str] = None,
+        cached: bool = False,
+        budget: Optional[TokenBudget] = None,
+        usage_tags: Optional[Dict[str, str]] = None,
+    ) -> LLMResult:
+        """Wraps a completion, stores a fresh completion in the cache, records its usage and charges the budget."""
+        processor_to_use = post_process if post_process is not None else self.default_post_process
         result = LLMResult(response=completion, processor=processor_to_use)
+        if cached:
+            logger.info(f"Chat completion from cache {cache_key}")
+            return result
+        if cache_key is not None:
+            self.cache.put(cache_key, completion.model_dump_json().encode('utf-8'))
         logger.info(f"Performing chat completion {result.usage}")
-        self.usage.append(result.usage)
+        self.usage.record(self.model, result.usage, usage_tags)
+        if budget is not None:
+            budget.charge(result.usage.get("total_tokens") or 0)
         return result
 
+    def process(
+        self,
+        messages: List[Dict[str, Any]],
+        post_process: Optional[Callable[[str], Any]] = None,
+        max_completion_tokens: Optional[int] = None,
+        reasoning_effort: Optional[str] = "low",
+        bypass_cache: bool = False,
+        budget: Optional[TokenBudget] = None,
+        usage_tags: Optional[Dict[str, str]] = None,
+        **kwargs: Any
+    ) -> LLMResult:
+        """
+        Sends a request to the model and returns a wrapped LLMResult.
+        :param messages: List[Dict[str, Any]], A list of messages for the API.
+        :param post_process: Optional[Callable[[str], Any]], A processor for this response.
+        :param max_completion_tokens: Optional[int], The maximum number of tokens to generate.
+        :param reasoning_effort: Optional[str], Reasoning effort for capable models.
+        :param bypass_cache: bool, If True, sends the request even if it is cached and caches the new response, defaults to False
+        :param budget: Optional[TokenBudget], The token budget of the session, checked before and charged after the request, defaults to None
+        :param usage_tags: Optional[Dict[str, str]], Attributes to aggregate the usage by, e.g. {"agent": "search"}, defaults to None
+        :return: LLMResult, An LLMResult object wrapping the API response.
+        :raises CacheMissError: If the cache is offline and the request is not cached.
+        :raises TokenBudgetExceeded: If the prompt is too large or the request does not fit the budget.
+        """
+        request_params = self._request_params(messages, max_completion_tokens, reasoning_effort, kwargs)
+        cache_key, completion = self._cached(request_params, bypass_cache)
+        if completion is not None:
+            return self._result(completion, post_process, cache_key, cached=True)
+        completion = self._call(
+            lambda client: client.chat.completions.with_raw_response.create(**request_params),
+            self._admit(request_params, budget),
+        )
+        return self._result(completion, post_process, cache_key, budget=budget, usage_tags=usage_tags)
+
+    def batch_request(
+        self,
+        custom_id: str,
+        messages: List[Dict[str, Any]],
+        max_completion_tokens: Optional[int] = None,
+        reasoning_effort: Optional[str] = "low",
+        url: str = "/v1/chat/completions",
+        **kwargs: Any
+    ) -> Dict[str, Any]:
+        """
+        Builds one line of a Batch API input file with the same request `process` would send.
+        :param custom_id: str, Identifies the request in the output file.
+        :param messages: List[Dict[str, Any]], A list of messages for the API.
+        :param max_completion_tokens: Optional[int], The maximum number of tokens to generate.
+        :param reasoning_effort: Optional[str], Reasoning effort for capable models.
+        :param url: str, The endpoint of the batch, defaults to "/v1/chat/completions" (Azure uses "/chat/completions")
+        :return: Dict[str, Any], The line as a dictionary.
+        """
+        body = self._request_params(messages, max_completion_tokens, reasoning_effort, kwargs)
+        return {"custom_id": custom_id, "method": "POST", "url": url, "body": body}
+
+    def batch_result(self, body: Dict[str, Any], post_process: Optional[Callable[[str], Any]] = None) -> LLMResult:
+        """
+        Wraps the response body of a line of a Batch API output file like a response of `process`.
+        :param body: Dict[str, Any], The `response.body` of the line.
+        :param post_process: Optional[Callable[[str], Any]], A processor for this response.
+        :return: LLMResult, An LLMResult object wrapping the response.
+        """
+        return self._result(ChatCompletion.model_validate(body), post_process)
+
+    def stream(
+        self,
+        messages: List[Dict[str, Any]],
+        post_process: Optional[Callable[[str], Any]] = None,
+        max_completion_tokens: Optional[int] = None,
+        reasoning_effort: Optional[str] = "low",
+        bypass_cache: bool = False,
+        budget: Optional[TokenBudget] = None,
+        usage_tags: Optional[Dict[str, str]] = None,
+        **kwargs: Any
+    ) -> ChatStream:
+        """
+        Sends a streaming request to the model. The request waits for the deployment limiter
+        like `process`; the returned stream yields the content as it arrives.
+        :param messages: List[Dict[str, Any]], A list of messages for the API.
+        :param post_process: Optional[Callable[[str], Any]], A processor for this response.
+        :param max_completion_tokens: Optional[int], The maximum number of tokens to generate.
+        :param reasoning_effort: Optional[str], Reasoning effort for capable models.
+        :param bypass_cache: bool, If True, sends the request even if it is cached and caches the new response, defaults to False
+        :param budget: Optional[TokenBudget], The token budget of the session, checked before and charged after the request, defaults to None
+        :param usage_tags: Optional[Dict[str, str]], Attributes to aggregate the usage by, e.g. {"agent": "search"}, defaults to None
+        :return: ChatStream, The content deltas; its `result` is set once the stream is consumed.
+        :raises CacheMissError: If the cache is offline and the request is not cached.
+        :raises TokenBudgetExceeded: If the prompt is too large or the request does not fit the budget.
+        """
+        request_params = self._request_params(messages, max_completion_tokens, reasoning_effort, kwargs)
+        cache_key, completion = self._cached(request_params, bypass_cache)
+        if completion is not None:
+            return ChatStream.completed(self._result(completion, post_process, cache_key, cached=True))
+
+        estimate = self._admit(request_params, budget)
+        stream_params = {**request_params, "stream": True}
+        stream_params.setdefault("stream_options", {"include_usage": True})
+        chunks, endpoint = self._route(
+            lambda client: client.chat.completions.with_raw_response.create(**stream_params), estimate, hold_slot=True
+        )
+
+        def finish(completion: ChatCompletion) -> LLMResult:
+            # The limiter only knows the estimate; correct it by the usage reported in the last chunk.
+            used = _used_tokens(completion)
+            if used is not None:
+                endpoint.limiter.tokens.adjust(used - estimate)
+            return self._result(completion, post_process, cache_key, budget=budget, usage_tags=usage_tags)
+
+        # The slot is held while the stream is read, so the adaptive concurrency counts open streams.
+        return ChatStream(chunks, finish, lambda success: endpoint.limiter.concurrency.release(success=success))
+
+    async def aprocess(
+        self,
+        messages: List[Dict[str, Any]],
+        post_process: Optional[Callable[[str], Any]] = None,
+        max_completion_tokens: Optional[int] = None,
+        reasoning_effort: Optional[str] = "low",
+        timeout: Optional[float] = None,
+        bypass_cache: bool = False,
+        budget: Optional[TokenBudget] = None,
+        usage_tags: Optional[Dict[str, str]] = None,
+        **kwargs: Any
+    ) -> LLMResult:
+        """
+        Async variant of `process`. At most `max_concurrency` requests are in flight per
+        event loop; cancelling the awaiting task cancels the request.
+        :param messages: List[Dict[str, Any]], A list of messages for the API.
+        :param post_process: Optional[Callable[[str], Any]], A processor for this response.
+        :param max_completion_tokens: Optional[int], The maximum number of tokens to generate.
+        :param reasoning_effort: Optional[str], Reasoning effort for capable models.
+        :param timeout: Optional[float], Seconds before the request is cancelled, defaults to `request_timeout`
+        :param bypass_cache: bool, If True, sends the request even if it is cached and caches the new response, defaults to False
+        :param budget: Optional[TokenBudget], The token budget of the session, checked before and charged after the request, defaults to None
+        :param usage_tags: Optional[Dict[str, str]], Attributes to aggregate the usage by, e.g. {"agent": "search"}, defaults to None
+        :return: LLMResult, An LLMResult object wrapping the API response.
+        :raises asyncio.TimeoutError: If the request takes longer than the timeout.
+        :raises CacheMissError: If the cache is offline and the request is not cached.
+        :raises TokenBudgetExceeded: If the prompt is too large or the request does not fit the budget.
+        """
+        request_params = self._request_params(messages, max_completion_tokens, reasoning_effort, kwargs)
+        cache_key, completion = self._cached(request_params, bypass_cache)
+        if completion is not None:
+            return self._result(completion, post_process, cache_key, cached=True)
+        completion = await self._limited(
+            lambda client: client.chat.completions.with_raw_response.create(**request_params),
+            self._admit(request_params, budget),
+            timeout,
+        )
+        return self._result(completion, post_process, cache_key, budget=budget, usage_tags=usage_tags)
+
 class EmbeddingProcessor(_BaseProcessor):
     """A client for generating embeddings."""
     def __init__(
         self,
         embedding_model: str,
-        client_config: Dict[str, Any],
+        client_config: Union[Dict[str, Any], List[Dict[str, Any]]],
+        dimensions: Optional[int] = None,
+        native_dimension: Optional[int] = None,
+        max_concurrency: int = 16,
+        request_timeout: Optional[float] = None,
+        requests_per_minute: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None,
+        max_retries: int = 6,
+        cache: Optional[ResponseCache] = None,
+        usage_tracker: Optional[UsageTracker] = None,
     ):
         """
         Initializes the EmbeddingProcessor.
         :param embedding_model: str, The embedding model to use.
-        :param client_config: Dict[str, Any], The configuration for the OpenAI client.
+        :param client_config: Union[Dict[str, Any], List[Dict[str, Any]]], The configuration for the OpenAI client, or one per endpoint to route the requests over.
+        :param dimensions: Optional[int], If set, sent as the `dimensions` request parameter to shorten the vectors.
+        :param native_dimension: Optional[int], The known output dimension of the model (see Settings.embedding_dimensions).
+        :param max_concurrency: int, The maximum number of `aembed` requests in flight per event loop, defaults to 16
+        :param request_timeout: Optional[float], Default seconds before an `aembed` request is cancelled, defaults to None (no limit)
+        :param requests_per_minute: Optional[int], The request quota of the deployment; learned from the response headers if None
+        :param tokens_per_minute: Optional[int], The token quota of the deployment; learned from the response headers if None
+        :param max_retries: int, Retries of a throttled or failed request; the first processor of a deployment sets it, defaults to 6
+        :param cache: Optional[ResponseCache], A cache of the vectors per text, defaults to None (no caching)
+        :param usage_tracker: Optional[UsageTracker], Aggregates the token usage, e.g. shared with other processors, defaults to a new tracker
         """
         self.embedding_model = embedding_model
-        self._client = self._create_client(client_config)
+        self.dimensions = dimensions
+        self.native_dimension = native_dimension
+        self._init_clients(
+            client_config, embedding_model, max_concurrency, request_timeout, requests_per_minute, tokens_per_minute, max_retries
+        )
+        self.cache = cache
+        self.estimator = TokenEstimator(embedding_model)
+        self.usage = usage_tracker if usage_tracker is not None else UsageTracker()
+
+    @property
+    def dimension(self) -> Optional[int]:
+        """The dimension of the vectors returned by `embed`, or None if it is not known without a request."""
+        return self.dimensions or self.native_dimension
+
+    def _request_params(self, input_texts: List[str], kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """Builds the embeddings request."""
+        if self.dimensions and "dimensions" not in kwargs:
+            kwargs["dimensions"] = self.dimensions
+        return {"model": self.embedding_model, "input": input_texts, **kwargs}
+
+    def _estimate_tokens(self, input_texts: List[str]) -> int:
+        """Estimates the tokens of the input texts for the token quota."""
+        return sum(self.estimator.count(text) for text in input_texts) + 1
+
+    def _cached(
+        self, request_params: Dict[str, Any], bypass_cache: bool
+    ) -> Tuple[List[str], Dict[str, List[float]], Optional[Dict[str, Any]]]:
+        """Looks up the vectors of the input texts in the cache, each text under its own key.
+        :return: Tuple[List[str], Dict[str, List[float]], Optional[Dict[str, Any]]], The cache key per input text,
+            the cached vectors by key and the request for the texts that are not cached (None if all are).
+        :raises CacheMissError: If the cache is offline and a text is not cached.
+        """
+        if self.cache is None:
+            return [], {}, request_params
+        params = {key: value for key, value in request_params.items() if key != "input"}
+        keys = [fingerprint("embedding", params, text) for text in request_params["input"]]
+        vectors = {} if bypass_cache else {
+            key: array('f', value).tolist() for key, value in self.cache.get_many(keys).items()
+        }
+        missing = list(dict.fromkeys(
+            text for text, key in zip(request_params["input"], keys) if key not in vectors
+        ))
+        if not missing:
+            logger.info(f"Embeddings of {len(keys)} texts from cache")
+            return keys, vectors, None
+        if self.cache.offline:
+            raise CacheMissError(f"Embeddings of {len(missing)} texts of {self.embedding_model} are not cached")
+        return keys, vectors, {**request_params, "input": missing}
+
+    def _merge(
+        self, keys: List[str], vectors: Dict[str, List[float]], request: Optional[Dict[str, Any]], response: Any
+    ) -> List[List[float]]:
+        """Records the usage, stores the fresh vectors in the cache and returns the vectors of all input texts in order."""
+        embeddings = [item.embedding for item in response.data] if response is not None else []
+        if response is not None:
+            self.usage.record(self.embedding_model, dict(response.usage) if getattr(response, "usage", None) else {})
+        if self.cache is None:
+            return embeddings
+        if request is not None:
+            params = {key: value for key, value in request.items() if key != "input"}
+            fresh = [
+                (fingerprint("embedding", params, text), embedding)
+                for text, embedding in zip(request["input"], embeddings)
+            ]
+            vectors.update(fresh)
+            self.cache.put_many([(key, array('f', embedding).tobytes()) for key, embedding in fresh])
+        return [vectors[key] for key in keys]
 
     def embed(
         self,
         texts: Union[str, List[str]],
+        bypass_cache: bool = False,
         **kwargs: Any
     ) -> Union[List[float], List[List[float]]]:
         """
-        Generates embeddings for the given text(s).
+        Generates embeddings for the given text(s). With a cache, only the texts that are not cached are sent.
         :param texts: Union[str, List[str]], A single string or a list of strings to embed.
+        :param bypass_cache: bool, If True, embeds all texts even if they are cached and caches the new vectors, defaults to False
         :return: Union[List[float], List[List[float]]], An embedding vector or a list of vectors.
+        :raises CacheMissError: If the cache is offline and a text is not cached.
         """
         is_single_string = isinstance(texts, str)
         input_texts = [texts] if is_single_string else texts
@@ -247,11 +853,47 @@ class EmbeddingProcessor(_BaseProcessor):
         if not input_texts:
             return []
 
-        response = self._client.embeddings.create(
-            model=self.embedding_model,
-            input=input_texts,
-            **kwargs
-        )
+        keys, vectors, request = self._cached(self._request_params(input_texts, kwargs), bypass_cache)
+        response = None
+        if request is not None:
+            response = self._call(
+                lambda client: client.embeddings.with_raw_response.create(**request),
+                self._estimate_tokens(request["input"]),
+            )
+
+        embeddings = self._merge(keys, vectors, request, response)
+        return embeddings[0] if is_single_string else embeddings
+
+    async def aembed(
+        self,
+        texts: Union[str, List[str]],
+        timeout: Optional[float] = None,
+        bypass_cache: bool = False,
+        **kwargs: Any
+    ) -> Union[List[float], List[List[float]]]:
+        """
+        Async variant of `embed`, limited to `max_concurrency` requests in flight per event loop.
+        :param texts: Union[str, List[str]], A single string or a list of strings to embed.
+        :param timeout: Optional[float], Seconds before the request is cancelled, defaults to `request_timeout`
+        :param bypass_cache: bool, If True, embeds all texts even if they are cached and caches the new vectors, defaults to False
+        :return: Union[List[float], List[List[float]]], An embedding vector or a list of vectors.
+        :raises asyncio.TimeoutError: If the request takes longer than the timeout.
+        :raises CacheMissError: If the cache is offline and a text is not cached.
+        """
+        is_single_string = isinstance(texts, str)
+        input_texts = [texts] if is_single_string else texts
+
+        if not input_texts:
+            return []
+
+        keys, vectors, request = self._cached(self._request_params(input_texts, kwargs), bypass_cache)
+        response = None
+        if request is not None:
+            response = await self._limited(
+                lambda client: client.embeddings.with_raw_response.create(**request),
+                self._estimate_tokens(request["input"]),
+                timeout,
+            )
 
-        embeddings = [item.embedding for item in response.data]
-        return embeddings[0] if is_single_string else embeddings
\ No newline at end of file
+        embeddings = self._merge(keys, vectors, request, response)
+        return embeddings[0] if is_single_string else embeddings
@@ -0,0 +1,216 @@
+from bisect import bisect_left
+from collections.abc import Hashable
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+# Filter operators supported next to plain exact-match values:
+#   {"BELASTINGSOORT": "IB"}                               -> value equals
+#   {"BELASTINGSOORT": {"$in": ["IB", "VPB"]}}             -> value IN list
+#   {"PROCES_ONDERWERP": {"$prefix": "Aangifte"}}          -> value starts with
+#   {"BELASTINGSOORT": {"$path": "Inkomstenbelasting"}}    -> value is the taxonomy path or lies below it
+# A plain list is an exact (list) value. For list-valued metadata such as tags, a
+# scalar, `$in` or `$prefix` condition matches if any element of the list matches.
+IN = "$in"
+PREFIX = "$prefix"
+PATH = "$path"
+# Separator of the segments of a taxonomy path.
+PATH_SEPARATOR = "/"
+
+LIST_TYPES = (list, tuple)
+
+
+def _elements(value: Any) -> List[Any]:
+    """The elements of a list-valued metadata value, or the value itself."""
+    return list(value) if isinstance(value, LIST_TYPES) else [value]
+
+
+def _is_in(value: Any, options: Any) -> bool:
+    try:
+        return value in options
+    except TypeError:
+        return False
+
+
+def in_path(value: Any, path: str) -> bool:
+    """Whether a taxonomy value is `path` itself or lies below it, e.g. "IB/Aangifte" for "IB" but not "IBX"."""
+    return isinstance(value, str) and (value == path or value.startswith(path + PATH_SEPARATOR))
+
+
+def condition_matches(value: Any, condition: Any) -> bool:
+    """Evaluates a single filter condition against a metadata value.
+    :param value: Any, The metadata value of a document.
+    :param condition: Any, An exact value or a dict with an `$in`, `$prefix` or `$path` operator.
+    :return: bool, True if the value satisfies the condition.
+    """
+    if isinstance(condition, dict):
+        if IN in condition:
+            return any(_is_in(element, condition[IN]) for element in _elements(value))
+        if PREFIX in condition:
+            return any(isinstance(element, str) and element.startswith(condition[PREFIX]) for element in _elements(value))
+        if PATH in condition:
+            return any(in_path(element, condition[PATH]) for element in _elements(value))
+        return value == condition
+    if value == condition:
+        return True
+    return isinstance(value, LIST_TYPES) and not isinstance(condition, LIST_TYPES) and _is_in(condition, value)
+
+
+class MetadataIndex:
+    """An in-memory inverted index (key -> value -> doc ids) over selected metadata keys.
+
+    The index is updated per document, so adding or replacing documents does not
+    require a rebuild. Multi-key filters are answered by intersecting the posting
+    sets, starting with the smallest. A value held by a single document (e.g. a
+    km_number) is posted as the bare doc id instead of a one-element set. List-valued
+    metadata is posted per element; exact list conditions are not answered from the
+    index (see `indexable`).
+    """
+    def __init__(self, keys: Iterable[str]):
+        """
+        :param keys: Iterable[str], The metadata keys to index.
+        """
+        self.keys: Set[str] = set(keys)
+        self._key_order: Tuple[str, ...] = tuple(sorted(self.keys))
+        self._postings: Dict[str, Dict[Any, Union[str, Set[str]]]] = {key: {} for key in self.keys}
+        # Per document the indexed values in `_key_order`, as a compact tuple.
+        self._doc_values: Dict[str, Tuple[Any, ...]] = {}
+        self._sorted_values: Dict[str, Optional[List[str]]] = {key: None for key in self.keys}
+
+    def add(self, doc_id: str, values: Dict[str, Any]):
+        """Indexes (or re-indexes) the values of a document.
+        :param doc_id: str, The id of the document.
+        :param values: Dict[str, Any], The metadata values of the document; only indexed keys are used.
+        """
+        self.remove(doc_id)
+        indexed = []
+        for key in self._key_order:
+            value = values.get(key)
+            if isinstance(value, LIST_TYPES):
+                # Posted per element; kept as a frozenset so `remove` can tell it from a single value.
+                value = frozenset(element for element in value if element is not None and isinstance(element, Hashable)) or None
+            elif value is not None and not isinstance(value, Hashable):
+                value = None
+            indexed.append(value)
+            for element in (value if isinstance(value, frozenset) else () if value is None else (value,)):
+                self._post(key, element, doc_id)
+        if any(value is not None for value in indexed):
+            self._doc_values[doc_id] = tuple(indexed)
+
+    def _post(self, key: str, value: Any, doc_id: str):
+        postings = self._postings[key]
+        posting = postings.get(value)
+        if posting is None:
+            postings[value] = doc_id
+            self._sorted_values[key] = None
+        elif isinstance(posting, str):
+            postings[value] = {posting, doc_id}
+        else:
+            posting.add(doc_id)
+
+    def remove(self, doc_id: str):
+        """Removes a document from the index.
+        :param doc_id: str, The id of the document.
+        """
+        for key, value in zip(self._key_order, self._doc_values.pop(doc_id, ())):
+            if value is None:
+                continue
+            for element in (value if isinstance(value, frozenset) else (value,)):
+                self._unpost(key, element, doc_id)
+
+    def _unpost(self, key: str, value: Any, doc_id: str):
+        postings = self._postings[key]
+        posting = postings.get(value)
+        if posting is None:
+            return
+        if not isinstance(posting, str):
+            posting.discard(doc_id)
+            if len(posting) > 1:
+                return
+            posting = next(iter(posting), None)
+            if posting is not None:
+                postings[value] = posting
+                return
+        elif posting != doc_id:
+            return
+        del postings[value]
+        self._sorted_values[key] = None
+
+    def clear(self):
+        """Removes all documents from the index."""
+        self._postings = {key: {} for key in self.keys}
+        self._doc_values = {}
+        self._sorted_values = {key: None for key in self.keys}
+
+    def values(self, key: str) -> List[Any]:
+        """Returns the distinct indexed values of a key, sorted.
+        :param key: str, An indexed metadata key.
+        :return: List[Any], The distinct values.
+        """
+        if self._sorted_values.get(key) is None:
+            self._sorted_values[key] = sorted(self._postings.get(key, {}), key=str)
+        return self._sorted_values[key]
+
+    def counts(self, key: str) -> Dict[Any, int]:
+        """Returns the number of documents per value of a key, read from the posting sizes.
+        :param key: str, An indexed metadata key.
+        :return: Dict[Any, int], The number of documents per value.
+        """
+        return {
+            value: 1 if isinstance(posting, str) else len(posting)
+            for value, posting in self._postings.get(key, {}).items()
+        }
+
+    def _ids(self, key: str, value: Any) -> Set[str]:
+        """The posting of a value as a set."""
+        posting = self._postings[key].get(value)
+        if posting is None:
+            return set()
+        return {posting} if isinstance(posting, str) else posting
+
+    def _prefix_ids(self, key: str, prefix: str) -> Set[str]:
+        """Collects the ids of all documents whose value for `key` starts with `prefix`."""
+        values = self.values(key)
+        ids: Set[str] = set()
+        for i in range(bisect_left(values, prefix, key=str), len(values)):
+            value = values[i]
+            if not str(value).startswith(prefix):
+                break
+            ids |= self._ids(key, value)
+        return ids
+
+    @staticmethod
+    def indexable(condition: Any) -> bool:
+        """Whether a condition can be answered from the index: an exact list value cannot."""
+        return not isinstance(condition, (list, tuple, set))
+
+    def lookup(self, key: str, condition: Any) -> Set[str]:
+        """Returns the ids of documents matching a single condition on an indexed key.
+        :param key: str, An indexed metadata key.
+        :param condition: Any, An exact scalar value or a dict with an `$in`, `$prefix` or `$path` operator (see `indexable`).
+        :return: Set[str], The matching document ids. The caller must not modify the returned set.
+        """
+        if isinstance(condition, dict) and PREFIX in condition:
+            return self._prefix_ids(key, condition[PREFIX])
+        if isinstance(condition, dict) and PATH in condition:
+            path = condition[PATH]
+            return self._ids(key, path) | self._prefix_ids(key, path + PATH_SEPARATOR)
+        if isinstance(condition, dict) and IN in condition:
+            ids: Set[str] = set()
+            for value in condition[IN]:
+                if isinstance(value, Hashable):
+                    ids |= self._ids(key, value)
+            return ids
+        if not isinstance(condition, Hashable):
+            return set()
+        return self._ids(key, condition)
+
+    def match(self, metadata_filter: Dict[str, Any]) -> Set[str]:
+        """Returns the ids of documents matching all conditions of a filter on indexed keys.
+        :param metadata_filter: Dict[str, Any], Conditions keyed by indexed metadata key.
+        :return: Set[str], A new set with the matching document ids.
+        """
+        result: Optional[Set[str]] = None
+        for ids in sorted((self.lookup(k, c) for k, c in metadata_filter.items()), key=len):
+            result = set(ids) if result is None else result & ids
+            if not result:
+                break
+        return result or set()
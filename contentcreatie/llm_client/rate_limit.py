@@ -0,0 +1,407 @@
+import asyncio
+import random
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Mapping, Optional, Tuple, TypeVar
+import openai
+from logging import getLogger
+logger = getLogger("Contenttransformatie")
+
+T = TypeVar("T")
+
+# Status codes worth retrying: throttling, timeouts/conflicts and server errors.
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Parses a rate limit duration header ('20', '1.5', '250ms', '6m0s') into seconds.
+    :param value: Optional[str], The header value.
+    :return: Optional[float], The duration in seconds, or None if the value cannot be parsed.
+    """
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION.findall(value)
+    if not parts:
+        return None
+    factors = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+    return sum(float(number) * factors[unit] for number, unit in parts)
+
+
+def _header_number(headers: Mapping[str, str], name: str) -> Optional[float]:
+    try:
+        return float(headers[name]) if headers.get(name) is not None else None
+    except ValueError:
+        return None
+
+
+def retry_after(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    """The delay a response asks for, from the retry-after-ms or retry-after header, in seconds."""
+    if not headers:
+        return None
+    milliseconds = _header_number(headers, "retry-after-ms")
+    if milliseconds is not None:
+        return milliseconds / 1000
+    return parse_duration(headers.get("retry-after"))
+
+
+class TokenBucket:
+    """A thread-safe token bucket refilled continuously at a per-minute rate.
+
+    `reserve` always takes the tokens and returns how long the caller must wait
+    before using them: the level may go negative, so concurrent callers queue up
+    at the refill rate without polling. Without a rate the bucket only enforces
+    pauses requested by the server.
+    """
+    def __init__(self, per_minute: Optional[float] = None, capacity: Optional[float] = None):
+        """
+        :param per_minute: Optional[float], Tokens added per minute; None for no limit, defaults to None
+        :param capacity: Optional[float], The maximum burst, defaults to one minute of tokens
+        """
+        self._lock = threading.Lock()
+        self._blocked_until = 0.0
+        self.configure(per_minute, capacity)
+
+    def configure(self, per_minute: Optional[float], capacity: Optional[float] = None):
+        """(Re)sets the rate of the bucket and fills it."""
+        with self._lock:
+            self.per_minute = float(per_minute) if per_minute else None
+            self.capacity = float(capacity or per_minute or 0)
+            self._level = self.capacity
+            self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        if self.per_minute:
+            self._level = min(self.capacity, self._level + (now - self._updated) * self.per_minute / 60)
+        self._updated = now
+
+    def reserve(self, amount: float = 1) -> float:
+        """Takes tokens from the bucket.
+        :param amount: float, The number of tokens; more than the capacity counts as a full bucket, defaults to 1
+        :return: float, The seconds to wait before the tokens may be used.
+        """
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self._blocked_until - now)
+            if not self.per_minute:
+                return wait
+            self._refill(now)
+            self._level -= min(amount, self.capacity)
+            if self._level < 0:
+                wait = max(wait, -self._level * 60 / self.per_minute)
+            return wait
+
+    def adjust(self, amount: float):
+        """Takes (or with a negative amount returns) tokens after the fact, e.g. once the actual usage is known."""
+        with self._lock:
+            if self.per_minute:
+                self._refill(time.monotonic())
+                self._level = min(self.capacity, self._level - amount)
+
+    def observe(self, remaining: Optional[float], limit: Optional[float] = None):
+        """Aligns the bucket with the remaining quota reported by the server.
+
+        An unconfigured bucket takes its rate from the reported limit.
+        :param remaining: Optional[float], The tokens left in the current window.
+        :param limit: Optional[float], The tokens per window, if reported.
+        """
+        if limit and not self.per_minute:
+            self.configure(limit)
+        if remaining is None:
+            return
+        with self._lock:
+            if self.per_minute:
+                self._refill(time.monotonic())
+                self._level = min(self._level, remaining)
+
+    def pause(self, seconds: float):
+        """Makes every reservation wait until `seconds` from now, e.g. after a 429 with retry-after."""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    def headroom(self) -> float:
+        """The fraction of the bucket that is available now: 0 while paused or in debt, 1 without a rate."""
+        with self._lock:
+            now = time.monotonic()
+            if self._blocked_until > now:
+                return 0.0
+            if not self.per_minute:
+                return 1.0
+            self._refill(now)
+            return max(0.0, self._level) / self.capacity if self.capacity else 1.0
+
+
+class AIMDController:
+    """Adapts the number of concurrent requests to a deployment.
+
+    The limit grows additively (by one per `limit` successful requests) and is
+    halved on throttling, at most once per `cooldown` seconds so that the 429s of
+    requests already in flight count as one signal. Threads wait on a condition;
+    coroutines wait on a future that is resolved on their own loop.
+    """
+    def __init__(self, initial: int = 8, minimum: int = 1, maximum: int = 64, decrease: float = 0.5, cooldown: float = 5.0):
+        """
+        :param initial: int, The initial number of concurrent requests, defaults to 8
+        :param minimum: int, The lower bound of the limit, defaults to 1
+        :param maximum: int, The upper bound of the limit, defaults to 64
+        :param decrease: float, The factor applied to the limit on throttling, defaults to 0.5
+        :param cooldown: float, Minimum seconds between two decreases, defaults to 5.0
+        """
+        self.minimum = max(1, int(minimum))
+        self.maximum = max(self.minimum, int(maximum))
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+        self._async_waiters: Deque[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = deque()
+
+    def _try_acquire(self) -> bool:
+        """Takes a slot if one is free. Must be called with the condition held."""
+        if self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return True
+        return False
+
+    def acquire(self):
+        """Blocks the calling thread until a slot is free."""
+        with self._condition:
+            while not self._try_acquire():
+                self._condition.wait()
+
+    async def aacquire(self):
+        """Waits without blocking the event loop until a slot is free."""
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._condition:
+                if self._try_acquire():
+                    return
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+            await waiter
+
+    def release(self, success: bool = True, throttled: bool = False):
+        """Frees a slot and adapts the limit.
+        :param success: bool, The request succeeded: grow the limit, defaults to True
+        :param throttled: bool, The request was throttled: shrink the limit, defaults to False
+        """
+        with self._condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if throttled:
+                if now - self._last_decrease >= self.cooldown:
+                    self.limit = max(self.minimum, self.limit * self.decrease)
+                    self._last_decrease = now
+                    logger.info(f"Throttled: concurrency limit lowered to {int(self.limit)}")
+            elif success:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+            waiters, self._async_waiters = self._async_waiters, deque()
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(_wake, waiter)
+
+    def headroom(self) -> float:
+        """The fraction of the concurrency limit that is free."""
+        with self._condition:
+            return max(0.0, int(self.limit) - self.in_flight) / int(self.limit)
+
+
+def _wake(waiter: asyncio.Future):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, never shorter than the delay the server asks for."""
+    def __init__(self, max_retries: int = 6, base_delay: float = 1.0, max_delay: float = 60.0):
+        """
+        :param max_retries: int, The number of retries after the first attempt, defaults to 6
+        :param base_delay: float, The backoff ceiling of the first retry in seconds, doubled per retry, defaults to 1.0
+        :param max_delay: float, The maximum backoff ceiling in seconds, defaults to 60.0
+        """
+        self.max_retries = max(0, int(max_retries))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int, server_delay: Optional[float] = None) -> float:
+        """The seconds to wait before retry number `attempt` (0-based)."""
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        return max(backoff, server_delay or 0.0)
+
+
+def _retryable(error: Exception) -> Tuple[bool, bool, Optional[Mapping[str, str]]]:
+    """Classifies an error of the openai client.
+    :return: Tuple[bool, bool, Optional[Mapping[str, str]]], Whether to retry, whether it was throttling, and the response headers.
+    """
+    if isinstance(error, openai.APIStatusError):
+        status = error.status_code
+        return status in RETRYABLE_STATUS, status == 429, error.response.headers
+    if isinstance(error, openai.APIConnectionError):
+        return True, False, None
+    return False, False, None
+
+
+class DeploymentLimiter:
+    """Rate limiting, retries and adaptive concurrency for the requests to one deployment.
+
+    A request first takes a slot from the AIMD controller, then one request and its
+    estimated tokens from the per-minute buckets. After the response, the token
+    bucket is corrected by the actual usage and both buckets are aligned with the
+    x-ratelimit-remaining-* headers. Throttled and transient failures are retried
+    with backoff; a 429 also pauses the buckets for the retry-after delay, so all
+    callers of the deployment back off together.
+    """
+    def __init__(
+        self,
+        name: str,
+        requests_per_minute: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None,
+        max_concurrency: int = 64,
+        retry: Optional[RetryPolicy] = None,
+    ):
+        """
+        :param name: str, The deployment, used in log messages.
+        :param requests_per_minute: Optional[int], The request quota; learned from the headers if None, defaults to None
+        :param tokens_per_minute: Optional[int], The token quota; learned from the headers if None, defaults to None
+        :param max_concurrency: int, The upper bound of the adaptive concurrency limit, defaults to 64
+        :param retry: Optional[RetryPolicy], The retry policy, defaults to RetryPolicy()
+        """
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.concurrency = AIMDController(initial=min(8, max_concurrency), maximum=max_concurrency)
+        self.retry = retry or RetryPolicy()
+
+    def configure(self, requests_per_minute: Optional[int] = None, tokens_per_minute: Optional[int] = None):
+        """Sets the quotas of buckets that have none yet."""
+        if requests_per_minute and not self.requests.per_minute:
+            self.requests.configure(requests_per_minute)
+        if tokens_per_minute and not self.tokens.per_minute:
+            self.tokens.configure(tokens_per_minute)
+
+    def _reserve(self, tokens: int) -> float:
+        return max(self.requests.reserve(1), self.tokens.reserve(tokens))
+
+    def _observe(self, headers: Optional[Mapping[str, str]]):
+        """Aligns the buckets with the rate limit headers of a response."""
+        if not headers:
+            return
+        self.requests.observe(
+            _header_number(headers, "x-ratelimit-remaining-requests"), _header_number(headers, "x-ratelimit-limit-requests")
+        )
+        self.tokens.observe(
+            _header_number(headers, "x-ratelimit-remaining-tokens"), _header_number(headers, "x-ratelimit-limit-tokens")
+        )
+
+    def _succeeded(self, headers: Optional[Mapping[str, str]], tokens: int, used_tokens: Optional[int], release: bool = True):
+        if release:
+            self.concurrency.release(success=True)
+        self._observe(headers)
+        if used_tokens is not None:
+            self.tokens.adjust(used_tokens - tokens)
+
+    def headroom(self) -> float:
+        """The fraction of the request quota, token quota and concurrency limit that is available now, whichever is lowest."""
+        return min(self.requests.headroom(), self.tokens.headroom(), self.concurrency.headroom())
+
+    def _failed(self, error: Exception, attempt: int, max_retries: Optional[int] = None) -> float:
+        """Releases the slot of a failed attempt.
+        :return: float, The seconds to wait before the next attempt.
+        :raises Exception: The error, if it is not retryable or the retries are exhausted.
+        """
+        retry, throttled, headers = _retryable(error)
+        self.concurrency.release(success=False, throttled=throttled)
+        self._observe(headers)
+        server_delay = retry_after(headers)
+        if throttled and server_delay:
+            self.requests.pause(server_delay)
+            self.tokens.pause(server_delay)
+        max_retries = self.retry.max_retries if max_retries is None else max_retries
+        if not retry or attempt >= max_retries:
+            raise error
+        delay = self.retry.delay(attempt, server_delay)
+        logger.warning(f"{self.name}: {type(error).__name__}, retry {attempt + 1}/{max_retries} in {delay:.1f}s")
+        return delay
+
+    def call(
+        self,
+        send: Callable[[], Tuple[T, Optional[Mapping[str, str]]]],
+        tokens: int,
+        used_tokens: Callable[[T], Optional[int]] = lambda response: None,
+        max_retries: Optional[int] = None,
+        hold_slot: bool = False,
+    ) -> T:
+        """Sends a request, waiting for the limits and retrying transient failures.
+        :param send: Callable[[], Tuple[T, Optional[Mapping[str, str]]]], Sends the request; returns the response and its headers.
+        :param tokens: int, The estimated tokens of the request.
+        :param used_tokens: Callable[[T], Optional[int]], The actual tokens of a response, if reported.
+        :param max_retries: Optional[int], Overrides the retries of the policy, e.g. 0 to fail over to another deployment, defaults to None
+        :param hold_slot: bool, Keep the concurrency slot after a successful response, e.g. while a stream is read;
+                          the caller frees it with `concurrency.release`, defaults to False
+        :return: T, The response.
+        """
+        attempt = 0
+        while True:
+            self.concurrency.acquire()
+            try:
+                time.sleep(self._reserve(tokens))
+                response, headers = send()
+            except Exception as e:
+                time.sleep(self._failed(e, attempt, max_retries))
+                attempt += 1
+                continue
+            except BaseException:
+                self.concurrency.release(success=False)
+                raise
+            self._succeeded(headers, tokens, used_tokens(response), release=not hold_slot)
+            return response
+
+    async def acall(
+        self,
+        send: Callable[[], Awaitable[Tuple[T, Optional[Mapping[str, str]]]]],
+        tokens: int,
+        used_tokens: Callable[[T], Optional[int]] = lambda response: None,
+        max_retries: Optional[int] = None,
+    ) -> T:
+        """Async variant of `call`; cancelling the awaiting task frees the slot."""
+        attempt = 0
+        while True:
+            await self.concurrency.aacquire()
+            try:
+                await asyncio.sleep(self._reserve(tokens))
+                response, headers = await send()
+            except Exception as e:
+                await asyncio.sleep(self._failed(e, attempt, max_retries))
+                attempt += 1
+                continue
+            except BaseException:
+                self.concurrency.release(success=False)
+                raise
+            self._succeeded(headers, tokens, used_tokens(response))
+            return response
+
+
+_limiters: Dict[str, DeploymentLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def deployment_limiter(name: str, **kwargs: Any) -> DeploymentLimiter:
+    """Returns the limiter of a deployment, shared by every processor in the process that uses it.
+    :param name: str, Identifies the deployment, e.g. endpoint and model.
+    :param kwargs: Any, Passed to DeploymentLimiter when it is created; quotas also fill in those of an existing limiter.
+    :return: DeploymentLimiter, The limiter.
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            limiter = _limiters[name] = DeploymentLimiter(name, **kwargs)
+            return limiter
+    limiter.configure(kwargs.get("requests_per_minute"), kwargs.get("tokens_per_minute"))
+    return limiter
@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from logging import getLogger
+logger = getLogger("Contenttransformatie")
+
+# SQLite allows at most 999 bound parameters per statement on older builds.
+_MAX_PARAMS = 900
+
+
+class CacheMissError(LookupError):
+    """Raised in offline mode when a request is not in the cache."""
+
+
+def fingerprint(*parts: Any) -> str:
+    """A canonical hash of a request: JSON with sorted keys, so equal requests hash equally regardless of key order.
+    :param parts: Any, The parts identifying the request, e.g. a namespace and the request parameters.
+    :return: str, The hex digest.
+    """
+    encoded = json.dumps(parts, ensure_ascii=False, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """A disk-backed cache of API responses in a SQLite database.
+
+    Entries are keyed by a request `fingerprint` and hold the serialized response.
+    Entries older than `ttl` are treated as misses and deleted by `evict`. When the
+    entries grow beyond `max_bytes`, the least recently used are evicted. The
+    database runs in WAL mode with a connection per thread, so it can be shared by
+    threads, event loops and processes.
+    """
+    def __init__(self, path: str, ttl: Optional[float] = None, max_bytes: int = 1 << 30, offline: bool = False):
+        """
+        :param path: str, The SQLite file.
+        :param ttl: Optional[float], Seconds an entry stays valid, defaults to None (forever)
+        :param max_bytes: int, The maximum total size of the cached responses, defaults to 1 GiB
+        :param offline: bool, If True, processors raise CacheMissError instead of sending a request that is not cached, defaults to False
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max(1, int(max_bytes))
+        self.offline = offline
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = self._connection()
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+            "size INTEGER NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed)")
+        self._size = self.size()
+
+    def _connection(self) -> sqlite3.Connection:
+        """The connection of the calling thread, opened on first use."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _expired_before(self) -> float:
+        return time.time() - self.ttl if self.ttl else float("-inf")
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Returns the cached response of a request, or None on a miss."""
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, bytes]:
+        """Returns the cached responses of the keys that are cached and not expired."""
+        keys = list(dict.fromkeys(keys))
+        found: Dict[str, bytes] = {}
+        connection = self._connection()
+        expired_before = self._expired_before()
+        for i in range(0, len(keys), _MAX_PARAMS):
+            chunk = keys[i:i + _MAX_PARAMS]
+            placeholders = ", ".join("?" for _ in chunk)
+            rows = connection.execute(
+                f"SELECT key, value FROM responses WHERE key IN ({placeholders}) AND created >= ?", [*chunk, expired_before]
+            ).fetchall()
+            found.update(rows)
+            if rows:
+                connection.execute(
+                    f"UPDATE responses SET accessed = ? WHERE key IN ({', '.join('?' for _ in rows)})",
+                    [time.time(), *(key for key, _ in rows)],
+                )
+        return found
+
+    def put(self, key: str, value: bytes):
+        """Stores the response of a request."""
+        self.put_many([(key, value)])
+
+    def put_many(self, items: List[Tuple[str, bytes]]):
+        """Stores several responses in one transaction and evicts if the cache grew beyond `max_bytes`."""
+        if not items:
+            return
+        now = time.time()
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                [(key, value, len(value), now, now) for key, value in items],
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        with self._lock:
+            self._size += sum(len(value) for _, value in items)
+            full = self._size > self.max_bytes
+        if full:
+            self.evict()
+
+    def size(self) -> int:
+        """The total size of the cached responses in bytes."""
+        return self._connection().execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def __len__(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def evict(self) -> int:
+        """Deletes the expired entries, then the least recently used until the cache is below 90% of `max_bytes`.
+        :return: int, The number of deleted entries.
+        """
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            deleted = connection.execute("DELETE FROM responses WHERE created < ?", (self._expired_before(),)).rowcount
+            excess = self.size() - int(self.max_bytes * 0.9)
+            if excess > 0:
+                victims, freed = [], 0
+                for key, size in connection.execute("SELECT key, size FROM responses ORDER BY accessed"):
+                    if freed >= excess:
+                        break
+                    victims.append((key,))
+                    freed += size
+                connection.executemany("DELETE FROM responses WHERE key = ?", victims)
+                deleted += len(victims)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        with self._lock:
+            self._size = self.size()
+        if deleted:
+            logger.info(f"Evicted {deleted} entries from the response cache {self.path}")
+        return deleted
+
+    def clear(self):
+        """Deletes all entries."""
+        self._connection().execute("DELETE FROM responses")
+        with self._lock:
+            self._size = 0
@@ -0,0 +1,229 @@
+import asyncio
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Set, Tuple, TypeVar
+from .rate_limit import DeploymentLimiter, RetryPolicy, _retryable, retry_after
+from logging import getLogger
+logger = getLogger("Contenttransformatie")
+
+T = TypeVar("T")
+
+# Latency assumed for an endpoint without successful requests yet, in seconds.
+DEFAULT_LATENCY = 1.0
+
+
+class EndpointHealth:
+    """The health of an endpoint: a moving average of its latency and a circuit breaker.
+
+    After `failure_threshold` consecutive failures that are not throttling (connection
+    errors, 5xx), the endpoint is left out of the routing for a cooldown that doubles
+    with every further failure. Throttling is handled by the rate limiter of the
+    endpoint, whose pause makes it unattractive until the retry-after has passed.
+    """
+    def __init__(self, failure_threshold: int = 3, cooldown: float = 10.0, max_cooldown: float = 300.0, smoothing: float = 0.2):
+        """
+        :param failure_threshold: int, Consecutive failures before the endpoint is left out, defaults to 3
+        :param cooldown: float, Seconds the endpoint is left out after the threshold is reached, defaults to 10
+        :param max_cooldown: float, The maximum cooldown in seconds, defaults to 300
+        :param smoothing: float, The weight of a new latency in the moving average, defaults to 0.2
+        """
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.smoothing = smoothing
+        self.latency: Optional[float] = None
+        self.consecutive_failures = 0
+        self.successes = 0
+        self.failures = 0
+        self.throttled = 0
+        self.unavailable_until = 0.0
+        self._lock = threading.Lock()
+
+    def available(self, now: Optional[float] = None) -> bool:
+        """Whether the circuit breaker lets requests through."""
+        return (now or time.monotonic()) >= self.unavailable_until
+
+    def success(self, latency: float):
+        """Records a successful request and its latency in seconds."""
+        with self._lock:
+            self.successes += 1
+            self.consecutive_failures = 0
+            self.latency = latency if self.latency is None else (1 - self.smoothing) * self.latency + self.smoothing * latency
+
+    def failure(self, throttled: bool = False):
+        """Records a failed request; opens the circuit breaker after too many consecutive failures."""
+        with self._lock:
+            if throttled:
+                self.throttled += 1
+                return
+            self.failures += 1
+            self.consecutive_failures += 1
+            excess = self.consecutive_failures - self.failure_threshold
+            if excess >= 0:
+                self.unavailable_until = time.monotonic() + min(self.max_cooldown, self.cooldown * 2 ** excess)
+
+
+class Endpoint:
+    """One deployment of a model: its configuration, synchronous client, rate limiter and health."""
+    def __init__(self, name: str, config: Dict[str, Any], client: Any, limiter: DeploymentLimiter):
+        """
+        :param name: str, The endpoint, used in log messages.
+        :param config: Dict[str, Any], The client configuration, to create async clients from.
+        :param client: Any, The synchronous openai client.
+        :param limiter: DeploymentLimiter, The limiter of the deployment.
+        """
+        self.name = name
+        self.config = config
+        self.client = client
+        self.limiter = limiter
+        self.health = EndpointHealth()
+
+    def weight(self, default_latency: float) -> float:
+        """The routing weight: the available quota and concurrency divided by the latency."""
+        latency = self.health.latency if self.health.latency is not None else default_latency
+        return max(self.limiter.headroom(), 0.01) / max(latency, 0.05)
+
+    def status(self) -> Dict[str, Any]:
+        """The health of the endpoint, e.g. to display or log."""
+        return {
+            "endpoint": self.name,
+            "available": self.health.available(),
+            "latency": self.health.latency,
+            "headroom": self.limiter.headroom(),
+            "successes": self.health.successes,
+            "failures": self.health.failures,
+            "throttled": self.health.throttled,
+        }
+
+
+class EndpointRouter:
+    """Spreads the requests for a model over its endpoints and fails over between them.
+
+    Each request goes to an endpoint drawn at random, weighted by `Endpoint.weight`, so
+    fast endpoints with quota left get most of the traffic. Endpoints whose circuit
+    breaker is open are skipped while others are available. A throttled (429) or
+    failed (5xx, connection error) request is sent to another endpoint right away;
+    only when all endpoints failed, the router backs off before the next round.
+    With a single endpoint, the retries of its DeploymentLimiter apply unchanged.
+    """
+    def __init__(self, endpoints: List[Endpoint], retry: Optional[RetryPolicy] = None):
+        """
+        :param endpoints: List[Endpoint], The endpoints of the model.
+        :param retry: Optional[RetryPolicy], The total retries over all endpoints and the backoff between rounds, defaults to RetryPolicy()
+        """
+        if not endpoints:
+            raise ValueError("A router needs at least one endpoint")
+        self.endpoints = endpoints
+        self.retry = retry or RetryPolicy()
+
+    def pick(self, exclude: Set[str] = frozenset()) -> Endpoint:
+        """
+        Draws an endpoint, weighted by latency and available quota.
+        :param exclude: Set[str], Names of endpoints that failed for this request, defaults to none
+        :return: Endpoint, The endpoint to send the request to.
+        """
+        now = time.monotonic()
+        candidates = [e for e in self.endpoints if e.name not in exclude and e.health.available(now)] \
+            or [e for e in self.endpoints if e.name not in exclude] \
+            or self.endpoints
+        if len(candidates) == 1:
+            return candidates[0]
+        latencies = [e.health.latency for e in self.endpoints if e.health.latency is not None]
+        default_latency = sum(latencies) / len(latencies) if latencies else DEFAULT_LATENCY
+        return random.choices(candidates, weights=[e.weight(default_latency) for e in candidates])[0]
+
+    @staticmethod
+    def _timed(endpoint: Endpoint, send: Callable[[Endpoint], Any]) -> Callable[[], Any]:
+        """Binds a request to an endpoint and records its latency on success."""
+        def _send():
+            start = time.monotonic()
+            result = send(endpoint)
+            endpoint.health.success(time.monotonic() - start)
+            return result
+        return _send
+
+    @staticmethod
+    def _atimed(endpoint: Endpoint, send: Callable[[Endpoint], Awaitable[Any]]) -> Callable[[], Awaitable[Any]]:
+        """Async variant of `_timed`."""
+        async def _send():
+            start = time.monotonic()
+            result = await send(endpoint)
+            endpoint.health.success(time.monotonic() - start)
+            return result
+        return _send
+
+    def _failed(self, endpoint: Endpoint, error: Exception, attempt: int, tried: Set[str]) -> float:
+        """Records a failed attempt.
+        :return: float, The seconds to wait before the next attempt: 0 to fail over to an endpoint not tried yet.
+        :raises Exception: The error, if it is not retryable or the retries are exhausted.
+        """
+        retry, throttled, headers = _retryable(error)
+        if not retry:
+            raise error
+        endpoint.health.failure(throttled)
+        if attempt >= self.retry.max_retries:
+            raise error
+        tried.add(endpoint.name)
+        if len(tried) < len(self.endpoints):
+            logger.warning(f"{endpoint.name}: {type(error).__name__}, failing over to another endpoint")
+            return 0.0
+        tried.clear()
+        delay = self.retry.delay(attempt // len(self.endpoints), retry_after(headers))
+        logger.warning(f"All endpoints failed ({type(error).__name__}), retry {attempt + 1}/{self.retry.max_retries} in {delay:.1f}s")
+        return delay
+
+    def call(
+        self,
+        send: Callable[[Endpoint], Tuple[T, Optional[Mapping[str, str]]]],
+        tokens: int,
+        used_tokens: Callable[[T], Optional[int]] = lambda response: None,
+        hold_slot: bool = False,
+    ) -> Tuple[T, Endpoint]:
+        """Sends a request to an endpoint, failing over to the others on throttling and transient failures.
+        :param send: Callable[[Endpoint], Tuple[T, Optional[Mapping[str, str]]]], Sends the request to the given endpoint; returns the response and its headers.
+        :param tokens: int, The estimated tokens of the request.
+        :param used_tokens: Callable[[T], Optional[int]], The actual tokens of a response, if reported.
+        :param hold_slot: bool, Keep the concurrency slot of the endpoint after the response (see DeploymentLimiter.call), defaults to False
+        :return: Tuple[T, Endpoint], The response and the endpoint that sent it.
+        """
+        if len(self.endpoints) == 1:
+            endpoint = self.endpoints[0]
+            return endpoint.limiter.call(self._timed(endpoint, send), tokens, used_tokens, hold_slot=hold_slot), endpoint
+        attempt, tried = 0, set()
+        while True:
+            endpoint = self.pick(tried)
+            try:
+                return endpoint.limiter.call(
+                    self._timed(endpoint, send), tokens, used_tokens, max_retries=0, hold_slot=hold_slot
+                ), endpoint
+            except Exception as e:
+                delay = self._failed(endpoint, e, attempt, tried)
+            attempt += 1
+            if delay:
+                time.sleep(delay)
+
+    async def acall(
+        self,
+        send: Callable[[Endpoint], Awaitable[Tuple[T, Optional[Mapping[str, str]]]]],
+        tokens: int,
+        used_tokens: Callable[[T], Optional[int]] = lambda response: None,
+    ) -> Tuple[T, Endpoint]:
+        """Async variant of `call`."""
+        if len(self.endpoints) == 1:
+            endpoint = self.endpoints[0]
+            return await endpoint.limiter.acall(self._atimed(endpoint, send), tokens, used_tokens), endpoint
+        attempt, tried = 0, set()
+        while True:
+            endpoint = self.pick(tried)
+            try:
+                return await endpoint.limiter.acall(self._atimed(endpoint, send), tokens, used_tokens, max_retries=0), endpoint
+            except Exception as e:
+                delay = self._failed(endpoint, e, attempt, tried)
+            attempt += 1
+            if delay:
+                await asyncio.sleep(delay)
+
+    def status(self) -> List[Dict[str, Any]]:
+        """The health of every endpoint."""
+        return [endpoint.status() for endpoint in self.endpoints]
@@ -0,0 +1,558 @@
+import atexit
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, TypeVar
+from whoosh.analysis import LanguageAnalyzer
+from whoosh.fields import ID, TEXT, Schema
+from whoosh.highlight import Formatter, get_text
+from whoosh.index import Index, create_in, exists_in, open_dir
+from whoosh.qparser import MultifieldParser, OrGroup, QueryParser
+from whoosh.query import Query
+from whoosh.reading import EmptyReader
+from whoosh.searching import Searcher
+from logging import getLogger
+logger = getLogger("Contenttransformatie")
+
+T = TypeVar("T")
+
+# Fields of the optional full-text index with their query-time boosts.
+TEXT_FIELD_BOOSTS = {"title": 2.0, "VRAAG": 2.0, "summary": 1.5, "content": 1.0}
+
+
+def text_schema(language: str = "nl") -> Schema:
+    """Schema of the full-text index: stemmed, stop-word filtered text fields.
+
+    Term vectors are stored for the long fields so hits can be highlighted. The
+    document text itself is not stored; snippets are cut from the DocumentStore.
+    :param language: str, The Snowball language for stemming and stop words, defaults to "nl"
+    :return: Schema, The Whoosh schema.
+    """
+    analyzer = LanguageAnalyzer(language)
+    return Schema(
+        doc_id=ID(stored=True, unique=True),
+        title=TEXT(analyzer=analyzer, stored=True),
+        VRAAG=TEXT(analyzer=analyzer),
+        summary=TEXT(analyzer=analyzer, vector=True),
+        content=TEXT(analyzer=analyzer, vector=True),
+    )
+
+
+def text_parser(schema: Schema) -> MultifieldParser:
+    """A keyword-friendly parser over the full-text fields: terms are OR-ed, favouring documents matching more of them."""
+    return MultifieldParser(list(TEXT_FIELD_BOOSTS), schema=schema, fieldboosts=TEXT_FIELD_BOOSTS, group=OrGroup.factory(0.9))
+
+
+class MarkdownFormatter(Formatter):
+    """Highlights matched terms in snippets as Markdown bold."""
+    between = " ... "
+
+    def format_token(self, text, token, replace=False):
+        return f"**{get_text(text, token, replace)}**"
+
+
+class BufferedIndexWriter:
+    """Batches Whoosh `update_document` calls and commits them on a background thread.
+
+    Callers only append to an in-memory buffer. A worker thread commits the buffer
+    when it reaches `batch_size` documents or when the oldest pending document has
+    waited `flush_interval` seconds. Every `merge_every` commits the segments are
+    merged as part of the commit, which also happens off the caller's thread.
+    A batch that fails to commit (e.g. the index is locked) is queued again, behind
+    newer updates of the same documents, and retried with exponential backoff.
+    """
+    def __init__(
+        self,
+        ix: Index,
+        batch_size: int = 500,
+        flush_interval: float = 2.0,
+        merge_every: int = 10,
+        on_commit: Optional[Callable[[], None]] = None,
+        retry_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+    ):
+        """
+        :param ix: Index, The Whoosh index to write to.
+        :param batch_size: int, Commit as soon as this many documents are pending, defaults to 500
+        :param flush_interval: float, Maximum seconds a document waits before it is committed, defaults to 2.0
+        :param merge_every: int, Merge segments on every n-th commit, defaults to 10
+        :param on_commit: Optional[Callable[[], None]], Called after every successful commit, defaults to None
+        :param retry_backoff: float, Seconds before the first retry of a failed batch, doubled on every further failure, defaults to 1.0
+        :param max_backoff: float, The maximum seconds between retries, defaults to 60.0
+        """
+        self.ix = ix
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = flush_interval
+        self.merge_every = max(1, int(merge_every))
+        self.on_commit = on_commit
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+
+        # Queued fields per doc_id; None queues the removal of the document.
+        self._pending: Dict[str, Optional[Dict[str, Any]]] = {}
+        self._first_pending_at: Optional[float] = None
+        self._commits = 0
+        self._failures = 0
+        self._retry_at = 0.0
+        self._condition = threading.Condition()
+        # Held while a Whoosh writer is open, so index rebuilds can wait for it.
+        self.write_lock = threading.RLock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="whoosh-index-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def update(self, fields: Dict[str, Any]):
+        """Queues a document for indexing. A later update for the same doc_id replaces it.
+        :param fields: Dict[str, Any], The index fields, including 'doc_id'.
+        """
+        self._queue(fields['doc_id'], fields)
+
+    def delete(self, doc_id: str):
+        """Queues the removal of a document. Replaces a pending update for the same doc_id."""
+        self._queue(doc_id, None)
+
+    def _queue(self, doc_id: str, fields: Optional[Dict[str, Any]]):
+        with self._condition:
+            self._pending[doc_id] = fields
+            if self._first_pending_at is None:
+                self._first_pending_at = time.monotonic()
+                self._condition.notify()
+            elif len(self._pending) >= self.batch_size:
+                self._condition.notify()
+
+    def _take_batch(self) -> List[Tuple[str, Optional[Dict[str, Any]]]]:
+        """Empties the buffer and returns its contents. Must be called with the condition held."""
+        batch = list(self._pending.items())
+        self._pending = {}
+        self._first_pending_at = None
+        return batch
+
+    def _requeue(self, batch: List[Tuple[str, Optional[Dict[str, Any]]]]):
+        """Puts a failed batch back in the buffer and schedules a retry with backoff.
+        Documents queued again since the batch was taken keep their newer entry.
+        """
+        with self._condition:
+            for doc_id, fields in batch:
+                self._pending.setdefault(doc_id, fields)
+            if self._first_pending_at is None:
+                self._first_pending_at = time.monotonic()
+            self._failures += 1
+            delay = min(self.max_backoff, self.retry_backoff * 2 ** (self._failures - 1))
+            self._retry_at = time.monotonic() + delay
+            self._condition.notify()
+        logger.warning(f"Retrying {len(batch)} documents for the search index in {delay:.1f}s")
+
+    def _commit(self, batch: List[Tuple[str, Optional[Dict[str, Any]]]]) -> bool:
+        """Writes a batch of document updates and removals to the index in a single commit.
+        :return: bool, Whether the batch was committed.
+        """
+        if not batch:
+            return True
+        with self.write_lock:
+            writer = None
+            try:
+                writer = self.ix.writer()
+                for doc_id, fields in batch:
+                    if fields is None:
+                        writer.delete_by_term('doc_id', doc_id)
+                    else:
+                        writer.update_document(**fields)
+                writer.commit(merge=(self._commits + 1) % self.merge_every == 0)
+                self._commits += 1
+            except Exception as e:
+                logger.error(f"Failed to commit {len(batch)} documents to the search index: {e!r}")
+                if writer is not None:
+                    try:
+                        writer.cancel()
+                    except Exception:
+                        pass
+                return False
+        self._failures = 0
+        if self.on_commit:
+            try:
+                self.on_commit()
+            except Exception as e:
+                logger.error(f"Search index commit callback failed: {e}")
+        return True
+
+    def _run(self):
+        """Worker loop: waits for a full batch or an expired flush interval and commits.
+        Failed batches are retried; the loop only ends when the writer is closed.
+        """
+        while True:
+            with self._condition:
+                while not self._closed:
+                    backoff = self._retry_at - time.monotonic()
+                    if backoff > 0:
+                        self._condition.wait(backoff)
+                        continue
+                    if len(self._pending) >= self.batch_size:
+                        break
+                    if self._first_pending_at is not None:
+                        remaining = self._first_pending_at + self.flush_interval - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._condition.wait(remaining)
+                    else:
+                        self._condition.wait()
+                if self._closed and not self._pending:
+                    return
+                closing = self._closed
+                batch = self._take_batch()
+            if self._commit(batch):
+                continue
+            if closing:
+                logger.error(f"Dropping {len(batch)} documents that could not be committed to the search index before closing")
+                return
+            self._requeue(batch)
+
+    def flush(self):
+        """Commits all pending documents on the calling thread; a failed batch is left to the worker to retry."""
+        with self._condition:
+            batch = self._take_batch()
+        if not self._commit(batch):
+            self._requeue(batch)
+
+    def reset(self, ix: Index):
+        """Drops pending documents and switches to another index, e.g. after a rebuild.
+        :param ix: Index, The new Whoosh index.
+        """
+        with self._condition, self.write_lock:
+            self._take_batch()
+            self._failures = 0
+            self._retry_at = 0.0
+            self.ix = ix
+
+    @property
+    def pending(self) -> int:
+        """The number of documents waiting to be committed."""
+        return len(self._pending)
+
+    def close(self):
+        """Commits the remaining documents and stops the worker thread."""
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+
+
+class SearcherPool:
+    """A long-lived Whoosh searcher with LRU caches for parsed queries and results.
+
+    The searcher is only refreshed when the index generation changes: after a commit
+    reported through `invalidate`, or when a periodic check finds a newer generation
+    on disk (e.g. written by another process). Results are cached per query string,
+    limit and index generation, so repeated lookups do not touch the index at all.
+    """
+    def __init__(
+        self,
+        ix: Index,
+        parser: QueryParser,
+        cache_size: int = 1024,
+        check_interval: float = 5.0,
+    ):
+        """
+        :param ix: Index, The Whoosh index to search.
+        :param parser: QueryParser, The parser for query strings.
+        :param cache_size: int, Maximum number of cached parsed queries and of cached results, defaults to 1024
+        :param check_interval: float, Seconds between checks for a newer generation on disk, defaults to 5.0
+        """
+        self.parser = parser
+        self.cache_size = max(1, int(cache_size))
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._queries: "OrderedDict[str, Query]" = OrderedDict()
+        self._results: "OrderedDict[Tuple[str, int, Tuple[int, int]], Tuple[str, ...]]" = OrderedDict()
+        self._ix = ix
+        self._searcher: Optional[Searcher] = None
+        self._stale = True
+        self._checked_at = 0.0
+
+    def _put(self, cache: OrderedDict, key: Any, value: Any):
+        cache[key] = value
+        if len(cache) > self.cache_size:
+            cache.popitem(last=False)
+
+    def _get_searcher(self) -> Searcher:
+        """Returns the shared searcher, refreshing it if the index may have changed."""
+        now = time.monotonic()
+        if self._searcher is None:
+            self._searcher = self._ix.searcher()
+        elif self._stale or now - self._checked_at >= self.check_interval:
+            if not self._searcher.up_to_date():
+                self._searcher = self._refreshed(self._searcher)
+                self._results.clear()
+        self._stale = False
+        self._checked_at = now
+        return self._searcher
+
+    def _refreshed(self, searcher: Searcher) -> Searcher:
+        """A searcher on the latest generation of the index.
+
+        A searcher opened on an empty index cannot be refreshed (its EmptyReader has
+        no segments to reuse), so it is reopened instead, as is one whose refresh fails.
+        """
+        if not isinstance(searcher.reader(), EmptyReader):
+            try:
+                return searcher.refresh()
+            except Exception as e:
+                logger.warning(f"Failed to refresh the searcher, reopening it: {e}")
+        searcher.close()
+        return self._ix.searcher()
+
+    def parse(self, query_string: str) -> Query:
+        """Parses a query string, using the LRU cache of parsed queries."""
+        query = self._queries.get(query_string)
+        if query is None:
+            query = self.parser.parse(query_string)
+            self._put(self._queries, query_string, query)
+        else:
+            self._queries.move_to_end(query_string)
+        return query
+
+    def search(self, query_string: str, limit: int = 10) -> List[str]:
+        """Searches the index and returns the stored doc ids of the hits.
+        :param query_string: str, The Whoosh query string.
+        :param limit: int, The maximum number of hits, defaults to 10
+        :return: List[str], The doc ids in ranking order.
+        """
+        with self._lock:
+            searcher = self._get_searcher()
+            key = (query_string, limit, (id(self._ix), searcher.reader().generation()))
+            cached = self._results.get(key)
+            if cached is not None:
+                self._results.move_to_end(key)
+                return list(cached)
+            hits = searcher.search(self.parse(query_string), limit=limit)
+            doc_ids = tuple(hit['doc_id'] for hit in hits)
+            self._put(self._results, key, doc_ids)
+            return list(doc_ids)
+
+    def with_searcher(self, fn: Callable[[Searcher], T]) -> T:
+        """Runs `fn` with the shared searcher, e.g. for searches that need more than doc ids.
+        :param fn: Callable[[Searcher], T], Receives the up-to-date searcher; must not keep it.
+        :return: T, The result of `fn`.
+        """
+        with self._lock:
+            return fn(self._get_searcher())
+
+    def invalidate(self):
+        """Marks the searcher as possibly stale, e.g. after a commit."""
+        self._stale = True
+
+    def reset(self, ix: Index):
+        """Switches to another index, e.g. after a rebuild, and drops the caches.
+        :param ix: Index, The new Whoosh index.
+        """
+        with self._lock:
+            if self._searcher is not None:
+                self._searcher.close()
+            self._ix = ix
+            self._searcher = None
+            self._results.clear()
+
+
+class IndexGenerations:
+    """Keeps a Whoosh index in versioned sub-directories behind an atomic pointer.
+
+    A rebuild writes a complete new generation next to the active one. Activating it
+    only replaces the small CURRENT file (os.replace is atomic), so searchers keep
+    reading the previous generation until the switch. Indexes created before this
+    layout, with the segment files directly in `root`, are used as-is until the
+    first rebuild.
+    """
+    POINTER = "CURRENT"
+
+    def __init__(self, root: str, schema: Schema):
+        """
+        :param root: str, The directory holding the index generations.
+        :param schema: Schema, The Whoosh schema of the index.
+        """
+        self.root = root
+        self.schema = schema
+        os.makedirs(self.root, exist_ok=True)
+
+    def _pointer_file(self) -> str:
+        return os.path.join(self.root, self.POINTER)
+
+    def current_path(self) -> Optional[str]:
+        """The directory of the active generation, or None if there is no index yet."""
+        if os.path.exists(self._pointer_file()):
+            with open(self._pointer_file(), 'r', encoding='utf-8') as f:
+                path = os.path.join(self.root, f.read().strip())
+            if exists_in(path):
+                return path
+        if exists_in(self.root):
+            return self.root
+        return None
+
+    def open_or_create(self) -> Index:
+        """Opens the active generation, creating an empty one if there is none."""
+        path = self.current_path()
+        if path:
+            return open_dir(path, schema=self.schema)
+        name, ix = self.build([])
+        self.activate(name)
+        return ix
+
+    def build(self, docs: Iterable[Dict[str, Any]], procs: int = 1, limitmb: int = 128) -> Tuple[str, Index]:
+        """Writes a new, inactive generation containing the given documents.
+
+        With procs > 1 Whoosh's multiprocessing writer partitions the documents over
+        worker processes that each write a segment; the segments are merged into one
+        on commit.
+        :param docs: Iterable[Dict[str, Any]], The index fields per document.
+        :param procs: int, The number of worker processes, defaults to 1
+        :param limitmb: int, Memory limit per writer process in MB, defaults to 128
+        :return: Tuple[str, Index], The generation name and the opened index.
+        """
+        name = f"gen-{time.time_ns()}"
+        path = os.path.join(self.root, name)
+        os.makedirs(path)
+        ix = create_in(path, self.schema)
+        if procs > 1:
+            writer = ix.writer(procs=procs, limitmb=limitmb, multisegment=False)
+        else:
+            writer = ix.writer(limitmb=limitmb)
+        try:
+            for fields in docs:
+                writer.add_document(**fields)
+            writer.commit()
+        except Exception:
+            writer.cancel()
+            shutil.rmtree(path, ignore_errors=True)
+            raise
+        return name, ix
+
+    def activate(self, name: str):
+        """Atomically makes a generation the active one and removes older generations.
+
+        The generation that was active before is kept, so searchers that still have
+        it open can finish.
+        :param name: str, The generation name returned by `build`.
+        """
+        previous = self.current_path()
+        tmp_file = f"{self._pointer_file()}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            f.write(name)
+        os.replace(tmp_file, self._pointer_file())
+
+        keep = {name, os.path.basename(previous) if previous and previous != self.root else None}
+        for entry in os.listdir(self.root):
+            entry_path = os.path.join(self.root, entry)
+            if entry.startswith("gen-") and entry not in keep and os.path.isdir(entry_path):
+                shutil.rmtree(entry_path, ignore_errors=True)
+            elif os.path.isfile(entry_path) and entry != self.POINTER and previous != self.root:
+                # Segment files of an index from before the generations layout.
+                os.remove(entry_path)
+
+    def reset(self) -> Index:
+        """Removes all generations and activates a new, empty one."""
+        shutil.rmtree(self.root, ignore_errors=True)
+        os.makedirs(self.root, exist_ok=True)
+        return self.open_or_create()
+
+
+class ManagedIndex:
+    """Bundles a Whoosh index with its generations, buffered writer and searcher pool."""
+    def __init__(
+        self,
+        root: str,
+        schema: Schema,
+        parser: QueryParser,
+        batch_size: int = 500,
+        flush_interval: float = 2.0,
+    ):
+        """
+        :param root: str, The directory holding the index generations.
+        :param schema: Schema, The Whoosh schema of the index.
+        :param parser: QueryParser, The parser for query strings.
+        :param batch_size: int, Commit queued updates once this many are pending, defaults to 500
+        :param flush_interval: float, Maximum seconds before queued updates are committed, defaults to 2.0
+        """
+        self.schema = schema
+        self.parser = parser
+        self.generations = IndexGenerations(root, schema)
+        self.ix = self.generations.open_or_create()
+        self.pool = SearcherPool(self.ix, parser)
+        self.writer = BufferedIndexWriter(
+            self.ix, batch_size=batch_size, flush_interval=flush_interval, on_commit=self.pool.invalidate
+        )
+        self._rebuild_lock = threading.Lock()
+        self._touched: Optional[Set[str]] = None
+
+    def update(self, fields: Dict[str, Any]):
+        """Queues a document for the index. See BufferedIndexWriter.update."""
+        self.writer.update(fields)
+        if self._touched is not None:
+            self._touched.add(fields['doc_id'])
+
+    def delete(self, doc_id: str):
+        """Queues the removal of a document. See BufferedIndexWriter.delete."""
+        self.writer.delete(doc_id)
+        if self._touched is not None:
+            self._touched.add(doc_id)
+
+    def flush(self):
+        """Commits all queued updates immediately."""
+        self.writer.flush()
+
+    def search(self, query_string: str, limit: int = 10) -> List[str]:
+        """Returns the doc ids of the hits for a query string. See SearcherPool.search."""
+        return self.pool.search(query_string, limit=limit)
+
+    def _switch(self, ix: Index):
+        self.ix = ix
+        self.writer.reset(ix)
+        self.pool.reset(ix)
+
+    def rebuild(
+        self,
+        all_fields: Callable[[], Iterable[Dict[str, Any]]],
+        fields_for_id: Callable[[str], Optional[Dict[str, Any]]],
+        procs: int = 1,
+    ) -> int:
+        """Builds a new generation with `procs` worker processes and swaps it in atomically.
+
+        Searches keep using the old generation during the build. Documents updated or removed
+        while the build runs are queued again for the new generation after the swap.
+        :param all_fields: Callable[[], Iterable[Dict[str, Any]]], Produces the index fields of all documents.
+        :param fields_for_id: Callable[[str], Optional[Dict[str, Any]]], Returns the current fields of a document, or None if it was removed.
+        :param procs: int, The number of worker processes, defaults to 1
+        :return: int, The number of indexed documents.
+        """
+        with self._rebuild_lock:
+            self._touched = set()
+            count = 0
+
+            def _counted():
+                nonlocal count
+                for fields in all_fields():
+                    count += 1
+                    yield fields
+
+            try:
+                name, ix = self.generations.build(_counted(), procs=procs)
+            except Exception:
+                self._touched = None
+                raise
+            with self.writer.write_lock:
+                self.generations.activate(name)
+                self._switch(ix)
+                touched, self._touched = self._touched, None
+                for doc_id in touched:
+                    if fields := fields_for_id(doc_id):
+                        self.writer.update(fields)
+                    else:
+                        self.writer.delete(doc_id)
+        return count
+
+    def reset(self):
+        """Removes the index and starts with an empty one."""
+        with self.writer.write_lock:
+            self._switch(self.generations.reset())
@@ -0,0 +1,100 @@
+import os
+from typing import Any, Dict, Optional
+import pyarrow as pa
+import pyarrow.parquet as pq
+from .compression import DecodedFieldCache, HeavyFieldCodec
+from .lazy_documents import as_array, heavy_columns, heavy_fields
+from logging import getLogger
+logger = getLogger("Contenttransformatie")
+
+# Schema metadata recording which Parquet file a snapshot was made from.
+_SOURCE_SIZE = b"source_size"
+_SOURCE_MTIME = b"source_mtime_ns"
+
+
+def snapshot_path(parquet_path: str) -> str:
+    """The snapshot file belonging to a documents Parquet file."""
+    return f"{os.path.splitext(parquet_path)[0]}.arrow"
+
+
+def _source_stamp(parquet_path: str) -> Dict[bytes, bytes]:
+    stat = os.stat(parquet_path)
+    return {_SOURCE_SIZE: str(stat.st_size).encode(), _SOURCE_MTIME: str(stat.st_mtime_ns).encode()}
+
+
+def write_snapshot(parquet_path: str, table: Optional[pa.Table] = None) -> bool:
+    """Writes an uncompressed Arrow IPC snapshot of a documents Parquet file.
+
+    The table is written as a single record batch, so every column maps to one
+    contiguous buffer. The size and mtime of the Parquet file are recorded in the
+    schema metadata to detect a stale snapshot.
+    :param parquet_path: str, The Parquet file the snapshot is made from.
+    :param table: Optional[pa.Table], The contents of the Parquet file if already in memory, defaults to None
+    :return: bool, True if the snapshot was written.
+    """
+    path = snapshot_path(parquet_path)
+    tmp_file = f"{path}.{os.getpid()}.tmp"
+    try:
+        if table is None:
+            table = pq.read_table(parquet_path)
+        schema = table.schema.with_metadata({**(table.schema.metadata or {}), **_source_stamp(parquet_path)})
+        table = table.replace_schema_metadata(schema.metadata).combine_chunks()
+        with pa.OSFile(tmp_file, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table, max_chunksize=max(1, table.num_rows))
+        os.replace(tmp_file, path)
+    except Exception as e:
+        logger.warning(f"Could not write snapshot {path}: {e}")
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        return False
+    return True
+
+
+def open_snapshot(parquet_path: str) -> Optional[pa.Table]:
+    """Memory-maps the snapshot of a documents Parquet file.
+
+    The returned table references the mapped file without copying, so opening is
+    independent of the store size and processes mapping the same file share its pages.
+    :param parquet_path: str, The Parquet file the snapshot belongs to.
+    :return: Optional[pa.Table], The mapped table, or None if there is no up-to-date snapshot.
+    """
+    path = snapshot_path(parquet_path)
+    if not os.path.exists(path) or not os.path.exists(parquet_path):
+        return None
+    try:
+        table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+    except Exception as e:
+        logger.warning(f"Could not open snapshot {path}: {e}")
+        return None
+    metadata = table.schema.metadata or {}
+    stamp = _source_stamp(parquet_path)
+    if any(metadata.get(key) != value for key, value in stamp.items()):
+        return None
+    return table
+
+
+class MappedFieldLoader:
+    """Serves heavy document fields straight from a memory-mapped snapshot.
+
+    Same interface as HeavyFieldLoader. The operating system's page cache takes the
+    place of the row group cache.
+    """
+    def __init__(self, table: pa.Table, codec: Optional[HeavyFieldCodec] = None, decoded_cache_size: int = 256):
+        """
+        :param table: pa.Table, The mapped snapshot, in document row order.
+        :param codec: Optional[HeavyFieldCodec], The codec of the snapshot's compressed column, defaults to None
+        :param decoded_cache_size: int, The maximum number of decoded documents kept in memory, defaults to 256
+        """
+        self._columns = {name: as_array(table.column(name)) for name in heavy_columns() if name in table.column_names}
+        self._decoded = DecodedFieldCache(codec, decoded_cache_size) if codec else None
+
+    def open(self):
+        """Nothing to open: the snapshot is already mapped."""
+
+    def fetch(self, row: int) -> Dict[str, Any]:
+        """Fetches the heavy fields of a single document.
+        :param row: int, The row of the document in the snapshot.
+        :return: Dict[str, Any], 'content' and the non-null heavy metadata keys.
+        """
+        return heavy_fields(row, {column: values[row].as_py() for column, values in self._columns.items()}, self._decoded)
@@ -0,0 +1,802 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+from collections.abc import Mapping
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, Union
+import pyarrow as pa
+from .document import Document, SimpleDocument
+from .document_schema import LIGHT_METADATA_KEYS
+from .metadata_index import IN, PATH, PATH_SEPARATOR, PREFIX, condition_matches
+from .rwlock import ReadWriteLock
+from .search_index import TEXT_FIELD_BOOSTS
+from .taxonomy_index import TAXONOMY_LEVELS, TaxonomyIndex
+from .versions import CHANGED, NEW, REMOVED, UNCHANGED, UPDATED, DocumentVersion, content_hash
+from logging import getLogger
+logger = getLogger("Contenttransformatie")
+
+# SQLite allows at most 999 bound parameters per statement on older builds.
+_MAX_PARAMS = 900
+# Free text is turned into OR-ed prefix terms unless it already uses FTS5 query syntax.
+_FTS_SYNTAX = re.compile(r'["():*^]|\b(AND|OR|NOT|NEAR)\b')
+_WORD = re.compile(r"\w+", re.UNICODE)
+# The current time in seconds since the epoch, in SQL.
+_NOW = "((julianday('now') - 2440587.5) * 86400.0)"
+
+
+def _quote(name: str) -> str:
+    """Quotes an SQL identifier."""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _column(key: str) -> str:
+    """The quoted column holding a promoted metadata key."""
+    return _quote(f"meta_{key}")
+
+
+def _scalar(value: Any) -> Any:
+    """The value stored in a promoted column: strings and numbers only."""
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (str, int)) or (isinstance(value, float) and value == value):
+        return value
+    return None
+
+
+def _stored(value: Any) -> Any:
+    """The value stored in a promoted column: strings and numbers, and a list as a JSON array,
+    so list-valued keys such as tags stay searchable and countable."""
+    if isinstance(value, (list, tuple)):
+        return json.dumps([_scalar(element) for element in value], ensure_ascii=False)
+    return _scalar(value)
+
+
+def _fts_syntax_error(error: sqlite3.OperationalError) -> bool:
+    """Whether an error comes from malformed FTS5 query syntax, e.g. an unterminated quote or an unknown `column:` filter."""
+    message = str(error)
+    return message.startswith(("fts5:", "unterminated string", "no such column"))
+
+
+def _chunks(items: Sequence[Any], size: int = _MAX_PARAMS) -> Iterator[Sequence[Any]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def fts_query(text: str) -> str:
+    """Turns free text into an FTS5 query: every word as a prefix term, OR-ed.
+
+    FTS5 has no Dutch stemmer; matching words by prefix catches most inflections
+    ('aangifte' also finds 'aangiften'). Text that already uses FTS5 syntax
+    (quotes, AND/OR/NOT, column filters) is passed through unchanged.
+    :param text: str, The user query.
+    :return: str, The FTS5 query.
+    """
+    if _FTS_SYNTAX.search(text):
+        return text
+    return " OR ".join(f'"{word}"*' for word in _WORD.findall(text))
+
+
+class SQLiteDocuments(Mapping):
+    """A read-only dict view (id -> Document) on the documents table of a SQLiteDocumentStore.
+
+    Documents are read from the database on access instead of being kept in memory.
+    """
+    def __init__(self, store: "SQLiteDocumentStore"):
+        self._store = store
+
+    def __getitem__(self, doc_id: str) -> Document:
+        doc = self._store.get(doc_id)
+        if doc is None:
+            raise KeyError(doc_id)
+        return doc
+
+    def __contains__(self, doc_id: object) -> bool:
+        return self._store.contains(doc_id)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._store.get_all_ids())
+
+    def __len__(self) -> int:
+        return self._store._connection().execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def values(self) -> List[Document]:
+        return self._store.get_all()
+
+    def items(self) -> List[Tuple[str, Document]]:
+        return [(doc.id, doc) for doc in self._store.get_all()]
+
+
+class SQLiteDocumentStore:
+    """A DocumentStore on a single SQLite database, with the same public API.
+
+    Every document is one row of the `documents` table: id, title, content and the
+    full metadata as JSON. The taxonomy levels, the indexed metadata keys and the
+    question and summary are also written to their own (B-tree indexed) columns, so
+    metadata filters are SQL queries. An FTS5 table over title, question, summary
+    and content replaces the Whoosh full-text index, and a second one over the
+    indexed keys serves `search`. Both are kept in sync by triggers, so an `add`
+    is one transaction: documents are searchable as soon as it returns. Triggers
+    also append every change to the `versions` table, the version log of the store.
+
+    The database runs in WAL mode: every thread reads on its own connection while
+    a single writer commits, and nothing but the taxonomy index is held in memory.
+    The taxonomy index reflects the writes of this process; reopen the store to
+    pick up writes of other processes.
+    """
+    def __init__(
+        self,
+        source_name: str,
+        data_root: str = "data",
+        indexed_metadata_keys: Optional[List[str]] = None,
+        full_text_search: bool = False,
+        busy_timeout: float = 30.0,
+    ):
+        """Opens (or creates) the database of a document store.
+        :param source_name: str, A unique name for the data source, used for creating storage directories.
+        :param data_root: str, The root directory where data will be stored, defaults to "data"
+        :param indexed_metadata_keys: Optional[List[str]], Metadata keys to index for filtering and `search`, defaults to None
+        :param full_text_search: bool, If True, maintains the FTS5 index used by `search_text`, defaults to False
+        :param busy_timeout: float, Seconds a connection waits for a lock held by another writer, defaults to 30.0
+        """
+        self.source_name = source_name
+        self.data_root = data_root
+        self.indexed_metadata_keys = indexed_metadata_keys or []
+        self.busy_timeout = busy_timeout
+
+        self.store_path = os.path.join(self.data_root, self.source_name)
+        os.makedirs(self.store_path, exist_ok=True)
+        self.persistence_file = os.path.join(self.store_path, "documents.sqlite")
+
+        # Keys with their own column: filters on them use an index, the rest reads the JSON.
+        self.promoted_keys: Tuple[str, ...] = tuple(dict.fromkeys(
+            [*TAXONOMY_LEVELS, *self.indexed_metadata_keys, "VRAAG", "summary"]
+        ))
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        # Guards the in-memory taxonomy index; the database does its own locking.
+        self._lock = ReadWriteLock()
+        self.documents = SQLiteDocuments(self)
+        # Promoted keys holding a list in some document; their column stores a JSON array.
+        self.list_keys: Set[str] = set()
+
+        with self._write_lock:
+            self._create_schema()
+            self._sync_metadata_search(self.indexed_metadata_keys)
+            self.text_index = self._sync_text_search(full_text_search)
+
+        self.taxonomy_index = TaxonomyIndex()
+        levels = ", ".join(_column(level) for level in TAXONOMY_LEVELS)
+        for row in self._connection().execute(f"SELECT id, {levels} FROM documents"):
+            self.taxonomy_index.add(row[0], dict(zip(TAXONOMY_LEVELS, row[1:])))
+
+    def _connection(self) -> sqlite3.Connection:
+        """The connection of the calling thread, opened on first use."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.persistence_file, timeout=self.busy_timeout, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _transaction(self):
+        """Starts a write transaction on the calling thread's connection. Use with the write lock held."""
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        return connection
+
+    def _create_schema(self):
+        """Creates the documents table and adds a column and index for every promoted key."""
+        connection = self._transaction()
+        try:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS documents (id TEXT PRIMARY KEY, title TEXT, content TEXT, metadata TEXT NOT NULL)"
+            )
+            connection.execute("CREATE TABLE IF NOT EXISTS store_info (key TEXT PRIMARY KEY, value TEXT)")
+            row = connection.execute("SELECT value FROM store_info WHERE key = 'list_keys'").fetchone()
+            self.list_keys = set(json.loads(row[0])) if row else set()
+            existing = {row[1] for row in connection.execute("PRAGMA table_info(documents)")}
+            # Documents stored before versions were tracked have version 0 and no hash.
+            if "content_hash" not in existing:
+                connection.execute("ALTER TABLE documents ADD COLUMN content_hash TEXT")
+            if "version" not in existing:
+                connection.execute("ALTER TABLE documents ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS versions (doc_id TEXT NOT NULL, version INTEGER NOT NULL, "
+                "content_hash TEXT NOT NULL, change TEXT NOT NULL, timestamp REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS idx_versions_doc ON versions(doc_id, version)")
+            connection.execute(f"""CREATE TRIGGER IF NOT EXISTS versions_ai AFTER INSERT ON documents BEGIN
+                INSERT INTO versions VALUES (new.id, new.version, new.content_hash, '{NEW}', {_NOW}); END""")
+            connection.execute(f"""CREATE TRIGGER IF NOT EXISTS versions_au AFTER UPDATE OF version ON documents BEGIN
+                INSERT INTO versions VALUES (new.id, new.version, new.content_hash,
+                    CASE WHEN old.content_hash IS NULL THEN '{NEW}'
+                         WHEN old.content_hash = new.content_hash THEN '{UPDATED}' ELSE '{CHANGED}' END, {_NOW}); END""")
+            connection.execute(f"""CREATE TRIGGER IF NOT EXISTS versions_ad AFTER DELETE ON documents BEGIN
+                INSERT INTO versions VALUES (old.id, old.version + 1, '', '{REMOVED}', {_NOW}); END""")
+            added = [key for key in self.promoted_keys if f"meta_{key}" not in existing]
+            for key in added:
+                connection.execute(f"ALTER TABLE documents ADD COLUMN {_column(key)}")
+                connection.execute(f"CREATE INDEX IF NOT EXISTS {_quote(f'idx_meta_{key}')} ON documents({_column(key)})")
+            if added:
+                # Fill the new columns from the JSON of the existing documents.
+                assignments = ", ".join(f"{_column(key)} = ?" for key in added)
+                rows = connection.execute("SELECT id, metadata FROM documents").fetchall()
+                lists = set()
+                for doc_id, raw in rows:
+                    metadata = json.loads(raw)
+                    lists.update(key for key in added if isinstance(metadata.get(key), (list, tuple)))
+                    connection.execute(
+                        f"UPDATE documents SET {assignments} WHERE id = ?",
+                        [*(_stored(metadata.get(key)) for key in added), doc_id],
+                    )
+                self._add_list_keys(connection, lists)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def _add_list_keys(self, connection: sqlite3.Connection, keys: Set[str]):
+        """Records promoted keys found to hold lists. Use within a write transaction."""
+        if keys - self.list_keys:
+            self.list_keys = self.list_keys | keys
+            connection.execute("INSERT OR REPLACE INTO store_info VALUES ('list_keys', ?)", (json.dumps(sorted(self.list_keys)),))
+
+    def _info(self, key: str) -> Optional[str]:
+        row = self._connection().execute("SELECT value FROM store_info WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _sync_metadata_search(self, keys: List[str], rebuild: bool = False):
+        """(Re)creates the FTS5 table over the indexed keys when the keys changed. Use with the write lock held."""
+        wanted = json.dumps(sorted(keys))
+        if not rebuild and self._info("metadata_search_keys") == wanted:
+            return
+        connection = self._transaction()
+        try:
+            connection.execute("DROP TABLE IF EXISTS metadata_fts")
+            for trigger in ("metadata_fts_ai", "metadata_fts_ad", "metadata_fts_au"):
+                connection.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+            if keys:
+                names = ", ".join(_quote(key) for key in keys)
+                columns = ", ".join(_column(key) for key in keys)
+                new_values = ", ".join(f"new.{_column(key)}" for key in keys)
+                connection.execute(f"CREATE VIRTUAL TABLE metadata_fts USING fts5({names}, tokenize='unicode61 remove_diacritics 2')")
+                connection.execute(f"INSERT INTO metadata_fts(rowid, {names}) SELECT rowid, {columns} FROM documents")
+                connection.execute(f"""CREATE TRIGGER metadata_fts_ai AFTER INSERT ON documents BEGIN
+                    INSERT INTO metadata_fts(rowid, {names}) VALUES (new.rowid, {new_values}); END""")
+                connection.execute("""CREATE TRIGGER metadata_fts_ad AFTER DELETE ON documents BEGIN
+                    DELETE FROM metadata_fts WHERE rowid = old.rowid; END""")
+                connection.execute(f"""CREATE TRIGGER metadata_fts_au AFTER UPDATE ON documents BEGIN
+                    DELETE FROM metadata_fts WHERE rowid = old.rowid;
+                    INSERT INTO metadata_fts(rowid, {names}) VALUES (new.rowid, {new_values}); END""")
+            connection.execute("INSERT OR REPLACE INTO store_info VALUES ('metadata_search_keys', ?)", (wanted,))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def _sync_text_search(self, enabled: bool, rebuild: bool = False) -> bool:
+        """Creates or drops the FTS5 full-text table. Use with the write lock held.
+        :return: bool, Whether full-text search is available.
+        """
+        exists = self._connection().execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'documents_fts'"
+        ).fetchone() is not None
+        if exists == enabled and not rebuild:
+            return enabled
+        connection = self._transaction()
+        try:
+            connection.execute("DROP TABLE IF EXISTS documents_fts")
+            for trigger in ("documents_fts_ai", "documents_fts_ad", "documents_fts_au"):
+                connection.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+            if enabled:
+                # External content: the text is read from the documents table, not stored twice.
+                columns = f"title, {_column('VRAAG')}, {_column('summary')}, content"
+                old_values = f"old.title, old.{_column('VRAAG')}, old.{_column('summary')}, old.content"
+                new_values = f"new.title, new.{_column('VRAAG')}, new.{_column('summary')}, new.content"
+                connection.execute(f"""CREATE VIRTUAL TABLE documents_fts USING fts5({columns},
+                    content='documents', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2')""")
+                connection.execute(f"""CREATE TRIGGER documents_fts_ai AFTER INSERT ON documents BEGIN
+                    INSERT INTO documents_fts(rowid, {columns}) VALUES (new.rowid, {new_values}); END""")
+                connection.execute(f"""CREATE TRIGGER documents_fts_ad AFTER DELETE ON documents BEGIN
+                    INSERT INTO documents_fts(documents_fts, rowid, {columns}) VALUES ('delete', old.rowid, {old_values}); END""")
+                connection.execute(f"""CREATE TRIGGER documents_fts_au AFTER UPDATE ON documents BEGIN
+                    INSERT INTO documents_fts(documents_fts, rowid, {columns}) VALUES ('delete', old.rowid, {old_values});
+                    INSERT INTO documents_fts(rowid, {columns}) VALUES (new.rowid, {new_values}); END""")
+                connection.execute("INSERT INTO documents_fts(documents_fts) VALUES ('rebuild')")
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return enabled
+
+    def rebuild_search_index(self, procs: Optional[int] = None, background: bool = False) -> Optional[threading.Thread]:
+        """Rebuilds the FTS5 table over the indexed metadata keys from the documents table.
+        :param procs: Optional[int], Unused; kept for compatibility with DocumentStore, defaults to None
+        :param background: bool, If True, rebuild on a background thread and return it, defaults to False
+        :return: Optional[threading.Thread], The rebuild thread when background is True.
+        """
+        if not self.indexed_metadata_keys:
+            print("Warning: No metadata keys configured for indexing. Cannot build index.")
+            return None
+        return self._run(lambda: self._sync_metadata_search(self.indexed_metadata_keys, rebuild=True), background)
+
+    def rebuild_text_index(self, procs: Optional[int] = None, background: bool = False) -> Optional[threading.Thread]:
+        """Rebuilds the FTS5 full-text table from the documents table.
+        :param procs: Optional[int], Unused; kept for compatibility with DocumentStore, defaults to None
+        :param background: bool, If True, rebuild on a background thread and return it, defaults to False
+        :return: Optional[threading.Thread], The rebuild thread when background is True.
+        """
+        if not self.text_index:
+            print("Warning: Full-text search is not enabled. Cannot build the full-text index.")
+            return None
+        return self._run(lambda: self._sync_text_search(True, rebuild=True), background)
+
+    def _run(self, rebuild, background: bool) -> Optional[threading.Thread]:
+        def _locked():
+            with self._write_lock:
+                rebuild()
+            print("Successfully rebuilt the index.")
+
+        if background:
+            thread = threading.Thread(target=_locked, name="sqlite-rebuild", daemon=True)
+            thread.start()
+            return thread
+        _locked()
+        return None
+
+    def add(self,
+            docs_to_add: Union[Document, List[Document]],
+            refresh: bool = False,
+            update_index: bool = True,
+            save = False
+           ):
+        """Adds or updates one or more documents in a single transaction.
+
+        Unchanged documents are skipped unless `refresh` is set. The full-text and
+        metadata search tables are updated by triggers in the same transaction.
+        Every written document gets a new version with its content hash.
+        :param docs_to_add: Union[Document, List[Document]], The document or list of documents to add.
+        :param refresh: bool, If True, rewrites the documents even if they appear unchanged, defaults to False
+        :param update_index: bool, Unused: the search tables are always updated, defaults to True
+        :param save: bool, Unused: every add is committed, defaults to False
+        """
+        if not isinstance(docs_to_add, list):
+            docs_to_add = [docs_to_add]
+        if not docs_to_add:
+            return
+
+        keys = ", ".join(_column(key) for key in self.promoted_keys)
+        placeholders = ", ".join("?" for _ in range(5 + len(self.promoted_keys)))
+        updates = ", ".join(
+            f"{name} = excluded.{name}"
+            for name in ["title", "content", "metadata", "content_hash", *map(_column, self.promoted_keys)]
+        )
+        unchanged = "" if refresh else \
+            " WHERE title IS NOT excluded.title OR content IS NOT excluded.content OR metadata IS NOT excluded.metadata"
+        # A re-added document continues the version numbers of its history.
+        statement = (f"INSERT INTO documents (id, title, content, metadata, content_hash, {keys}, version) "
+                     f"VALUES ({placeholders}, COALESCE((SELECT MAX(version) FROM versions WHERE doc_id = ?), 0) + 1) "
+                     f"ON CONFLICT(id) DO UPDATE SET {updates}, version = documents.version + 1{unchanged}")
+        rows = [
+            [doc.id, doc.title, doc.content, json.dumps(doc.metadata or {}, ensure_ascii=False), content_hash(doc),
+             *(_stored((doc.metadata or {}).get(key)) for key in self.promoted_keys), doc.id]
+            for doc in docs_to_add
+        ]
+        lists = {
+            key for doc in docs_to_add for key in self.promoted_keys
+            if isinstance((doc.metadata or {}).get(key), (list, tuple))
+        }
+
+        with self._write_lock:
+            connection = self._transaction()
+            try:
+                connection.executemany(statement, rows)
+                self._add_list_keys(connection, lists)
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            with self._lock.write():
+                for doc in docs_to_add:
+                    self.taxonomy_index.add(doc.id, doc.metadata or {})
+
+    def remove(self, doc_ids: Union[str, Iterable[str]], update_index: bool = True, save: bool = False) -> List[str]:
+        """Removes documents in a single transaction; the triggers update the search tables and the version log.
+        :param doc_ids: Union[str, Iterable[str]], The id or ids of the documents to remove.
+        :param update_index: bool, Unused: the search tables are always updated, defaults to True
+        :param save: bool, Unused: every removal is committed, defaults to False
+        :return: List[str], The ids that were in the store and have been removed.
+        """
+        if isinstance(doc_ids, str):
+            doc_ids = [doc_ids]
+        doc_ids = list(dict.fromkeys(doc_ids))
+        removed = []
+        with self._write_lock:
+            connection = self._transaction()
+            try:
+                for chunk in _chunks(doc_ids):
+                    placeholders = ", ".join("?" for _ in chunk)
+                    removed += [row[0] for row in connection.execute(
+                        f"SELECT id FROM documents WHERE id IN ({placeholders})", list(chunk)
+                    )]
+                    connection.execute(f"DELETE FROM documents WHERE id IN ({placeholders})", list(chunk))
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            with self._lock.write():
+                for doc_id in removed:
+                    self.taxonomy_index.remove(doc_id)
+        return removed
+
+    def classify_changes(self, docs: Iterable[Document]) -> Dict[str, List[str]]:
+        """Compares a complete export of the source with the store by content hash.
+
+        See DocumentStore.classify_changes. Documents stored before versions were
+        tracked are hashed once and get their first version.
+        :param docs: Iterable[Document], The documents of the export.
+        :return: Dict[str, List[str]], The document ids per class: "new", "changed", "unchanged" and "removed".
+        """
+        connection = self._connection()
+        legacy = [row[0] for row in connection.execute("SELECT id FROM documents WHERE content_hash IS NULL")]
+        if legacy:
+            with self._write_lock:
+                connection = self._transaction()
+                try:
+                    for doc_id in legacy:
+                        if doc := self.get(doc_id):
+                            connection.execute(
+                                "UPDATE documents SET content_hash = ?, version = version + 1 WHERE id = ?",
+                                (content_hash(doc), doc_id),
+                            )
+                    connection.execute("COMMIT")
+                except BaseException:
+                    connection.execute("ROLLBACK")
+                    raise
+
+        stored = dict(connection.execute("SELECT id, content_hash FROM documents"))
+        result: Dict[str, List[str]] = {NEW: [], CHANGED: [], UNCHANGED: [], REMOVED: []}
+        seen = set()
+        for doc in docs:
+            seen.add(doc.id)
+            if doc.id not in stored:
+                result[NEW].append(doc.id)
+            elif stored[doc.id] != content_hash(doc):
+                result[CHANGED].append(doc.id)
+            else:
+                result[UNCHANGED].append(doc.id)
+        result[REMOVED] = [doc_id for doc_id in self.get_all_ids() if doc_id not in seen]
+        return result
+
+    def version(self, doc_id: str) -> Optional[int]:
+        """The current version number of a document, or None if it has no recorded version."""
+        row = self._connection().execute("SELECT version FROM documents WHERE id = ?", (doc_id,)).fetchone()
+        return row[0] or None if row else None
+
+    def history(self, doc_id: str) -> List[DocumentVersion]:
+        """All recorded versions of a document, oldest first."""
+        rows = self._connection().execute(
+            "SELECT doc_id, version, content_hash, change, timestamp FROM versions WHERE doc_id = ? ORDER BY version",
+            (doc_id,),
+        )
+        return [DocumentVersion(*row) for row in rows]
+
+    def flush_index(self):
+        """Nothing to flush: the search tables are updated in the same transaction as the documents."""
+
+    def save(self):
+        """Checkpoints the write-ahead log into the database file. Every add is already durable."""
+        self._connection().execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def compact(self):
+        """Merges the FTS5 index segments and truncates the write-ahead log."""
+        with self._write_lock:
+            connection = self._connection()
+            for table, enabled in (("documents_fts", self.text_index), ("metadata_fts", self.indexed_metadata_keys)):
+                if enabled:
+                    connection.execute(f"INSERT INTO {table}({table}) VALUES ('optimize')")
+            connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def clear(self):
+        """Deletes all documents; the search tables are emptied by the triggers."""
+        print(f"Clearing DocumentStore at {self.store_path}...")
+        with self._write_lock:
+            connection = self._transaction()
+            try:
+                connection.execute("DELETE FROM documents")
+                connection.execute("DELETE FROM versions")
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            with self._lock.write():
+                self.taxonomy_index.clear()
+        print("DocumentStore cleared.")
+
+    @staticmethod
+    def _document(doc_id: str, title: str, content: str, metadata: str) -> Document:
+        return SimpleDocument(id=doc_id, title=title, content=content, metadata=json.loads(metadata))
+
+    def get(self, doc_id: str) -> Optional[Document]:
+        """Retrieves a single document by its ID.
+        :param doc_id: str, The ID of the document to retrieve.
+        :return: Optional[Document], The document if found, otherwise None.
+        """
+        row = self._connection().execute(
+            "SELECT id, title, content, metadata FROM documents WHERE id = ?", (doc_id,)
+        ).fetchone()
+        return self._document(*row) if row else None
+
+    def contains(self, id: str) -> bool:
+        return self._connection().execute("SELECT 1 FROM documents WHERE id = ?", (id,)).fetchone() is not None
+
+    def get_all(self) -> List[Document]:
+        """Retrieves all documents from the store.
+        :return: List[Document], A list of all documents.
+        """
+        rows = self._connection().execute("SELECT id, title, content, metadata FROM documents ORDER BY rowid")
+        return [self._document(*row) for row in rows]
+
+    def get_all_ids(self) -> List[str]:
+        """Retrieves the IDs of all documents in the store.
+        :return: List[str], A list of all document IDs.
+        """
+        return [row[0] for row in self._connection().execute("SELECT id FROM documents ORDER BY rowid")]
+
+    def get_many(
+        self,
+        doc_ids: Iterable[str],
+        fields: Optional[Sequence[str]] = None,
+        as_table: bool = False,
+    ) -> Union[List[Document], List[Dict[str, Any]], pa.Table]:
+        """Retrieves a batch of documents in the order of `doc_ids`, optionally projected to some fields.
+
+        Same contract as DocumentStore.get_many. Only the columns needed for the
+        requested fields are read; content is not read unless requested.
+        :param doc_ids: Iterable[str], The ids of the documents to retrieve.
+        :param fields: Optional[Sequence[str]], 'title', 'content', 'metadata' (the full dict) or metadata keys.
+                       Defaults to None, which returns the Document objects.
+        :param as_table: bool, If True, returns a pyarrow Table with an 'id' column and a column per field, defaults to False
+        :return: Union[List[Document], List[Dict[str, Any]], pa.Table], The documents, one dict per document
+                 with 'id' and the fields, or the same rows as a table.
+        """
+        doc_ids = list(doc_ids)
+        if fields is None and not as_table:
+            found = self._select(doc_ids, "title, content, metadata")
+            return [self._document(doc_id, *found[doc_id]) for doc_id in doc_ids if doc_id in found]
+
+        fields = list(fields) if fields is not None else ['title', *LIGHT_METADATA_KEYS]
+        keys = [f for f in fields if f not in ('id', 'title', 'content', 'metadata')]
+        found = self._select(doc_ids, "title, content, metadata" if 'content' in fields else "title, NULL, metadata")
+        rows = []
+        for doc_id in doc_ids:
+            if doc_id not in found:
+                continue
+            title, content, raw = found[doc_id]
+            metadata = json.loads(raw) if keys or 'metadata' in fields else {}
+            values = {'title': title, 'content': content, 'metadata': metadata}
+            row: Dict[str, Any] = {'id': doc_id}
+            for field in fields:
+                if field != 'id':
+                    row[field] = values[field] if field in values else metadata.get(field)
+            rows.append(row)
+        if not as_table:
+            return rows
+        return pa.table({name: [row.get(name) for row in rows] for name in ['id', *fields]})
+
+    def _select(self, doc_ids: List[str], columns: str) -> Dict[str, Tuple[Any, ...]]:
+        """Reads some columns of the given documents, in chunks of bound parameters."""
+        found = {}
+        connection = self._connection()
+        for chunk in _chunks(list(dict.fromkeys(doc_ids))):
+            placeholders = ", ".join("?" for _ in chunk)
+            for doc_id, *values in connection.execute(
+                f"SELECT id, {columns} FROM documents WHERE id IN ({placeholders})", list(chunk)
+            ):
+                found[doc_id] = tuple(values)
+        return found
+
+    def _filter_clause(self, metadata_filter: Dict[str, Any], table: str = "documents") -> Tuple[str, List[Any], Dict[str, Any]]:
+        """Translates the conditions on promoted keys of a metadata filter to SQL.
+        :param metadata_filter: Dict[str, Any], The filter (see `get_doc_ids_by_metadata`).
+        :param table: str, The name or alias of the documents table; columns are qualified with it, as
+                      documents_fts has columns of the same name, defaults to "documents"
+        :return: Tuple[str, List[Any], Dict[str, Any]], The WHERE clause, its parameters and the conditions left to check in Python.
+        """
+        clauses, params, remaining = [], [], {}
+        for key, condition in metadata_filter.items():
+            column = f"{table}.{_column(key)}"
+            if key not in self.promoted_keys or key in self.list_keys:
+                # List-valued keys match per element (see metadata_index), checked on the metadata JSON.
+                remaining[key] = condition
+                continue
+            if isinstance(condition, dict) and PREFIX in condition and isinstance(condition[PREFIX], str):
+                clauses.append(f"substr({column}, 1, ?) = ?")
+                params += [len(condition[PREFIX]), condition[PREFIX]]
+                continue
+            if isinstance(condition, dict) and PATH in condition and isinstance(condition[PATH], str):
+                below = condition[PATH] + PATH_SEPARATOR
+                clauses.append(f"({column} = ? OR substr({column}, 1, ?) = ?)")
+                params += [condition[PATH], len(below), below]
+                continue
+            if (isinstance(condition, dict) and IN not in condition) or isinstance(condition, (list, tuple, set)):
+                # Exact list values are compared in Python.
+                remaining[key] = condition
+                continue
+            values = condition[IN] if isinstance(condition, dict) else [condition]
+            values = list(values)
+            if any(_scalar(value) is None or isinstance(value, bool) for value in values):
+                remaining[key] = condition
+                continue
+            if not values:
+                clauses.append("0")
+                continue
+            clauses.append(f"{column} IN ({', '.join('?' for _ in values)})")
+            params += values
+        return " AND ".join(clauses) or "1", params, remaining
+
+    def get_doc_ids_by_metadata(self, metadata_filter: Dict[str, Any]) -> Set[str]:
+        """Gets a set of document IDs that match a metadata filter.
+
+        Each condition is an exact value or a dict with an `$in`, `$prefix` or `$path` operator;
+        list-valued metadata matches if any element does (see metadata_index). Conditions on promoted keys
+        are evaluated in SQL on their indexed columns; the remaining conditions are
+        checked on the metadata JSON of the resulting candidates only.
+        :param metadata_filter: Dict[str, Any], The key-value pairs to filter by.
+        :return: Set[str], A set of matching document IDs.
+        """
+        if not metadata_filter:
+            return set(self.get_all_ids())
+        where, params, remaining = self._filter_clause(metadata_filter)
+        if not remaining:
+            return {row[0] for row in self._connection().execute(f"SELECT id FROM documents WHERE {where}", params)}
+        rows = self._connection().execute(f"SELECT id, metadata FROM documents WHERE {where}", params)
+        matching_ids = set()
+        for doc_id, raw in rows:
+            metadata = json.loads(raw)
+            if all(condition_matches(metadata.get(k), v) for k, v in remaining.items()):
+                matching_ids.add(doc_id)
+        return matching_ids
+
+    def resolve_taxonomy(self, criteria: Dict[str, Optional[str]], contains: bool = True) -> Dict[str, List[str]]:
+        """Resolves free text on the taxonomy levels to the exact values in the store (see taxonomy_index).
+        :param criteria: Dict[str, Optional[str]], Free text per taxonomy level, e.g. {"BELASTINGSOORT": "inkomsten"}.
+        :param contains: bool, Match values containing the text if True, starting with it otherwise, defaults to True
+        :return: Dict[str, List[str]], The matched values per given level.
+        """
+        with self._lock.read():
+            return self.taxonomy_index.resolve_path(criteria, contains=contains)
+
+    def get_doc_ids_by_taxonomy(self, criteria: Dict[str, Optional[str]], contains: bool = True) -> Set[str]:
+        """Gets the ids of documents matching free text on the taxonomy levels.
+
+        The text per level is resolved to exact values via the taxonomy index (see
+        taxonomy_index), which are then looked up as an IN filter.
+        :param criteria: Dict[str, Optional[str]], Free text per taxonomy level, e.g. {"BELASTINGSOORT": "inkomsten"}.
+        :param contains: bool, Match values containing the text if True, starting with it otherwise, defaults to True
+        :return: Set[str], The matching document ids.
+        """
+        resolved = self.resolve_taxonomy(criteria, contains=contains)
+        if any(not values for values in resolved.values()):
+            return set()
+        if not resolved:
+            return set(self.get_all_ids())
+        return self.get_doc_ids_by_metadata({level: {"$in": values} for level, values in resolved.items()})
+
+    def search_taxonomy(self, criteria: Dict[str, Optional[str]], contains: bool = True, limit: Optional[int] = None) -> List[Document]:
+        """Returns the documents matching free text on the taxonomy levels, ordered by id.
+        :param criteria: Dict[str, Optional[str]], Free text per taxonomy level.
+        :param contains: bool, Match values containing the text if True, starting with it otherwise, defaults to True
+        :param limit: Optional[int], The maximum number of documents, defaults to None (all)
+        :return: List[Document], The matching documents.
+        """
+        doc_ids = sorted(self.get_doc_ids_by_taxonomy(criteria, contains=contains))
+        return self.get_many(doc_ids[:limit])
+
+    def facet_counts(self, key: str, parent: Optional[str] = None) -> Dict[Any, int]:
+        """Returns the number of documents per value of a metadata key.
+        :param key: str, A taxonomy level or an indexed metadata key.
+        :param parent: Optional[str], For a taxonomy level, only count documents under this value of the level above, defaults to None
+        :return: Dict[Any, int], The number of documents per value.
+        :raises ValueError: If the key is neither a taxonomy level nor indexed, or a parent is given for a non-taxonomy key.
+        """
+        if key in self.taxonomy_index.levels:
+            with self._lock.read():
+                return self.taxonomy_index.counts(key, parent=parent)
+        if key in self.indexed_metadata_keys and parent is None:
+            column = _column(key)
+            if key in self.list_keys:
+                # Counted per element, like the MetadataIndex of the Parquet backend.
+                elements = (f"CASE WHEN NOT json_valid({column}) THEN json_array({column}) "
+                            f"WHEN json_type({column}) = 'array' THEN {column} ELSE json_array({column}) END")
+                rows = self._connection().execute(
+                    f"SELECT e.value, COUNT(DISTINCT documents.id) FROM documents, json_each({elements}) e "
+                    f"WHERE {column} IS NOT NULL AND e.value IS NOT NULL GROUP BY e.value"
+                )
+                return dict(rows.fetchall())
+            rows = self._connection().execute(
+                f"SELECT {column}, COUNT(*) FROM documents WHERE {column} IS NOT NULL GROUP BY {column}"
+            )
+            return dict(rows.fetchall())
+        raise ValueError(f"No facet counts for '{key}'" + (f" within '{parent}'." if parent is not None else "."))
+
+    def search(self, query_string: str, limit: int = 10) -> List[Document]:
+        """Searches the indexed metadata fields with an FTS5 query, e.g. 'BELASTINGSOORT:IB AND PROCES_ONDERWERP:aangifte'.
+        :param query_string: str, The query string to search for.
+        :param limit: int, The maximum number of documents to return, defaults to 10
+        :return: List[Document], A list of matching documents.
+        """
+        if not self.indexed_metadata_keys:
+            print("Warning: No metadata keys were indexed. Cannot perform search.")
+            return []
+        try:
+            rows = self._connection().execute(
+                "SELECT d.id FROM metadata_fts JOIN documents d ON d.rowid = metadata_fts.rowid "
+                "WHERE metadata_fts MATCH ? ORDER BY rank LIMIT ?", (query_string, limit)
+            ).fetchall()
+        except sqlite3.OperationalError as e:
+            logger.warning(f"Invalid metadata search query '{query_string}': {e}")
+            return []
+        return self.get_many(row[0] for row in rows)
+
+    def search_text(
+        self,
+        query_string: str,
+        limit: int = 10,
+        snippet_chars: int = 300,
+        metadata_filter: Optional[Dict[str, Any]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Ranks documents by BM25 relevance of their title, question, summary and content.
+
+        Same contract as DocumentStore.search_text. Free text is matched word by word
+        as prefixes and OR-ed (see `fts_query`); FTS5 query syntax works too.
+        :param query_string: str, The keywords to search for.
+        :param limit: int, The maximum number of results, defaults to 10
+        :param snippet_chars: int, The approximate length of the snippet per result, defaults to 300
+        :param metadata_filter: Optional[Dict[str, Any]], Only return documents matching this filter
+                                (see `get_doc_ids_by_metadata`), defaults to None
+        :return: List[Dict[str, Any]], Per hit the 'document', its 'score' and a 'snippet' with the matched terms in bold.
+        """
+        if not self.text_index:
+            print("Warning: Full-text search is not enabled. Cannot perform search.")
+            return []
+        if not query_string or not query_string.strip():
+            return []
+
+        where, params, remaining = self._filter_clause(metadata_filter or {}, table="d")
+        weights = ", ".join(str(boost) for boost in TEXT_FIELD_BOOSTS.values())
+        tokens = max(8, snippet_chars // 7)
+        statement = (
+            f"SELECT d.id, d.title, d.content, d.metadata, bm25(documents_fts, {weights}) AS score, "
+            f"snippet(documents_fts, 3, '**', '**', ' ... ', {tokens}), snippet(documents_fts, 2, '**', '**', ' ... ', {tokens}) "
+            f"FROM documents_fts JOIN documents d ON d.rowid = documents_fts.rowid "
+            f"WHERE documents_fts MATCH ? AND {where} ORDER BY score"
+            + ("" if remaining else " LIMIT ?")
+        )
+        arguments = [fts_query(query_string), *params] + ([] if remaining else [limit])
+        connection = self._connection()
+        try:
+            rows = connection.execute(statement, arguments)
+        except sqlite3.OperationalError as e:
+            if not _fts_syntax_error(e):
+                raise
+            # Malformed FTS5 syntax: search for the words instead.
+            arguments[0] = " OR ".join(f'"{word}"*' for word in _WORD.findall(query_string))
+            if arguments[0] == "":
+                return []
+            rows = connection.execute(statement, arguments)
+
+        results = []
+        for doc_id, title, content, raw, score, content_snippet, summary_snippet in rows:
+            if len(results) >= limit:
+                break
+            doc = self._document(doc_id, title, content, raw)
+            if remaining and not all(condition_matches(doc.metadata.get(k), v) for k, v in remaining.items()):
+                continue
+            snippet = next((s for s in (content_snippet, summary_snippet) if s and "**" in s), None)
+            if not snippet:
+                snippet = (str(doc.metadata.get('summary') or "") or content or "")[:snippet_chars]
+            results.append({"document": doc, "score": -score, "snippet": snippet})
+        return results
@@ -0,0 +1,202 @@
+from bisect import bisect_left
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+# The KME taxonomy, from broad to narrow.
+TAXONOMY_LEVELS = ("BELASTINGSOORT", "PROCES_ONDERWERP", "PRODUCT_SUBONDERWERP")
+
+
+def normalize(text: str) -> str:
+    """Normalizes text for taxonomy matching: case-insensitive with collapsed whitespace."""
+    return " ".join(str(text).split()).casefold()
+
+
+class SubstringIndex:
+    """Finds the values containing (or starting with) a piece of text.
+
+    All suffixes of the normalized values are kept in one sorted array, so a
+    substring query is a binary search followed by a walk over the matching
+    suffixes only: O(log n + matches) instead of scanning every value.
+    """
+    def __init__(self, values: Iterable[str]):
+        """
+        :param values: Iterable[str], The values to index.
+        """
+        self.values: List[str] = sorted(set(values))
+        self._keys = [normalize(v) for v in self.values]
+        self._suffixes: List[Tuple[int, int]] = sorted(
+            ((i, start) for i, key in enumerate(self._keys) for start in range(len(key))),
+            key=self._suffix,
+        )
+
+    def _suffix(self, entry: Tuple[int, int]) -> str:
+        i, start = entry
+        return self._keys[i][start:]
+
+    def find(self, text: str, contains: bool = True) -> List[str]:
+        """Returns the values containing `text`, or starting with it if `contains` is False.
+        :param text: str, The text to look for; matching ignores case and extra whitespace.
+        :param contains: bool, Substring match if True, prefix match otherwise, defaults to True
+        :return: List[str], The matching values, sorted.
+        """
+        query = normalize(text)
+        if not query:
+            return list(self.values)
+        found: Set[int] = set()
+        for pos in range(bisect_left(self._suffixes, query, key=self._suffix), len(self._suffixes)):
+            i, start = self._suffixes[pos]
+            if not self._keys[i].startswith(query, start):
+                break
+            if contains or start == 0:
+                found.add(i)
+        return [self.values[i] for i in sorted(found)]
+
+
+class TaxonomyIndex:
+    """The BELASTINGSOORT -> PROCES_ONDERWERP -> PRODUCT_SUBONDERWERP hierarchy of a document store.
+
+    Free text for a level is resolved to the exact values it matches, optionally
+    restricted to the children of already resolved parent values. The exact values
+    can then be looked up in the inverted MetadataIndex, so a taxonomy search no
+    longer expands wildcard queries against the whole Whoosh term dictionary.
+    The hierarchy is maintained per document and stays correct on updates.
+    """
+    def __init__(self, levels: Sequence[str] = TAXONOMY_LEVELS):
+        """
+        :param levels: Sequence[str], The metadata keys of the taxonomy, from broad to narrow, defaults to TAXONOMY_LEVELS
+        """
+        self.levels: Tuple[str, ...] = tuple(levels)
+        self.clear()
+
+    def clear(self):
+        """Removes all documents from the index."""
+        self._counts: Dict[str, Counter] = {level: Counter() for level in self.levels}
+        self._children: Dict[str, Dict[str, Counter]] = {level: {} for level in self.levels[1:]}
+        self._doc_paths: Dict[str, Tuple[Optional[str], ...]] = {}
+        # Documents with the same path share one tuple.
+        self._path_pool: Dict[Tuple[Optional[str], ...], Tuple[Optional[str], ...]] = {}
+        self._substrings: Dict[str, Optional[SubstringIndex]] = {level: None for level in self.levels}
+
+    def _path(self, values: Dict[str, Any]) -> Tuple[Optional[str], ...]:
+        return tuple(v if isinstance(v, str) and v else None for v in (values.get(level) for level in self.levels))
+
+    def _apply(self, path: Tuple[Optional[str], ...], delta: int):
+        """Adds (delta=1) or removes (delta=-1) one occurrence of a taxonomy path."""
+        for depth, (level, value) in enumerate(zip(self.levels, path)):
+            if value is None:
+                continue
+            counts = self._counts[level]
+            counts[value] += delta
+            if counts[value] <= 0:
+                del counts[value]
+                self._substrings[level] = None
+            elif delta > 0 and counts[value] == 1:
+                self._substrings[level] = None
+
+            parent = path[depth - 1] if depth else None
+            if parent is None:
+                continue
+            children = self._children[level].setdefault(parent, Counter())
+            children[value] += delta
+            if children[value] <= 0:
+                del children[value]
+                if not children:
+                    del self._children[level][parent]
+
+    def add(self, doc_id: str, values: Dict[str, Any]):
+        """Indexes (or re-indexes) the taxonomy path of a document.
+        :param doc_id: str, The id of the document.
+        :param values: Dict[str, Any], The metadata of the document; only the taxonomy levels are used.
+        """
+        self.remove(doc_id)
+        path = self._path(values)
+        if any(path):
+            self._doc_paths[doc_id] = self._path_pool.setdefault(path, path)
+            self._apply(path, 1)
+
+    def remove(self, doc_id: str):
+        """Removes a document from the index.
+        :param doc_id: str, The id of the document.
+        """
+        path = self._doc_paths.pop(doc_id, None)
+        if path:
+            self._apply(path, -1)
+
+    def values(self, level: str, parents: Optional[Iterable[str]] = None) -> List[str]:
+        """Returns the values of a level, optionally only the children of the given parent values.
+        :param level: str, A taxonomy level.
+        :param parents: Optional[Iterable[str]], Values of the level above to restrict to, defaults to None
+        :return: List[str], The values, sorted.
+        """
+        if parents is None or level == self.levels[0]:
+            return sorted(self._counts[level])
+        children = self._children[level]
+        return sorted({child for parent in parents for child in children.get(parent, ())})
+
+    def count(self, level: str, value: str) -> int:
+        """The number of documents with a value on a level."""
+        return self._counts[level].get(value, 0)
+
+    def counts(self, level: str, parent: Optional[str] = None) -> Dict[str, int]:
+        """The facet counts of a level: the number of documents per value.
+
+        The counts are maintained on every add and remove, so reading them does not
+        touch the documents.
+        :param level: str, A taxonomy level.
+        :param parent: Optional[str], Only count documents under this value of the level above, defaults to None
+        :return: Dict[str, int], The number of documents per value.
+        """
+        if parent is None or level == self.levels[0]:
+            return dict(self._counts[level])
+        return dict(self._children[level].get(parent, ()))
+
+    def _substring_index(self, level: str) -> SubstringIndex:
+        if self._substrings[level] is None:
+            self._substrings[level] = SubstringIndex(self._counts[level])
+        return self._substrings[level]
+
+    def resolve(self, level: str, text: str, contains: bool = True, parents: Optional[Iterable[str]] = None) -> List[str]:
+        """Resolves free text to the exact values of a level that contain (or start with) it.
+        :param level: str, A taxonomy level.
+        :param text: str, The user text, e.g. 'inkomsten'.
+        :param contains: bool, Substring match if True, prefix match otherwise, defaults to True
+        :param parents: Optional[Iterable[str]], Only return children of these values of the level above, defaults to None
+        :return: List[str], The matching values, sorted.
+        """
+        matches = self._substring_index(level).find(text, contains=contains)
+        if parents is not None and level != self.levels[0]:
+            allowed = set(self.values(level, parents))
+            matches = [value for value in matches if value in allowed]
+        return matches
+
+    def resolve_path(self, criteria: Dict[str, Optional[str]], contains: bool = True) -> Dict[str, List[str]]:
+        """Resolves free text for several levels, each restricted to the children of the level above.
+        :param criteria: Dict[str, Optional[str]], Free text per taxonomy level; empty levels are skipped.
+        :param contains: bool, Substring match if True, prefix match otherwise, defaults to True
+        :return: Dict[str, List[str]], The exact values per given level.
+        """
+        resolved: Dict[str, List[str]] = {}
+        parents: Optional[List[str]] = None
+        for level in self.levels:
+            text = criteria.get(level)
+            if text is None or not str(text).strip():
+                # Skipping a level lifts the hierarchy constraint for the levels below it.
+                parents = None
+                continue
+            parents = resolved[level] = self.resolve(level, text, contains=contains, parents=parents)
+        return resolved
+
+    def complete(self, level: str, text: str, limit: int = 10, parents: Optional[Iterable[str]] = None) -> List[str]:
+        """Autocompletes a level: values starting with the text first, then values containing it.
+        :param level: str, A taxonomy level.
+        :param text: str, The text typed so far.
+        :param limit: int, The maximum number of suggestions, defaults to 10
+        :param parents: Optional[Iterable[str]], Only suggest children of these values of the level above, defaults to None
+        :return: List[str], The suggestions.
+        """
+        prefix = self.resolve(level, text, contains=False, parents=parents)
+        if len(prefix) >= limit:
+            return prefix[:limit]
+        seen = set(prefix)
+        rest = [v for v in self.resolve(level, text, contains=True, parents=parents) if v not in seen]
+        return (prefix + rest)[:limit]
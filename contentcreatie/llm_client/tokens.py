@@ -0,0 +1,195 @@
+import json
+import threading
+import time
+from collections import defaultdict
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from logging import getLogger
+logger = getLogger("Contenttransformatie")
+
+# Tokens added per message and to prime the reply in the chat format (see the OpenAI cookbook).
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+# Characters per token of the fallback estimate when no tokenizer is available.
+CHARS_PER_TOKEN = 4
+
+USAGE_KEYS = ("prompt_tokens", "completion_tokens", "total_tokens")
+
+
+class TokenBudgetExceeded(RuntimeError):
+    """Raised before a request is sent when it does not fit the request or session token budget."""
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str) -> Optional[Any]:
+    """The tiktoken encoding of a model, o200k_base for unknown models, or None if tiktoken or the encoding is unavailable."""
+    try:
+        import tiktoken
+    except ImportError:
+        logger.warning("tiktoken is not installed; estimating tokens from the number of characters")
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # The encodings are downloaded on first use, which fails without network access.
+        logger.warning(f"No tokenizer for {model} ({e!r}); estimating tokens from the number of characters")
+        return None
+
+
+class TokenEstimator:
+    """Counts the tokens of texts and chat requests with the tokenizer of a model.
+
+    Without tiktoken or its encoding files, it falls back to a character-based estimate.
+    """
+    def __init__(self, model: str):
+        """
+        :param model: str, The model whose tokenizer to use.
+        """
+        self.model = model
+        self._encoding = _encoding(model)
+
+    def count(self, text: Optional[str]) -> int:
+        """The number of tokens of a text."""
+        if not text:
+            return 0
+        if self._encoding is None:
+            return len(text) // CHARS_PER_TOKEN + 1
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+    def count_messages(self, messages: Iterable[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]] = None) -> int:
+        """
+        The number of prompt tokens of a chat request.
+        :param messages: Iterable[Dict[str, Any]], The messages of the request.
+        :param tools: Optional[List[Dict[str, Any]]], The tool schemas of the request, defaults to None
+        :return: int, The estimated prompt tokens.
+        """
+        total = TOKENS_PER_REPLY
+        for message in messages:
+            total += TOKENS_PER_MESSAGE
+            for key, value in message.items():
+                if value is None:
+                    continue
+                total += self.count(value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str))
+        if tools:
+            total += self.count(json.dumps(tools, ensure_ascii=False))
+        return total
+
+
+class TokenBudget:
+    """A number of tokens that a session may spend, charged with the actual usage of its requests."""
+    def __init__(self, limit: int):
+        """
+        :param limit: int, The tokens the session may spend.
+        """
+        self.limit = limit
+        self.used = 0
+        self._lock = threading.Lock()
+
+    @property
+    def remaining(self) -> int:
+        return max(0, self.limit - self.used)
+
+    def check(self, tokens: int):
+        """
+        Refuses a request that would not fit the remaining budget.
+        :param tokens: int, The estimated tokens of the request.
+        :raises TokenBudgetExceeded: If the request does not fit.
+        """
+        if tokens > self.remaining:
+            raise TokenBudgetExceeded(
+                f"Request of ~{tokens} tokens exceeds the remaining session budget of {self.remaining} of {self.limit} tokens"
+            )
+
+    def charge(self, tokens: int):
+        """Charges the tokens of a completed request."""
+        with self._lock:
+            self.used += tokens
+
+    def reset(self):
+        with self._lock:
+            self.used = 0
+
+
+class UsageTracker:
+    """Aggregates token usage by model and tags (e.g. agent and project), in total and per minute.
+
+    Per-minute buckets older than `retention` seconds are dropped, so memory stays bounded
+    while `totals(window=...)` answers questions like "tokens per model in the last hour".
+    """
+    def __init__(self, retention: float = 24 * 3600):
+        """
+        :param retention: float, Seconds the per-minute buckets are kept, defaults to one day
+        """
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._totals: Dict[Tuple, Dict[str, int]] = defaultdict(lambda: dict.fromkeys(USAGE_KEYS + ("requests",), 0))
+        self._minutes: Dict[Tuple, Dict[str, int]] = defaultdict(lambda: dict.fromkeys(USAGE_KEYS + ("requests",), 0))
+        self._pruned_minute: Optional[int] = None
+
+    @staticmethod
+    def _key(model: str, tags: Optional[Dict[str, str]]) -> Tuple:
+        return (("model", model),) + tuple(sorted((tags or {}).items()))
+
+    def record(self, model: str, usage: Dict[str, Any], tags: Optional[Dict[str, str]] = None, timestamp: Optional[float] = None):
+        """
+        Records the usage of a request.
+        :param model: str, The model of the request.
+        :param usage: Dict[str, Any], The usage of the response (prompt_tokens, completion_tokens, total_tokens).
+        :param tags: Optional[Dict[str, str]], Attributes to aggregate by, e.g. {"agent": "search", "project": "..."}
+        :param timestamp: Optional[float], When the request completed, defaults to now
+        """
+        key = self._key(model, tags)
+        minute = int((timestamp or time.time()) // 60)
+        with self._lock:
+            for counters in (self._totals[key], self._minutes[(minute,) + key]):
+                counters["requests"] += 1
+                for name in USAGE_KEYS:
+                    counters[name] += int(usage.get(name) or 0)
+            self._prune(minute)
+
+    def _prune(self, minute: int):
+        """Drops the buckets older than the retention, at most once per minute."""
+        if minute == self._pruned_minute:
+            return
+        self._pruned_minute = minute
+        oldest = minute - int(self.retention // 60)
+        for bucket in [bucket for bucket in self._minutes if bucket[0] < oldest]:
+            del self._minutes[bucket]
+
+    def totals(self, by: Iterable[str] = ("model",), window: Optional[float] = None) -> Dict[Tuple, Dict[str, int]]:
+        """
+        Rolls up the usage.
+        :param by: Iterable[str], The attributes to group by, e.g. ("model", "agent"), defaults to ("model",)
+        :param window: Optional[float], Only the last `window` seconds (at minute resolution), defaults to None (all time)
+        :return: Dict[Tuple, Dict[str, int]], The counters per group, keyed by the values of `by` (None if a request lacks the attribute).
+        """
+        by = tuple(by)
+        result: Dict[Tuple, Dict[str, int]] = defaultdict(lambda: dict.fromkeys(USAGE_KEYS + ("requests",), 0))
+        with self._lock:
+            if window is None:
+                entries = [(key, dict(counters)) for key, counters in self._totals.items()]
+            else:
+                since = int((time.time() - window) // 60)
+                entries = [(bucket[1:], dict(counters)) for bucket, counters in self._minutes.items() if bucket[0] >= since]
+        for key, counters in entries:
+            attributes = dict(key)
+            group = result[tuple(attributes.get(name) for name in by)]
+            for name, value in counters.items():
+                group[name] += value
+        return dict(result)
+
+    def total_tokens(self, window: Optional[float] = None, **tags: str) -> int:
+        """The total tokens of the requests with the given model and tags, e.g. `total_tokens(agent="search")`."""
+        names = tuple(tags)
+        wanted = tuple(tags.values())
+        return sum(
+            counters["total_tokens"] for group, counters in self.totals(by=names, window=window).items() if group == wanted
+        )
+
+    def clear(self):
+        with self._lock:
+            self._totals.clear()
+            self._minutes.clear()
@@ -1,4 +1,5 @@
 import hashlib
+import json
 import os
 import pickle
 from typing import Any, Dict, List, Optional, Union
@@ -31,7 +32,18 @@ class VectorStore:
         *,
         batch_size: int = 128,  
         save_every: int = 1,      
+        dimension: Optional[int] = None,
     ):
+        """Initializes the VectorStore, loading or creating the FAISS index on disk.
+
+        :param embedder: EmbeddingProcessor, The processor used to embed documents and queries.
+        :param doc_store: DocumentStore, The store holding the documents to index.
+        :param data_root: str, The root directory where the index is stored, defaults to "data"
+        :param batch_size: int, Number of documents embedded per request, defaults to 128
+        :param save_every: int, Save the index after this many batches, defaults to 1
+        :param dimension: Optional[int], The embedding dimension. If omitted it is taken from the persisted
+                          index metadata or from the embedder, so no probe request is needed.
+        """
         self.embedder = embedder
         self.doc_store = doc_store
         self.batch_size = max(1, int(batch_size))
@@ -43,29 +55,98 @@ class VectorStore:
 
         self.index_file = os.path.join(self.store_path, "vectors.faiss")
         self.ids_file = os.path.join(self.store_path, "indexed_ids.pkl")
+        self.meta_file = os.path.join(self.store_path, "index_meta.json")
+        self.versions_file = os.path.join(self.store_path, "embedded_versions.pkl")
 
         self.indexed_ids: set[int] = set()
+        # The DocumentStore version of every embedded document, to detect stale embeddings.
+        self.embedded_versions: Dict[str, int] = {}
+        self._configured_dimension = dimension
+        self.dimension: Optional[int] = None
 
         self._load_or_initialize()
         self.sync_with_store()
 
+    def _load_meta(self) -> Dict[str, Any]:
+        """Reads the index metadata stored next to the FAISS file.
+        :return: Dict[str, Any], The stored metadata, or an empty dict if there is none.
+        """
+        if not os.path.exists(self.meta_file):
+            return {}
+        try:
+            with open(self.meta_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Could not read index metadata {self.meta_file}: {e}")
+            return {}
+
+    def _save_meta(self):
+        """Writes the embedding model and dimension of the index next to the FAISS file."""
+        meta = {
+            "embedding_model": self.embedder.embedding_model,
+            "dimension": self.dimension,
+            "metric": "L2",
+        }
+        with open(self.meta_file, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2)
+
+    def _resolve_dimension(self) -> int:
+        """Determines the embedding dimension without calling the embedding endpoint when possible.
+
+        Resolution order: explicit argument, the embedder's configured dimension, persisted index
+        metadata. Only if none of these is known a single probe request is made.
+        :return: int, The embedding dimension.
+        """
+        if self._configured_dimension:
+            return self._configured_dimension
+        if self.embedder.dimension:
+            return self.embedder.dimension
+        stored_dim = self._load_meta().get("dimension")
+        if stored_dim:
+            return int(stored_dim)
+        logger.warning(
+            f"No known dimension for embedding model '{self.embedder.embedding_model}'. "
+            "Probing the endpoint; register it in Settings.embedding_dimensions to avoid this."
+        )
+        return len(self.embedder.embed("test"))
+
+    def _new_index(self) -> faiss.Index:
+        """Creates an empty FAISS index with the resolved dimension."""
+        self.dimension = self._resolve_dimension()
+        return faiss.IndexIDMap(faiss.IndexFlatL2(self.dimension))
+
     def _load_or_initialize(self):
         if os.path.exists(self.index_file) and os.path.exists(self.ids_file):
             self.index = faiss.read_index(self.index_file)
             with open(self.ids_file, 'rb') as f:
                 self.indexed_ids = pickle.load(f)
+            self.embedded_versions = {}
+            if os.path.exists(self.versions_file):
+                with open(self.versions_file, 'rb') as f:
+                    self.embedded_versions = pickle.load(f)
+            expected_dim = self._configured_dimension or self.embedder.dimension
+            if expected_dim and expected_dim != self.index.d:
+                logger.warning(
+                    f"Configured dimension {expected_dim} differs from stored index dimension {self.index.d}. "
+                    "Run sync_with_store(refresh=True) to rebuild the index."
+                )
+            self.dimension = self.index.d
+            if not os.path.exists(self.meta_file):
+                self._save_meta()
             print(f"Loaded FAISS index ({self.index.ntotal} vectors) and ID set from disk.")
         else:
-            dummy_embedding = self.embedder.embed("test")
-            dim = len(dummy_embedding)
-            self.index = faiss.IndexIDMap(faiss.IndexFlatL2(dim))
+            self.index = self._new_index()
             self.indexed_ids = set()
-            print(f"Initialized new FAISS index with dimension {dim}.")
+            self.embedded_versions = {}
+            print(f"Initialized new FAISS index with dimension {self.dimension}.")
 
     def _save(self):
         faiss.write_index(self.index, self.index_file)
         with open(self.ids_file, 'wb') as f:
             pickle.dump(self.indexed_ids, f)
+        with open(self.versions_file, 'wb') as f:
+            pickle.dump(self.embedded_versions, f)
+        self._save_meta()
         print(f"Saved FAISS index ({self.index.ntotal} vectors) and ID set.")
 
     def add(self, docs: Union[Document, List[Document]], refresh: bool = False):
@@ -91,6 +172,7 @@ class VectorStore:
             ids_np = np.array([get_stable_id(d.id) for d in chunk], dtype='int64')
             self.index.add_with_ids(emb_np, ids_np)
             self.indexed_ids.update(ids_np.tolist())
+            self._record_versions(chunk)
 
             batch_i += 1
             if batch_i % self.save_every == 0:
@@ -98,16 +180,36 @@ class VectorStore:
 
         self._save()
 
+    def _record_versions(self, docs: List[Document]):
+        """Remembers the DocumentStore version the embeddings of these documents were made from."""
+        for doc in docs:
+            version = self.doc_store.version(doc.id)
+            if version is not None:
+                self.embedded_versions[doc.id] = version
+            else:
+                self.embedded_versions.pop(doc.id, None)
+
+    def _is_stale(self, doc_id: str) -> bool:
+        """Whether the document changed in the DocumentStore since it was embedded.
+
+        Documents embedded before versions were tracked adopt their current version
+        instead of being embedded again.
+        """
+        version = self.doc_store.version(doc_id)
+        if version is None:
+            return False
+        embedded = self.embedded_versions.setdefault(doc_id, version)
+        return embedded != version
+
     def sync_with_store(self, refresh: bool = False):
         print("Syncing VectorStore with DocumentStore...")
         if refresh:
             print("Refresh mode enabled: Re-building the entire index from the DocumentStore.")
             all_docs = self.doc_store.get_all()
 
-            dummy_embedding = self.embedder.embed("test")
-            dim = len(dummy_embedding)
-            self.index = faiss.IndexIDMap(faiss.IndexFlatL2(dim))
+            self.index = self._new_index()
             self.indexed_ids = set()
+            self.embedded_versions = {}
 
             if not all_docs:
                 print("DocumentStore is empty. Index has been cleared.")
@@ -128,6 +230,7 @@ class VectorStore:
 
                 self.index.add_with_ids(emb_np, ids_np)
                 self.indexed_ids.update(ids_np.tolist())
+                self._record_versions(chunk)
 
                 batch_i += 1
                 if batch_i % self.save_every == 0:
@@ -144,21 +247,30 @@ class VectorStore:
                 self.index.remove_ids(ids_to_remove_np)
                 self.indexed_ids.difference_update(ids_to_remove)
                 self._save()
+            for doc_id in set(self.embedded_versions).difference(all_doc_ids):
+                del self.embedded_versions[doc_id]
 
-            docs_to_index = []
+            known_versions = len(self.embedded_versions)
+            missing, stale = [], []
             for doc_id in all_doc_ids:
                 hid = get_stable_id(doc_id)
                 if hid not in self.indexed_ids:
-                    doc = self.doc_store.get(doc_id)
-                    if doc:
-                        docs_to_index.append(doc)
+                    missing.append(doc_id)
+                elif self._is_stale(doc_id):
+                    stale.append(doc_id)
+            docs_to_index = self.doc_store.get_many(missing + stale)
 
             if not docs_to_index and not ids_to_remove:
                 print("VectorStore is already in sync. No changes made.")
+                if len(self.embedded_versions) != known_versions:
+                    self._save()
                 return
 
             if docs_to_index:
-                print(f"Found {len(docs_to_index)} missing documents. Indexing in batches of {self.batch_size}...")
+                print(
+                    f"Found {len(missing)} missing and {len(stale)} changed documents. "
+                    f"Indexing in batches of {self.batch_size}..."
+                )
                 self.add(docs_to_index, refresh=False)
 
         self._save()
@@ -247,6 +359,10 @@ class VectorStore:
             os.remove(self.index_file)
         if os.path.exists(self.ids_file):
             os.remove(self.ids_file)
+        if os.path.exists(self.meta_file):
+            os.remove(self.meta_file)
+        if os.path.exists(self.versions_file):
+            os.remove(self.versions_file)
             
         self._load_or_initialize()
         
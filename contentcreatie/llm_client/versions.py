@@ -0,0 +1,178 @@
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Iterable, List, Optional
+from .document import Document
+from logging import getLogger
+logger = getLogger("Contenttransformatie")
+
+# Metadata added by the pipelines (summarization) rather than by the source export.
+# They do not count towards the content hash, so enriching a document does not make it "changed".
+GENERATED_METADATA_KEYS = ("summary", "tags")
+
+NEW = "new"
+CHANGED = "changed"
+UNCHANGED = "unchanged"
+UPDATED = "updated"
+REMOVED = "removed"
+
+
+def _canonical(value: Any) -> Any:
+    """Normalizes a metadata value so the same content hashes the same before and after a round trip to disk."""
+    if hasattr(value, "item") and not isinstance(value, (list, dict, str, bytes)):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    return value
+
+
+def _hash(doc: Document, skip: Iterable[str] = ()) -> str:
+    """Hashes the title, content and metadata of a document, leaving out the metadata keys in `skip`."""
+    metadata = {}
+    for key, value in (doc.metadata or {}).items():
+        if key in skip:
+            continue
+        value = _canonical(value)
+        if value is not None:
+            metadata[key] = value
+    payload = {"title": doc.title or "", "content": doc.content or "", "metadata": metadata}
+    encoded = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.blake2b(encoded.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def content_hash(doc: Document) -> str:
+    """Hashes the source content of a document: its title, content and metadata, without GENERATED_METADATA_KEYS.
+    :param doc: Document, The document.
+    :return: str, The hex digest.
+    """
+    return _hash(doc, GENERATED_METADATA_KEYS)
+
+
+def document_hash(doc: Document) -> str:
+    """Hashes the whole document, including the generated metadata, to tell whether storing it changes anything.
+    :param doc: Document, The document.
+    :return: str, The hex digest.
+    """
+    return _hash(doc)
+
+
+@dataclass(frozen=True, slots=True)
+class DocumentVersion:
+    """One entry of the version log.
+
+    :param doc_id: str, The id of the document.
+    :param version: int, Increases by one with every stored change of the document.
+    :param content_hash: str, The `content_hash` of this version; empty for a removal.
+    :param change: str, NEW, CHANGED (the source content changed), UPDATED (only generated metadata changed) or REMOVED.
+    :param timestamp: float, When the version was recorded, in seconds since the epoch.
+    :param document_hash: str, The `document_hash` of this version; empty for a removal and in older logs.
+    """
+    doc_id: str
+    version: int
+    content_hash: str
+    change: str
+    timestamp: float
+    document_hash: str = ""
+
+
+class VersionLog:
+    """An append-only JSON Lines log of the versions of the documents in a store.
+
+    The latest version per document is kept in memory. New entries are buffered and
+    appended to the file by `flush`, which the store calls when it saves.
+    """
+    def __init__(self, path: str):
+        """
+        :param path: str, The log file.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._latest: Dict[str, DocumentVersion] = {}
+        self._pending: List[DocumentVersion] = []
+        for entry in self._read():
+            self._latest[entry.doc_id] = entry
+
+    def _read(self) -> Iterable[DocumentVersion]:
+        """Reads the entries of the log file, skipping unreadable lines (e.g. a partially written last line)."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield DocumentVersion(**json.loads(line))
+                except (TypeError, ValueError):
+                    logger.warning(f"Skipping unreadable line in version log {self.path}")
+
+    def latest(self, doc_id: str) -> Optional[DocumentVersion]:
+        """The latest version of a document, or None if none was recorded."""
+        return self._latest.get(doc_id)
+
+    def version(self, doc_id: str) -> Optional[int]:
+        """The latest version number of a document that is in the store, or None."""
+        entry = self._latest.get(doc_id)
+        return entry.version if entry is not None and entry.change != REMOVED else None
+
+    def record(self, doc_id: str, doc_hash: Optional[str], full_hash: Optional[str] = None) -> DocumentVersion:
+        """Records a new version of a document.
+        :param doc_id: str, The id of the document.
+        :param doc_hash: Optional[str], The `content_hash` of the stored document, or None if it was removed.
+        :param full_hash: Optional[str], The `document_hash` of the stored document, defaults to None
+        :return: DocumentVersion, The recorded entry.
+        """
+        with self._lock:
+            previous = self._latest.get(doc_id)
+            if doc_hash is None:
+                change = REMOVED
+            elif previous is None or previous.change == REMOVED:
+                change = NEW
+            elif previous.content_hash != doc_hash:
+                change = CHANGED
+            else:
+                change = UPDATED
+            entry = DocumentVersion(
+                doc_id=doc_id,
+                version=previous.version + 1 if previous else 1,
+                content_hash=doc_hash or "",
+                change=change,
+                timestamp=time.time(),
+                document_hash=full_hash or "",
+            )
+            self._latest[doc_id] = entry
+            self._pending.append(entry)
+            return entry
+
+    def history(self, doc_id: str) -> List[DocumentVersion]:
+        """All recorded versions of a document, oldest first."""
+        with self._lock:
+            pending = [entry for entry in self._pending if entry.doc_id == doc_id]
+        return [entry for entry in self._read() if entry.doc_id == doc_id] + pending
+
+    def flush(self):
+        """Appends the buffered entries to the log file."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+        try:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.writelines(json.dumps(asdict(entry), ensure_ascii=False) + "\n" for entry in pending)
+        except OSError as e:
+            logger.error(f"Could not write version log {self.path}: {e}")
+            with self._lock:
+                self._pending = pending + self._pending
+
+    def clear(self):
+        """Forgets all versions and removes the log file."""
+        with self._lock:
+            self._latest = {}
+            self._pending = []
+            if os.path.exists(self.path):
+                os.remove(self.path)
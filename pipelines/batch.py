@@ -0,0 +1,399 @@
+import json
+import os
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from contentcreatie.llm_client.document_store import DocumentStore
+from contentcreatie.llm_client.prompt_builder import PromptBuilder
+from contentcreatie.llm_client.llm_client import LLMProcessor
+from .processors import _STATUS_STATS, _documents_to_summarize, _store_summary, _summary_prompt
+from logging import getLogger
+
+logger = getLogger("extract")
+
+# Statuses of a batch after which it does not change anymore.
+FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+# The Batch API accepts at most 50.000 requests per input file.
+MAX_REQUESTS_PER_FILE = 50_000
+
+
+def _read_jsonl(path: str) -> Iterable[Dict[str, Any]]:
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _write_jsonl(path: str, lines: Iterable[Dict[str, Any]]):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.writelines(json.dumps(line, ensure_ascii=False) + "\n" for line in lines)
+
+
+class BatchBackend(ABC):
+    """Submits Batch API input files and returns their output files."""
+
+    @abstractmethod
+    def submit(self, input_path: str) -> str:
+        """
+        Submits an input file.
+        :param input_path: str, The JSONL file with one request per line.
+        :return: str, The id of the batch.
+        """
+
+    @abstractmethod
+    def retrieve(self, batch_id: str) -> Dict[str, Any]:
+        """
+        The state of a batch.
+        :param batch_id: str, The id of the batch.
+        :return: Dict[str, Any], The 'status' and the 'total', 'completed' and 'failed' request counts.
+        """
+
+    @abstractmethod
+    def download(self, batch_id: str, folder: str) -> List[str]:
+        """
+        Downloads the output and error files of a finished batch.
+        :param batch_id: str, The id of the batch.
+        :param folder: str, The folder to write the files to.
+        :return: List[str], The paths of the downloaded JSONL files.
+        """
+
+
+class OpenAIBatchBackend(BatchBackend):
+    """The Batch API of OpenAI or Azure OpenAI (a global batch deployment)."""
+
+    def __init__(self, client: Any, url: str = "/v1/chat/completions", completion_window: str = "24h"):
+        """
+        :param client: Any, A synchronous openai client, e.g. of an LLMProcessor.
+        :param url: str, The endpoint of the requests, defaults to "/v1/chat/completions" (Azure uses "/chat/completions")
+        :param completion_window: str, The time the service may take, defaults to "24h"
+        """
+        self.client = client
+        self.url = url
+        self.completion_window = completion_window
+
+    @classmethod
+    def from_processor(cls, llm: LLMProcessor, **kwargs: Any) -> "OpenAIBatchBackend":
+        """A backend on the endpoint of an LLMProcessor."""
+        return cls(llm._client, **kwargs)
+
+    def submit(self, input_path: str) -> str:
+        with open(input_path, 'rb') as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id, endpoint=self.url, completion_window=self.completion_window
+        )
+        return batch.id
+
+    def retrieve(self, batch_id: str) -> Dict[str, Any]:
+        batch = self.client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        return {
+            "status": batch.status,
+            "total": counts.total if counts else 0,
+            "completed": counts.completed if counts else 0,
+            "failed": counts.failed if counts else 0,
+        }
+
+    def download(self, batch_id: str, folder: str) -> List[str]:
+        batch = self.client.batches.retrieve(batch_id)
+        paths = []
+        for kind, file_id in (("output", batch.output_file_id), ("errors", batch.error_file_id)):
+            if not file_id:
+                continue
+            path = os.path.join(folder, f"{batch_id}_{kind}.jsonl")
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(self.client.files.content(file_id).text)
+            paths.append(path)
+        return paths
+
+
+class LocalBatchBackend(BatchBackend):
+    """A file-based stand-in for the Batch API, e.g. for tests or a local model server.
+
+    A submitted input file is copied to `folder/<batch_id>/input.jsonl` and processed on
+    the first `retrieve`: every request body is passed to `respond` and the output lines
+    are written in the format of the Batch API.
+    """
+
+    def __init__(self, folder: str, respond: Callable[[Dict[str, Any]], Dict[str, Any]]):
+        """
+        :param folder: str, The folder of the batches.
+        :param respond: Callable[[Dict[str, Any]], Dict[str, Any]], Returns the response body (a chat completion as a dictionary) of a request body.
+        """
+        self.folder = folder
+        self.respond = respond
+        os.makedirs(folder, exist_ok=True)
+
+    @classmethod
+    def from_processor(cls, folder: str, llm: LLMProcessor) -> "LocalBatchBackend":
+        """A stand-in that sends the requests one by one to the endpoint of an LLMProcessor."""
+        return cls(folder, lambda body: llm._client.chat.completions.create(**body).model_dump())
+
+    def _state_path(self, batch_id: str) -> str:
+        return os.path.join(self.folder, batch_id, "state.json")
+
+    def _state(self, batch_id: str) -> Dict[str, Any]:
+        with open(self._state_path(batch_id), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _set_state(self, batch_id: str, state: Dict[str, Any]):
+        with open(self._state_path(batch_id), 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+
+    def submit(self, input_path: str) -> str:
+        batch_id = f"batch_local_{uuid.uuid4().hex}"
+        os.makedirs(os.path.join(self.folder, batch_id))
+        lines = list(_read_jsonl(input_path))
+        _write_jsonl(os.path.join(self.folder, batch_id, "input.jsonl"), lines)
+        self._set_state(batch_id, {"status": "validating", "total": len(lines), "completed": 0, "failed": 0})
+        return batch_id
+
+    def _run(self, batch_id: str) -> Dict[str, Any]:
+        outputs, errors = [], []
+        for line in _read_jsonl(os.path.join(self.folder, batch_id, "input.jsonl")):
+            line_id = f"batch_req_{uuid.uuid4().hex}"
+            try:
+                body = self.respond(line["body"])
+                outputs.append({
+                    "id": line_id,
+                    "custom_id": line["custom_id"],
+                    "response": {"status_code": 200, "request_id": line_id, "body": body},
+                    "error": None,
+                })
+            except Exception as e:
+                errors.append({
+                    "id": line_id,
+                    "custom_id": line["custom_id"],
+                    "response": None,
+                    "error": {"code": type(e).__name__, "message": str(e)},
+                })
+        _write_jsonl(os.path.join(self.folder, batch_id, "output.jsonl"), outputs)
+        _write_jsonl(os.path.join(self.folder, batch_id, "errors.jsonl"), errors)
+        state = {"status": "completed", "total": len(outputs) + len(errors), "completed": len(outputs), "failed": len(errors)}
+        self._set_state(batch_id, state)
+        return state
+
+    def retrieve(self, batch_id: str) -> Dict[str, Any]:
+        state = self._state(batch_id)
+        if state["status"] not in FINAL_STATUSES:
+            state = self._run(batch_id)
+        return state
+
+    def download(self, batch_id: str, folder: str) -> List[str]:
+        paths = []
+        for kind in ("output", "errors"):
+            source = os.path.join(self.folder, batch_id, f"{kind}.jsonl")
+            if not os.path.exists(source) or not os.path.getsize(source):
+                continue
+            path = os.path.join(folder, f"{batch_id}_{kind}.jsonl")
+            _write_jsonl(path, _read_jsonl(source))
+            paths.append(path)
+        return paths
+
+
+def write_summary_batch(
+    *,
+    doc_store: DocumentStore,
+    prompt_builder: PromptBuilder,
+    llm: LLMProcessor,
+    folder: str,
+    start: int = 0,
+    count: Optional[int] = None,
+    reasoning_effort: str = "low",
+    url: str = "/v1/chat/completions",
+    max_requests_per_file: int = MAX_REQUESTS_PER_FILE,
+) -> Tuple[List[str], Dict[str, int]]:
+    """
+    Writes the summarization requests of the documents that lack a 'summary' as Batch API
+    input files, one request per document with the document id as custom_id.
+
+    :param doc_store: DocumentStore, The document store containing KMEDocuments.
+    :param prompt_builder: PromptBuilder, Used to create prompts for the LLM.
+    :param llm: LLMProcessor, The LLM processing unit; its model is the deployment of the batch.
+    :param folder: str, The folder to write the input files to.
+    :param start: int, The starting index of documents to process, defaults to 0
+    :param count: Optional[int], The maximum number of documents to process, defaults to None
+    :param reasoning_effort: str, The reasoning effort for the LLM, defaults to "low"
+    :param url: str, The endpoint of the requests, defaults to "/v1/chat/completions" (Azure uses "/chat/completions")
+    :param max_requests_per_file: int, Requests per input file, defaults to MAX_REQUESTS_PER_FILE
+    :return: Tuple[List[str], Dict[str, int]], The paths of the input files and the statistics of the selection.
+    """
+    todo, stats = _documents_to_summarize(doc_store, start, count)
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for i in range(0, len(todo), max_requests_per_file):
+        path = os.path.join(folder, f"summaries_{i // max_requests_per_file:04d}.jsonl")
+        _write_jsonl(path, (
+            llm.batch_request(doc_id, _summary_prompt(prompt_builder, doc), reasoning_effort=reasoning_effort, url=url)
+            for doc_id, doc in todo[i:i + max_requests_per_file]
+        ))
+        paths.append(path)
+    logger.info(f"Wrote {len(todo)} summarization requests to {len(paths)} batch files in {folder}")
+    return paths, stats
+
+
+def wait_for_batch(
+    backend: BatchBackend,
+    batch_id: str,
+    poll_interval: float = 60.0,
+    timeout: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    Polls a batch until it is finished.
+    :param backend: BatchBackend, The backend the batch was submitted to.
+    :param batch_id: str, The id of the batch.
+    :param poll_interval: float, Seconds between polls, defaults to 60
+    :param timeout: Optional[float], Seconds before giving up, defaults to None (wait for the completion window)
+    :return: Dict[str, Any], The final state of the batch.
+    :raises TimeoutError: If the batch is not finished within the timeout.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        state = backend.retrieve(batch_id)
+        logger.info(f"Batch {batch_id}: {state['status']} ({state['completed']}/{state['total']} done, {state['failed']} failed)")
+        if state["status"] in FINAL_STATUSES:
+            return state
+        if deadline is not None and time.monotonic() + poll_interval > deadline:
+            raise TimeoutError(f"Batch {batch_id} is not finished after {timeout} seconds")
+        time.sleep(poll_interval)
+
+
+def ingest_summary_batch(
+    *,
+    doc_store: DocumentStore,
+    prompt_builder: PromptBuilder,
+    llm: LLMProcessor,
+    result_paths: Iterable[str],
+    save: bool = True,
+) -> Dict[str, int]:
+    """
+    Stores the summaries of Batch API output files in the document store, with the same
+    validation as `summarize_new_documents`. Failed requests count as exceptions.
+
+    :param doc_store: DocumentStore, The document store containing KMEDocuments.
+    :param prompt_builder: PromptBuilder, Used to validate the LLM output.
+    :param llm: LLMProcessor, Parses the responses with its default post processor.
+    :param result_paths: Iterable[str], The output and error files of the batch.
+    :param save: bool, Persist the summaries when done, defaults to True
+    :return: Dict[str, int], A dictionary with detailed statistics of the ingest.
+    """
+    stats = {
+        "submitted": 0,
+        "added": 0,
+        "skipped_existing": 0,
+        "validation_errors": 0,
+        "key_errors": 0,
+        "exceptions": 0,
+    }
+    for path in result_paths:
+        for line in _read_jsonl(path):
+            stats["submitted"] += 1
+            doc_id = line["custom_id"]
+            doc = doc_store.get(doc_id)
+            if doc is None:
+                logger.warning(f"Batch result for unknown doc {doc_id}")
+                stats["exceptions"] += 1
+                continue
+            if doc.metadata and "summary" in doc.metadata:
+                stats["skipped_existing"] += 1
+                continue
+            response = line.get("response") or {}
+            if response.get("status_code") != 200:
+                logger.error(f"Batch request for doc {doc_id} failed: {line.get('error') or response.get('body')}")
+                stats["exceptions"] += 1
+                continue
+            try:
+                res = llm.batch_result(response["body"])
+                _, status, _ = _store_summary(doc_store, prompt_builder, doc_id, doc, res.content)
+            except Exception as e:
+                logger.error(f"Exception processing batch result of doc {doc_id}: {e}", exc_info=True)
+                status = "exception"
+            if status == "success":
+                stats["added"] += 1
+            else:
+                stats[_STATUS_STATS[status]] += 1
+
+    if save and stats["added"]:
+        doc_store.save()
+    return stats
+
+
+def summarize_new_documents_batch(
+    *,
+    doc_store: DocumentStore,
+    prompt_builder: PromptBuilder,
+    llm: LLMProcessor,
+    backend: BatchBackend,
+    folder: str,
+    start: int = 0,
+    count: Optional[int] = None,
+    reasoning_effort: str = "low",
+    url: str = "/v1/chat/completions",
+    poll_interval: float = 60.0,
+    timeout: Optional[float] = None,
+) -> Dict[str, int]:
+    """
+    Batch variant of `summarize_new_documents`: writes the requests as Batch API input files,
+    submits them, waits for the results and ingests them into the document store.
+
+    The input files and the id of every submitted batch are kept in `folder/batches.json`,
+    which is updated after each submit. When a run is interrupted (e.g. a restarted notebook
+    or a failed submit), calling it again with the same folder only submits the input files
+    without a batch yet and resumes waiting for the others.
+
+    :param doc_store: DocumentStore, The document store containing KMEDocuments.
+    :param prompt_builder: PromptBuilder, Used to create prompts for the LLM.
+    :param llm: LLMProcessor, The LLM processing unit; its model is the deployment of the batch.
+    :param backend: BatchBackend, OpenAIBatchBackend, or LocalBatchBackend for tests.
+    :param folder: str, The working folder of the run.
+    :param start: int, The starting index of documents to process, defaults to 0
+    :param count: Optional[int], The maximum number of documents to process, defaults to None
+    :param reasoning_effort: str, The reasoning effort for the LLM, defaults to "low"
+    :param url: str, The endpoint of the requests, defaults to "/v1/chat/completions" (Azure uses "/chat/completions")
+    :param poll_interval: float, Seconds between polls, defaults to 60
+    :param timeout: Optional[float], Seconds to wait per batch, defaults to None
+    :return: Dict[str, int], A dictionary with detailed statistics of the run.
+    """
+    os.makedirs(folder, exist_ok=True)
+    manifest_path = os.path.join(folder, "batches.json")
+
+    def save_manifest():
+        tmp_path = manifest_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, manifest_path)
+
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        logger.info(f"Resuming {len(manifest['batches'])} of {len(manifest['inputs'])} batches from {manifest_path}")
+    else:
+        paths, selection = write_summary_batch(
+            doc_store=doc_store, prompt_builder=prompt_builder, llm=llm, folder=folder,
+            start=start, count=count, reasoning_effort=reasoning_effort, url=url,
+        )
+        manifest = {"selection": selection, "inputs": paths, "batches": []}
+        save_manifest()
+
+    submitted = {batch["input"] for batch in manifest["batches"]}
+    for path in manifest["inputs"]:
+        if path not in submitted:
+            manifest["batches"].append({"input": path, "id": backend.submit(path)})
+            save_manifest()
+
+    result_paths = []
+    for batch in manifest["batches"]:
+        state = wait_for_batch(backend, batch["id"], poll_interval=poll_interval, timeout=timeout)
+        if state["status"] != "completed":
+            logger.error(f"Batch {batch['id']} ended with status {state['status']}")
+        result_paths += backend.download(batch["id"], folder)
+
+    stats = ingest_summary_batch(doc_store=doc_store, prompt_builder=prompt_builder, llm=llm, result_paths=result_paths)
+    stats["skipped_existing"] += manifest["selection"]["skipped_existing"]
+    # Requests of a batch that failed as a whole have no result line.
+    stats["exceptions"] += max(0, manifest["selection"]["submitted"] - stats["submitted"])
+    stats["submitted"] = manifest["selection"]["submitted"]
+    return stats
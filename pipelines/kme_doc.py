@@ -3,7 +3,7 @@ from contentcreatie.llm_client.document import (
 )
 from dataclasses import dataclass
 
-@dataclass
+@dataclass(slots=True)
 class KMEDocument(Document):
     """A document that combines its title and content for embedding."""
     
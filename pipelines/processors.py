@@ -1,5 +1,6 @@
+import asyncio
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import Optional, Tuple, List, Dict, Any
+from typing import Iterable, Optional, Tuple, List, Dict, Any
 from tqdm import tqdm
 import pandas as pd
 import tqdm
@@ -20,25 +21,21 @@ def check_for_new_content(kme_documents: pd.DataFrame, doc_store: DocumentStore)
     return [row for row in kme_documents.itertuples() if not doc_store.contains(row.km_nummer)]
 
 
-def add_new_documents_to_docstore(
-    kme_documents: pd.DataFrame,
-    doc_store: DocumentStore,
-    kme_table: Optional[pd.DataFrame] = None,
-) -> Tuple[int, List[str]]:
+def kme_rows_to_documents(
+    rows: Iterable[Any],
+    kme_table: pd.DataFrame,
+) -> Tuple[List[Document], List[str]]:
     """
-    Zet nieuwe KME-rows om naar Document en voeg ze toe aan doc_store.
-    Retourneert (aantal_toegevoegd, ontbrekende_kme_ids)
+    Zet KME-rows om naar KMEDocuments.
+    Retourneert (documenten, kme_ids_zonder_vertaling)
     """
-    table = kme_table if kme_table is not None else KME_TABLE
-    new_rows = check_for_new_content(kme_documents, doc_store) 
-
     docs: List[Document] = []
     missing: List[str] = []
 
-    for row in tqdm.tqdm(new_rows):
+    for row in tqdm.tqdm(rows):
         km_id = row.km_nummer
-        if km_id in table.index:
-            tax = table.loc[km_id]
+        if km_id in kme_table.index:
+            tax = kme_table.loc[km_id]
             metadata = {
                 "filename": row.source_file,
                 "id": row.id,
@@ -54,11 +51,129 @@ def add_new_documents_to_docstore(
             docs.append(KMEDocument(km_id, row.title, row.full_text, metadata))
         else:
             missing.append(km_id)
+    return docs, missing
+
+
+def add_new_documents_to_docstore(
+    kme_documents: pd.DataFrame,
+    doc_store: DocumentStore,
+    kme_table: Optional[pd.DataFrame] = None,
+    remove_missing: bool = False,
+) -> Tuple[Dict[str, List[str]], List[str]]:
+    """
+    Vergelijkt een volledige KME-export met doc_store op content hash (zie DocumentStore.classify_changes)
+    en verwerkt alleen de verschillen. Nieuwe en gewijzigde documenten worden (opnieuw) toegevoegd;
+    gewijzigde documenten verliezen daarbij hun samenvatting, zodat summarize_new_documents en
+    VectorStore.sync_with_store alleen die documenten opnieuw verwerken. Ongewijzigde documenten
+    blijven ongemoeid.
+    Retourneert (kme_ids per klasse "new"/"changed"/"unchanged"/"removed", ontbrekende_kme_ids)
+
+    :param remove_missing: bool, Verwijder documenten die niet meer in de export staan, defaults to False
+    """
+    table = kme_table if kme_table is not None else KME_TABLE
+    docs, missing = kme_rows_to_documents(kme_documents.itertuples(), table)
+
+    changes = doc_store.classify_changes(docs)
+    # Zonder vertaling kunnen we niet vergelijken; dat betekent niet dat het artikel verdwenen is.
+    missing_ids = set(missing)
+    changes["removed"] = [doc_id for doc_id in changes["removed"] if doc_id not in missing_ids]
+
+    to_add = set(changes["new"]) | set(changes["changed"])
+    if to_add:
+        doc_store.add([doc for doc in docs if doc.id in to_add])
+    if remove_missing and changes["removed"]:
+        doc_store.remove(changes["removed"])
+
+    logger.info(
+        f"KME-export: {len(changes['new'])} nieuw, {len(changes['changed'])} gewijzigd, "
+        f"{len(changes['unchanged'])} ongewijzigd, {len(changes['removed'])} verdwenen, {len(missing)} zonder vertaling"
+    )
+    return changes, missing
+
+
+def _documents_to_summarize(doc_store: DocumentStore, start: int, count: Optional[int]) -> Tuple[List[Tuple[str, Document]], Dict[str, int]]:
+    """Selects the documents in the slice [start, start + count) that lack a 'summary', with the initial statistics."""
+    items = list(doc_store.documents.items())
+    end = None if count is None else start + max(0, count)
+    items_slice = items[start:end]
+
+    # Filter documents that haven't been summarized yet
+    todo = []
+    for doc_id, doc in items_slice:
+        if not doc.metadata or "summary" not in doc.metadata:
+            todo.append((doc_id, doc))
+    
+    stats = {
+        "submitted": len(todo),
+        "added": 0,
+        "skipped_existing": len(items_slice) - len(todo),
+        "validation_errors": 0,
+        "key_errors": 0,
+        "exceptions": 0,
+    }
+    return todo, stats
+
 
-    if docs:
-        doc_store.add(docs)
+def _summary_prompt(prompt_builder: PromptBuilder, doc: Document) -> List[Dict[str, Any]]:
+    """Builds the summarization prompt of a document."""
+    md = doc.metadata or {}
+    return prompt_builder.create_prompt(
+        document=doc.content,
+        question=md.get("VRAAG"),
+        taxonomy_path=[
+            md.get("BELASTINGSOORT"),
+            md.get("PROCES_ONDERWERP"),
+            md.get("PRODUCT_SUBONDERWERP"),
+        ],
+    )
 
-    return len(docs), missing
+
+def _store_summary(doc_store: DocumentStore, prompt_builder: PromptBuilder, doc_id: str, doc: Document, out: Any) -> Tuple[str, str, Any]:
+    """
+    Validates the LLM output for a document and stores the summarized document.
+
+    Returns a tuple: (doc_id, status, result)
+    Status: "success", "validation_error", "key_error"
+    Result: KMEDocument on success, raw LLM output on failure.
+    """
+    # 1. Check JSON validation
+    if hasattr(prompt_builder, "verify_json") and callable(prompt_builder.verify_json):
+        if not prompt_builder.verify_json(out):
+            logger.warning(
+                f"Validation error for doc {doc_id}. LLM output: {str(out)[:200]}..."
+            )
+            return (doc_id, "validation_error", out)
+
+    # 2. Check for type and 'content' key
+    if not isinstance(out, dict) or "content" not in out:
+        logger.warning(
+            f"Key/Type error for doc {doc_id}. 'content' key missing or 'out' is not a dict. LLM output: {str(out)[:200]}..."
+        )
+        return (doc_id, "key_error", out)
+
+    # Success: create the updated document
+    updated_metadata = {
+        **(doc.metadata or {}), 
+        "summary": out["content"], 
+        "tags": out.get("metadata", {}).get("Tags",{})
+    }
+    
+    updated_doc = KMEDocument(
+        id=doc.id,
+        title=doc.title,
+        content=doc.content,
+        metadata=updated_metadata
+    )
+    doc_store.add([updated_doc], save=False)
+    logger.info(f"Finished processing {doc_id}")
+    return (doc_id, "success", updated_doc)
+
+
+_STATUS_STATS = {
+    "validation_error": "validation_errors",
+    "key_error": "key_errors",
+    "exception": "exceptions",
+}
 
 
 def summarize_new_documents(
@@ -71,12 +186,14 @@ def summarize_new_documents(
     count: Optional[int] = None,
     reasoning_effort: str = "low",
     show_progress: bool = True,
+    save_every: Optional[int] = 50,
 ) -> Dict[str, int]:
     """
     Summarizes documents that lack a 'summary' in their metadata using a threaded executor.
     
     This version includes robust logging and detailed error reporting to track
     validation failures, key errors, and exceptions during processing.
+    See `asummarize_new_documents` for the variant that runs on a single event loop.
 
     :param doc_store: DocumentStore, The document store containing KMEDocuments.
     :param prompt_builder: PromptBuilder, Used to create prompts for the LLM.
@@ -86,27 +203,11 @@ def summarize_new_documents(
     :param count: Optional[int], The maximum number of documents to process, defaults to None
     :param reasoning_effort: str, The reasoning effort for the LLM, defaults to "low"
     :param show_progress: bool, Whether to display a tqdm progress bar, defaults to True
+    :param save_every: Optional[int], Persist the summaries as a delta after this many successes, defaults to 50.
+                       None disables intermediate saves.
     :return: Dict[str, int], A dictionary with detailed statistics of the run.
     """
-    items = list(doc_store.documents.items())
-    end = None if count is None else start + max(0, count)
-    items_slice = items[start:end]
-
-    # Filter documents that haven't been summarized yet
-    todo = []
-    for doc_id, doc in items_slice:
-        if not doc.metadata or "summary" not in doc.metadata:
-            todo.append((doc_id, doc))
-    
-    stats = {
-        "submitted": len(todo),
-        "added": 0,
-        "skipped_existing": len(items_slice) - len(todo),
-        "validation_errors": 0,
-        "key_errors": 0,
-        "exceptions": 0,
-    }
-
+    todo, stats = _documents_to_summarize(doc_store, start, count)
     if not todo:
         return stats
 
@@ -119,51 +220,8 @@ def summarize_new_documents(
         Result: KMEDocument on success, raw LLM output or Exception on failure.
         """
         try:
-            md = doc.metadata or {}
-            prompt = prompt_builder.create_prompt(
-                document=doc.content,
-                question=md.get("VRAAG"),
-                taxonomy_path=[
-                    md.get("BELASTINGSOORT"),
-                    md.get("PROCES_ONDERWERP"),
-                    md.get("PRODUCT_SUBONDERWERP"),
-                ],
-            )
-            res = llm.process(prompt, reasoning_effort=reasoning_effort)
-            out = res.content
-
-            # 1. Check JSON validation
-            if hasattr(prompt_builder, "verify_json") and callable(prompt_builder.verify_json):
-                if not prompt_builder.verify_json(out):
-                    logger.warning(
-                        f"Validation error for doc {doc_id}. LLM output: {str(out)[:200]}..."
-                    )
-                    return (doc_id, "validation_error", out)
-
-            # 2. Check for type and 'content' key
-            if not isinstance(out, dict) or "content" not in out:
-                logger.warning(
-                    f"Key/Type error for doc {doc_id}. 'content' key missing or 'out' is not a dict. LLM output: {str(out)[:200]}..."
-                )
-                return (doc_id, "key_error", out)
-
-            # Success: create the updated document
-            updated_metadata = {
-                **md, 
-                "summary": out["content"], 
-                "tags": out.get("metadata", {}).get("Tags",{})
-            }
-            
-            updated_doc = KMEDocument(
-                id=doc.id,
-                title=doc.title,
-                content=doc.content,
-                metadata=updated_metadata
-            )
-            doc_store.add([updated_doc],save=False,update_index=False) 
-            logger.info(f"Finished processing {doc_id}")
-            return (doc_id, "success", updated_doc)
-
+            res = llm.process(_summary_prompt(prompt_builder, doc), reasoning_effort=reasoning_effort)
+            return _store_summary(doc_store, prompt_builder, doc_id, doc, res.content)
         except Exception as e:
             logger.error(f"Exception processing doc {doc_id}: {e}", exc_info=True)
             return (doc_id, "exception", e)
@@ -182,12 +240,10 @@ def summarize_new_documents(
                 
                 if status == "success":
                     stats["added"] += 1
-                elif status == "validation_error":
-                    stats["validation_errors"] += 1
-                elif status == "key_error":
-                    stats["key_errors"] += 1
-                elif status == "exception":
-                    stats["exceptions"] += 1
+                    if save_every and stats["added"] % save_every == 0:
+                        doc_store.save()
+                else:
+                    stats[_STATUS_STATS[status]] += 1
             
             except Exception as e:
                 # This catches a critical failure in the future itself
@@ -195,4 +251,75 @@ def summarize_new_documents(
                 logger.critical(f"A future failed unexpectedly for doc {doc_id}: {e}", exc_info=True)
                 stats["exceptions"] += 1 
 
-    return stats
\ No newline at end of file
+    if save_every and stats["added"]:
+        doc_store.save()
+
+    return stats
+
+
+async def asummarize_new_documents(
+    *,
+    doc_store: DocumentStore,
+    prompt_builder: PromptBuilder,
+    llm: LLMProcessor,
+    start: int = 0,
+    count: Optional[int] = None,
+    reasoning_effort: str = "low",
+    show_progress: bool = True,
+    save_every: Optional[int] = 50,
+    timeout: Optional[float] = None,
+) -> Dict[str, int]:
+    """
+    Async variant of `summarize_new_documents`: all requests are issued from the running
+    event loop with `llm.aprocess`, so the number in flight is bounded by `llm.max_concurrency`
+    instead of a thread pool. Saves run on a worker thread so the loop keeps sending requests.
+    Use `await` in a notebook, or `asyncio.run(...)` from a script.
+
+    :param doc_store: DocumentStore, The document store containing KMEDocuments.
+    :param prompt_builder: PromptBuilder, Used to create prompts for the LLM.
+    :param llm: LLMProcessor, The LLM processing unit.
+    :param start: int, The starting index of documents to process, defaults to 0
+    :param count: Optional[int], The maximum number of documents to process, defaults to None
+    :param reasoning_effort: str, The reasoning effort for the LLM, defaults to "low"
+    :param show_progress: bool, Whether to display a tqdm progress bar, defaults to True
+    :param save_every: Optional[int], Persist the summaries as a delta after this many successes, defaults to 50.
+                       None disables intermediate saves.
+    :param timeout: Optional[float], Seconds per request before it is cancelled and counted as an exception,
+                    defaults to `llm.request_timeout`
+    :return: Dict[str, int], A dictionary with detailed statistics of the run.
+    """
+    todo, stats = _documents_to_summarize(doc_store, start, count)
+    if not todo:
+        return stats
+
+    async def _one(doc_id: str, doc: KMEDocument) -> Tuple[str, str, Any]:
+        try:
+            res = await llm.aprocess(_summary_prompt(prompt_builder, doc), reasoning_effort=reasoning_effort, timeout=timeout)
+            return _store_summary(doc_store, prompt_builder, doc_id, doc, res.content)
+        except Exception as e:
+            logger.error(f"Exception processing doc {doc_id}: {e!r}", exc_info=True)
+            return (doc_id, "exception", e)
+
+    tasks = [asyncio.create_task(_one(doc_id, doc)) for doc_id, doc in todo]
+    iterator = asyncio.as_completed(tasks)
+    if show_progress:
+        iterator = tqdm.tqdm(iterator, total=len(tasks), desc="Summarizing")
+
+    try:
+        for next_done in iterator:
+            doc_id, status, data = await next_done
+            if status == "success":
+                stats["added"] += 1
+                if save_every and stats["added"] % save_every == 0:
+                    await asyncio.to_thread(doc_store.save)
+            else:
+                stats[_STATUS_STATS[status]] += 1
+    finally:
+        # Cancelled (e.g. KeyboardInterrupt in a notebook): stop the requests still waiting or in flight.
+        for task in tasks:
+            task.cancel()
+
+    if save_every and stats["added"]:
+        await asyncio.to_thread(doc_store.save)
+
+    return stats
@@ -19,7 +19,8 @@ llm = llm_client.LLMProcessor(
 )
 embed = llm_client.EmbeddingProcessor(
     embedding_model='text-embedding-3-large',
-    client_config=embed_client_config
+    client_config=embed_client_config,
+    native_dimension=settings.get_embedding_dimension('text-embedding-3-large')
 )
 doc_store = DocumentStore(
     "kme_content",
@@ -12,6 +12,7 @@ from typing import Any, Dict, List, Optional
 from bs4 import BeautifulSoup
 from contentcreatie.config.settings import Settings
 from contentcreatie.config.paths import paths
+from contentcreatie.llm_client.compression import full_text, strip_html
 
 settings = Settings()
 
@@ -38,22 +39,6 @@ def extract_content_links(html_text: str) -> List[Dict[str, str]]:
     return out
 
 
-def strip_html(html_text: Optional[str]) -> str:
-    """Strip HTML tags from text and convert to plain text.
-
-    :param html_text: Optional[str], HTML text to strip.
-    :return: str, Plain text with HTML tags removed.
-    """
-    if not html_text:
-        return ""
-    
-    # quick & decent: remove tags; preserve <br> as newline first
-    t = html_text.replace("<br>", "\n").replace("<br/>", "\n").replace("<br />", "\n")
-    t = re.sub(r"<\/p\s*>", "\n", t, flags=re.I)
-    t = re.sub(r"<[^>]+>", "", t)
-    return html.unescape(re.sub(r"\n{3,}", "\n\n", t)).strip()
-
-
 def extract_html(filename: str, html_content: str) -> Dict[str, Any]:
     """Extract content from an HTML document.
 
@@ -120,7 +105,7 @@ def extract_html(filename: str, html_content: str) -> Dict[str, Any]:
         "publicAnswer_html": public_html,
         "publicAnswer_text": public_text,
         "links_in_private_answer": extract_content_links(private_html or ""),
-        'full_text': "Public Answer: " + public_text + ' Private Answer: ' + private_text,
+        'full_text': full_text(public_text, private_text),
         "tags": tags_list
     }
     